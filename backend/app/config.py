@@ -33,6 +33,96 @@ class Settings(BaseSettings):
     
     # OpenAI默认设置
     default_model: str = "gpt-3.5-turbo"
+
+    # LLM 连接池设置（所有请求共享同一组 HTTP 连接）
+    llm_max_connections: int = 100  # 单个客户端最大连接数
+    llm_max_keepalive_connections: int = 40  # 保持空闲的长连接数量
+    llm_keepalive_expiry: float = 120.0  # 空闲长连接保留时间（秒）
+    llm_connect_timeout: float = 10.0  # 建立连接超时（秒）
+    llm_read_timeout: float = 600.0  # 流式读取超时（秒）
+    llm_prewarm_connections: int = 4  # 保存配置后预热的连接数，0 表示不预热
+    llm_max_cached_clients: int = 8  # 最多缓存的客户端数量（按 api_key + base_url 区分）
+
+    # LLM 调度设置（按服务商 base_url 分别限流）
+    llm_rpm_limit: int = 0  # 每分钟请求数上限，0 表示不限制
+    llm_tpm_limit: int = 0  # 每分钟 token 数上限，0 表示不限制
+    llm_max_concurrency: int = 16  # 同一服务商的最大并发请求数，0 表示不限制
+    llm_expected_completion_tokens: int = 1500  # 预占 TPM 时估算的输出 token 数
+    llm_priority_aging_seconds: float = 20.0  # 排队每满该秒数提升一级优先级，避免批量请求被持续的高优先级请求饿死；0 表示严格按优先级
+
+    # 多端点路由与熔断设置（端点列表保存在用户配置的 endpoints 中）
+    llm_breaker_failure_threshold: int = 3  # 连续失败多少次后熔断
+    llm_breaker_cooldown: float = 30.0  # 熔断后多少秒再放行试探请求
+    llm_router_ewma_alpha: float = 0.3  # 延迟与错误率滑动平均的平滑系数
+    llm_router_error_penalty: float = 4.0  # 错误率对路由得分的惩罚系数
+
+    # 端点能力探测（json_schema 严格结构化输出 / json_object / 流式输出），每个端点 + 模型在后台探测一次
+    llm_capability_probe_enabled: bool = True  # 关闭后不探测，json_schema 请求一律降级为 json_object
+    llm_capability_probe_timeout: float = 20.0  # 单个探测请求的超时（秒）
+    llm_capability_retry_interval: float = 60.0  # 探测结果不完整（网络错误、限流等）时首次重新探测的间隔（秒），之后每次翻倍
+    llm_capability_retry_max_interval: float = 3600.0  # 重新探测间隔的上限（秒）
+
+    # LLM 流式请求重试与续写设置（429 / 5xx / 网络错误）
+    llm_retry_max_attempts: int = 4  # 尚未输出内容时的最大重试次数（含故障转移）
+    llm_retry_base_delay: float = 1.0  # 指数退避的基础等待时间（秒）
+    llm_retry_max_delay: float = 30.0  # 指数退避的最大等待时间（秒）
+    llm_retry_after_max: float = 120.0  # 遵循 Retry-After 时的最长等待时间（秒）
+    llm_resume_max_attempts: int = 2  # 流在中途断开时最多续写的次数
+    llm_length_continuation_max: int = 3  # 正文因长度上限被截断（finish_reason=length）时最多自动续写的次数，0 表示不续写
+
+    # LLM 响应缓存设置（相同输入直接回放历史结果）
+    llm_cache_enabled: bool = True
+    llm_cache_path: str = ""  # 缓存数据库路径，留空则存放在用户配置目录
+    llm_cache_max_bytes: int = 200 * 1024 * 1024  # 缓存总大小上限，超出后按 LRU 淘汰
+    # 默认只缓存结构化的阶段；分析、目录、正文等非确定性的文本阶段重新生成时应得到新结果，
+    # 需要时通过环境变量加入，如 LLM_CACHE_STAGES='["expand_outline","analysis","chapter_content"]'，
+    # 或由请求传 use_cache=true 显式开启（见 benchmarks/README.md）
+    llm_cache_stages: list = [  # 默认启用缓存的生成阶段
+        "expand_outline",
+    ]
+
+    # LLM 流量录制与回放（用于离线、可复现的性能回归测试）
+    llm_cassette_mode: str = "off"  # off / record（录制真实调用）/ replay（只回放，不访问网络）
+    llm_cassette_path: str = ""  # cassette 文件路径，留空则存放在用户配置目录
+    llm_cassette_timing: str = "original"  # 回放节奏：original 原始节奏 / compressed 按倍速压缩 / none 不等待
+    llm_cassette_speed: float = 10.0  # compressed 模式的加速倍数
+
+    # 目录 JSON 生成的对冲请求设置（用 token 换尾延迟）
+    outline_hedge_enabled: bool = False
+    outline_hedge_percentile: float = 90.0  # 首个候选耗时超过历史成功耗时的该百分位时发起对冲
+    outline_hedge_min_samples: int = 5  # 历史样本不足时使用 outline_hedge_default_delay
+    outline_hedge_default_delay: float = 60.0  # 默认对冲等待时间（秒）
+    outline_hedge_max_extra: int = 1  # 每次调用最多额外发起的对冲候选数
+
+    # LLM 调用遥测设置（逐次记录到本地追加写日志）
+    llm_telemetry_enabled: bool = True
+    llm_telemetry_path: str = ""  # 日志路径，留空则存放在用户配置目录
+    llm_telemetry_max_bytes: int = 50 * 1024 * 1024  # 单个日志文件上限，超出后轮转为 .1
+    llm_telemetry_flush_interval: float = 1.0  # 缓冲中的记录多久批量写入一次（秒）
+    llm_telemetry_query_max_bytes: int = 16 * 1024 * 1024  # 聚合查询最多从日志末尾读取的字节数
+    llm_stream_include_usage: bool = True  # 流式请求附带 stream_options.include_usage 以获取真实用量（端点以 4xx 拒绝时自动去掉该参数重试）
+
+    # 章节流式输出 v2 协议：只发送增量，按时间窗口或字节数把分片合并成帧
+    sse_coalesce_window: float = 0.05  # 合并分片的时间窗口（秒），0 表示每个分片单独发送
+    sse_coalesce_max_bytes: int = 2048  # 一帧累计达到该字节数时立即发送
+    sse_heartbeat_interval: float = 15.0  # SSE 连接空闲超过该时间（秒）时发送心跳注释，0 表示不发送
+
+    # 可续传 SSE 流（断线后按 Last-Event-ID 补发事件）
+    stream_buffer_events: int = 4096  # 每个流的环形缓冲区最多保留的事件数
+    stream_buffer_ttl: float = 300.0  # 生成结束后缓冲区保留的时间（秒）
+    stream_buffer_max_bytes: int = 64 * 1024 * 1024  # 所有流的缓冲区总大小上限
+    stream_buffer_stream_bytes: int = 8 * 1024 * 1024  # 单个流的缓冲区大小上限
+    stream_slow_consumer_lag: int = 32  # 订阅者积压的事件数达到该值时视为慢速客户端，积压的文本事件合并后发送
+    stream_detach_grace: float = 3.0  # 客户端全部断开后等待重连的时间（秒），超时才取消生成；0 表示立即取消
+    idempotency_result_ttl: float = 60.0  # 生成结束后，相同 Idempotency-Key 的请求直接取回结果的时间（秒）；内容相同但没有幂等键的请求只共享进行中的生成
+
+    # 多章节批量流式生成（一个连接内复用多个章节）
+    content_batch_concurrency: int = 5  # 每个批次同时生成的章节数（请求未指定时）
+    content_batch_max_concurrency: int = 16  # 请求可指定的并发上限
+
+    # 提示词布局：classic 为原有布局；prefix_cache 把各次调用共享的说明、概述和评分要求放在最前面，
+    # 每次调用不同的部分放在最后，以便命中服务商的前缀缓存
+    prompt_layout: str = "classic"
     
     class Config:
         env_file = ".env"
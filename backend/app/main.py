@@ -8,7 +8,10 @@ import fastapi.middleware.cors
 import starlette.middleware.cors
 
 from .config import settings
-from .routers import config, document, outline, content, search, expand
+from .routers import config, document, outline, content, search, expand, metrics
+from .services.llm_client_registry import client_registry
+from .services.llm_telemetry import llm_telemetry
+from .utils.request_context import RequestContextMiddleware
 
 # 创建FastAPI应用实例
 app = FastAPI(
@@ -26,6 +29,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 记录当前请求路由，供LLM调用遥测使用
+app.add_middleware(RequestContextMiddleware)
+
 # 注册路由
 app.include_router(config.router)
 app.include_router(document.router)
@@ -33,6 +39,19 @@ app.include_router(outline.router)
 app.include_router(content.router)
 app.include_router(search.router)
 app.include_router(expand.router)
+app.include_router(metrics.router)
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    """关闭共享的LLM客户端连接池"""
+    await client_registry.close_all()
+
+
+@app.on_event("shutdown")
+def flush_llm_telemetry():
+    """写入遥测缓冲中剩余的记录"""
+    llm_telemetry.flush()
+
 
 # 健康检查端点
 @app.get("/health")
@@ -4,6 +4,18 @@ from typing import List, Optional, Dict, Any
 from enum import Enum
 
 
+class EndpointConfig(BaseModel):
+    """OpenAI兼容端点配置（用于多端点故障转移）"""
+    model_config = {"protected_namespaces": ()}
+
+    name: Optional[str] = Field(None, description="端点名称")
+    base_url: str = Field(..., description="Base URL")
+    api_key: Optional[str] = Field(None, description="API密钥，留空则使用主配置")
+    model_name: Optional[str] = Field(None, description="模型名称，留空则使用主配置")
+    weight: float = Field(1.0, gt=0, description="路由权重，越大分配的请求越多")
+    enabled: bool = Field(True, description="是否启用")
+
+
 class ConfigRequest(BaseModel):
     """OpenAI配置请求"""
     model_config = {"protected_namespaces": ()}
@@ -11,6 +23,8 @@ class ConfigRequest(BaseModel):
     api_key: str = Field(..., description="OpenAI API密钥")
     base_url: Optional[str] = Field(None, description="Base URL")
     model_name: str = Field("gpt-3.5-turbo", description="模型名称")
+    endpoints: Optional[List[EndpointConfig]] = Field(None, description="额外的端点列表，不传则保留已保存的端点")
+    stage_models: Optional[Dict[str, str]] = Field(None, description="各生成阶段（LLMStage）使用的模型，未指定的阶段使用主模型；不传则保留已保存的设置")
 
 
 class ConfigResponse(BaseModel):
@@ -40,10 +54,28 @@ class AnalysisType(str, Enum):
     REQUIREMENTS = "requirements"
 
 
+class LLMStage(str, Enum):
+    """LLM 调用所属的生成阶段"""
+    ANALYSIS = "analysis"
+    OUTLINE_L1 = "outline_l1"
+    OUTLINE_DETAIL = "outline_detail"
+    CHAPTER_CONTENT = "chapter_content"
+    EXPAND_OUTLINE = "expand_outline"
+    DEFAULT = "default"
+
+
+class GenerationPriority(str, Enum):
+    """生成请求优先级"""
+    INTERACTIVE = "interactive"
+    NORMAL = "normal"
+    BULK = "bulk"
+
+
 class AnalysisRequest(BaseModel):
     """文档分析请求"""
     file_content: str = Field(..., description="文档内容")
     analysis_type: AnalysisType = Field(..., description="分析类型")
+    use_cache: Optional[bool] = Field(None, description="是否使用LLM响应缓存，留空按服务端配置")
 
 
 class OutlineItem(BaseModel):
@@ -71,6 +103,7 @@ class OutlineRequest(BaseModel):
     uploaded_expand: Optional[bool] = Field(False, description="是否已上传方案扩写文件")
     old_outline: Optional[str] = Field(None, description="上传的方案扩写文件解析出的旧目录JSON")
     old_document: Optional[str] = Field(None, description="上传的方案扩写文件解析出的旧文档")
+    use_cache: Optional[bool] = Field(None, description="是否使用LLM响应缓存，留空按服务端配置")
 
 class ContentGenerationRequest(BaseModel):
     """内容生成请求"""
@@ -84,6 +117,20 @@ class ChapterContentRequest(BaseModel):
     parent_chapters: Optional[List[Dict[str, Any]]] = Field(None, description="上级章节列表")
     sibling_chapters: Optional[List[Dict[str, Any]]] = Field(None, description="同级章节列表")
     project_overview: str = Field("", description="项目概述")
+    priority: Optional[GenerationPriority] = Field(None, description="调度优先级，单章节重新生成使用interactive，批量生成使用bulk")
+    use_cache: Optional[bool] = Field(None, description="是否使用LLM响应缓存，留空按服务端配置")
+    stream_protocol: int = Field(1, ge=1, le=2, description="流式协议版本：1 为旧协议，每个事件都附带完整内容；2 只发送合并后的增量，完整内容只在结束事件中发送，需客户端显式选择")
+
+
+class ChapterBatchRequest(BaseModel):
+    """多章节批量流式生成请求，所有章节通过同一个 SSE 连接返回"""
+    chapters: List[ChapterContentRequest] = Field(..., description="章节请求列表，按 chapter.id 区分，事件中以 chapter_id 标记")
+    concurrency: Optional[int] = Field(None, ge=1, description="同时生成的章节数，留空按服务端配置")
+
+
+class ChapterBatchAddRequest(BaseModel):
+    """向进行中的批次追加章节"""
+    chapters: List[ChapterContentRequest] = Field(..., description="追加的章节请求列表")
 
 
 class ErrorResponse(BaseModel):
@@ -1,7 +1,9 @@
 """配置相关API路由"""
 from fastapi import APIRouter, HTTPException
-from ..models.schemas import ConfigRequest, ConfigResponse, ModelListResponse
+from ..models.schemas import ConfigRequest, ConfigResponse, ModelListResponse, LLMStage
 from ..services.openai_service import OpenAIService
+from ..services.llm_client_registry import client_registry
+from ..services.llm_capabilities import capability_registry
 from ..utils.config_manager import config_manager
 
 router = APIRouter(prefix="/api/config", tags=["配置管理"])
@@ -10,14 +12,31 @@ router = APIRouter(prefix="/api/config", tags=["配置管理"])
 @router.post("/save", response_model=ConfigResponse)
 async def save_config(config: ConfigRequest):
     """保存OpenAI配置"""
+    if config.stage_models:
+        valid_stages = {stage.value for stage in LLMStage}
+        unknown = [stage for stage in config.stage_models if stage not in valid_stages]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知的生成阶段: {', '.join(unknown)}")
+
     try:
         success = config_manager.save_config(
             api_key=config.api_key,
             base_url=config.base_url or "",
-            model_name=config.model_name
+            model_name=config.model_name,
+            endpoints=[endpoint.model_dump() for endpoint in config.endpoints] if config.endpoints is not None else None,
+            stage_models=config.stage_models
         )
         
         if success:
+            # 后台预热各端点对应的连接池，后续生成请求直接复用
+            # 同时在后台探测各端点支持的结构化输出与流式能力
+            for endpoint in config_manager.get_endpoints():
+                client_registry.prewarm_in_background(endpoint['api_key'], endpoint['base_url'])
+                capability_registry.probe_in_background(
+                    client_registry.get_client(endpoint['api_key'], endpoint['base_url']),
+                    endpoint['base_url'],
+                    endpoint['model_name'],
+                )
             return ConfigResponse(success=True, message="配置保存成功")
         else:
             return ConfigResponse(success=False, message="配置保存失败")
@@ -1,10 +1,16 @@
 """内容相关API路由"""
-from fastapi import APIRouter, HTTPException
-from ..models.schemas import ContentGenerationRequest, ChapterContentRequest
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Request
+from ..models.schemas import (
+    ContentGenerationRequest, ChapterContentRequest, GenerationPriority,
+    ChapterBatchRequest, ChapterBatchAddRequest,
+)
 from ..services.openai_service import OpenAIService
+from ..services.sse_session import resumable_sse_response
+from ..services.chapter_batch import chapter_batches
 from ..utils.config_manager import config_manager
-from ..utils.sse import sse_response
-import json
+from ..utils.sse import format_sse, coalesce_chunks, sse_status, sse_done
+from ..config import settings
 
 router = APIRouter(prefix="/api/content", tags=["内容管理"])
 
@@ -24,23 +30,100 @@ async def generate_chapter_content(request: ChapterContentRequest):
         
         # 生成单章节内容
         content = ""
+        result_meta = {}
         async for chunk in openai_service._generate_chapter_content(
             chapter=request.chapter,
             parent_chapters=request.parent_chapters,
             sibling_chapters=request.sibling_chapters,
-            project_overview=request.project_overview
+            project_overview=request.project_overview,
+            priority=request.priority or GenerationPriority.INTERACTIVE,
+            use_cache=request.use_cache,
+            result_meta=result_meta
         ):
             content += chunk
         
-        return {"success": True, "content": content}
+        # truncated 为 True 表示自动续写次数用完后内容仍被长度上限截断
+        return {"success": True, "content": content, "truncated": bool(result_meta.get('truncated'))}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"章节内容生成失败: {str(e)}")
 
 
+async def chapter_stream_payloads(
+    chunks: AsyncIterator[str],
+    protocol: int = 2,
+    result_meta: Optional[Dict[str, Any]] = None,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    把章节正文的文本流转换为事件数据
+
+    协议 2：started → 若干 delta（按时间窗口/字节数合并的增量）→ completed（唯一一次携带完整内容）；
+    协议 1（旧协议）：每个分片一个 streaming 事件，同时附带 content 和 full_content。
+    所有事件都带协议版本号 v；出错时以 error 事件结束。
+    """
+    try:
+        # 发送开始信号
+        yield {'v': protocol, 'status': 'started', 'message': '开始生成章节内容...'}
+
+        if protocol == 1:
+            full_content = ""
+            async for chunk in chunks:
+                full_content += chunk
+                # 实时发送内容片段
+                yield {'v': 1, 'status': 'streaming', 'content': chunk, 'full_content': full_content}
+        else:
+            parts: List[str] = []
+            async for delta in coalesce_chunks(chunks, settings.sse_coalesce_window, settings.sse_coalesce_max_bytes):
+                parts.append(delta)
+                yield {'v': 2, 'status': 'delta', 'delta': delta}
+            full_content = "".join(parts)
+
+        # 发送完成信号
+        truncated = bool((result_meta or {}).get('truncated'))
+        yield {'v': protocol, 'status': 'completed', 'content': full_content, 'truncated': truncated}
+
+    except Exception as e:
+        # 发送错误信息
+        yield {'v': protocol, 'status': 'error', 'error': True, 'message': str(e)}
+
+
+async def chapter_stream_events(
+    chunks: AsyncIterator[str],
+    protocol: int = 2,
+    result_meta: Optional[Dict[str, Any]] = None,
+) -> AsyncGenerator[str, None]:
+    """把章节正文的文本流编码为 SSE 事件（事件内容见 chapter_stream_payloads），最后以 [DONE] 结束"""
+    async for payload in chapter_stream_payloads(chunks, protocol, result_meta):
+        yield format_sse(payload)
+
+    # 发送结束信号
+    yield sse_done()
+
+
+def _run_batch_chapter(request: ChapterContentRequest) -> AsyncGenerator[Dict[str, Any], None]:
+    """批次中单个章节的事件流，未指定优先级时按批量生成调度"""
+    openai_service = OpenAIService()
+    result_meta: Dict[str, Any] = {}
+    chunks = openai_service._generate_chapter_content(
+        chapter=request.chapter,
+        parent_chapters=request.parent_chapters,
+        sibling_chapters=request.sibling_chapters,
+        project_overview=request.project_overview,
+        priority=request.priority or GenerationPriority.BULK,
+        use_cache=request.use_cache,
+        result_meta=result_meta
+    )
+    return chapter_stream_payloads(chunks, request.stream_protocol, result_meta)
+
+
 @router.post("/generate-chapter-stream")
-async def generate_chapter_content_stream(request: ChapterContentRequest):
-    """流式为单个章节生成内容"""
+async def generate_chapter_content_stream(request: ChapterContentRequest, http_request: Request):
+    """
+    流式为单个章节生成内容（stream_protocol 选择协议版本，见 chapter_stream_events）
+
+    断线后带上 Last-Event-ID 重新请求即可从断点继续接收，不会重新生成；
+    内容相同（或 Idempotency-Key 相同）的请求共享进行中的同一次生成，Idempotency-Key 相同时结束后短时间内直接取回结果。
+    """
     try:
         # 加载配置
         config = config_manager.load_config()
@@ -48,37 +131,82 @@ async def generate_chapter_content_stream(request: ChapterContentRequest):
         if not config.get('api_key'):
             raise HTTPException(status_code=400, detail="请先配置OpenAI API密钥")
 
-        # 创建OpenAI服务实例
-        openai_service = OpenAIService()
+        def generate():
+            # 创建OpenAI服务实例
+            openai_service = OpenAIService()
+            result_meta: Dict[str, Any] = {}
+            chunks = openai_service._generate_chapter_content(
+                chapter=request.chapter,
+                parent_chapters=request.parent_chapters,
+                sibling_chapters=request.sibling_chapters,
+                project_overview=request.project_overview,
+                priority=request.priority or GenerationPriority.INTERACTIVE,
+                use_cache=request.use_cache,
+                result_meta=result_meta
+            )
+            return chapter_stream_events(chunks, request.stream_protocol, result_meta)
+
+        return resumable_sse_response(http_request, generate, request.model_dump())
         
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"章节内容生成失败: {str(e)}")
+
+
+@router.post("/generate-chapters-stream")
+async def generate_chapters_stream(request: ChapterBatchRequest, http_request: Request):
+    """
+    在一个 SSE 连接中流式生成多个章节
+
+    事件与单章节接口相同，另外带有 chapter_id；首个事件 batch_started 返回 batch_id，
+    可通过 /batches/{batch_id}/chapters 追加或取消章节，全部章节结束后发送 batch_completed。
+    同样支持 Last-Event-ID 断点续传。
+    """
+    try:
+        # 加载配置
+        config = config_manager.load_config()
+
+        if not config.get('api_key'):
+            raise HTTPException(status_code=400, detail="请先配置OpenAI API密钥")
+
         async def generate():
+            batch = chapter_batches.create(_run_batch_chapter, request.chapters, request.concurrency)
             try:
-                # 发送开始信号
-                yield f"data: {json.dumps({'status': 'started', 'message': '开始生成章节内容...'}, ensure_ascii=False)}\n\n"
-                
-                # 流式生成章节内容
-                full_content = ""
-                async for chunk in openai_service._generate_chapter_content(
-                    chapter=request.chapter,
-                    parent_chapters=request.parent_chapters,
-                    sibling_chapters=request.sibling_chapters,
-                    project_overview=request.project_overview
-                ):
-                    full_content += chunk
-                    # 实时发送内容片段
-                    yield f"data: {json.dumps({'status': 'streaming', 'content': chunk, 'full_content': full_content}, ensure_ascii=False)}\n\n"
-                
-                # 发送完成信号
-                yield f"data: {json.dumps({'status': 'completed', 'content': full_content}, ensure_ascii=False)}\n\n"
-                
-            except Exception as e:
-                # 发送错误信息
-                yield f"data: {json.dumps({'status': 'error', 'message': str(e)}, ensure_ascii=False)}\n\n"
-            
-            # 发送结束信号
-            yield "data: [DONE]\n\n"
-        
-        return sse_response(generate())
-        
+                yield sse_status(
+                    'batch_started',
+                    batch_id=batch.batch_id,
+                    concurrency=batch.concurrency,
+                    chapter_ids=list(batch.chapter_ids),
+                )
+                async for event in batch.events():
+                    yield format_sse(event)
+                yield sse_status('batch_completed', batch_id=batch.batch_id, **batch.stats)
+            finally:
+                chapter_batches.release(batch)
+            yield sse_done()
+
+        return resumable_sse_response(http_request, generate)
+
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"章节内容生成失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"章节内容生成失败: {str(e)}")
+
+
+@router.post("/batches/{batch_id}/chapters")
+async def add_batch_chapters(batch_id: str, request: ChapterBatchAddRequest):
+    """向进行中的批次追加章节，事件通过原有连接返回"""
+    batch = chapter_batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="批次不存在或已结束")
+    return {"success": True, "chapter_ids": batch.add(request.chapters)}
+
+
+@router.delete("/batches/{batch_id}/chapters/{chapter_id}")
+async def cancel_batch_chapter(batch_id: str, chapter_id: str):
+    """取消批次中排队或生成中的章节，原有连接上会收到该章节的 cancelled 事件"""
+    batch = chapter_batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="批次不存在或已结束")
+    if not batch.cancel(chapter_id):
+        raise HTTPException(status_code=404, detail="章节不在排队或生成中")
+    return {"success": True}
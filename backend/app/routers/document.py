@@ -1,12 +1,12 @@
 """文档处理相关API路由"""
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from ..models.schemas import FileUploadResponse, AnalysisRequest, AnalysisType, WordExportRequest
+from ..models.schemas import FileUploadResponse, AnalysisRequest, AnalysisType, WordExportRequest, LLMStage
 from ..services.file_service import FileService
 from ..services.openai_service import OpenAIService
+from ..services.sse_session import resumable_sse_response
 from ..utils.config_manager import config_manager
-from ..utils.sse import sse_response
-import json
+from ..utils.sse import sse_chunk, sse_error, sse_done
 import io
 import re
 import docx
@@ -65,8 +65,8 @@ async def upload_file(file: UploadFile = File(...)):
 
 
 @router.post("/analyze-stream")
-async def analyze_document_stream(request: AnalysisRequest):
-    """流式分析文档内容"""
+async def analyze_document_stream(request: AnalysisRequest, http_request: Request):
+    """流式分析文档内容（断线后带上 Last-Event-ID 重新请求即可从断点继续接收，相同请求或相同 Idempotency-Key 共享同一次生成）"""
     try:
         # 加载配置
         config = config_manager.load_config()
@@ -142,14 +142,23 @@ async def analyze_document_stream(request: AnalysisRequest):
                 {"role": "user", "content": user_prompt}
             ]
             
-            # 流式返回分析结果
-            async for chunk in openai_service.stream_chat_completion(messages, temperature=0.3):
-                yield f"data: {json.dumps({'chunk': chunk}, ensure_ascii=False)}\n\n"
+            try:
+                # 流式返回分析结果
+                async for chunk in openai_service.stream_chat_completion(
+                    messages,
+                    temperature=0.3,
+                    stage=LLMStage.ANALYSIS,
+                    use_cache=request.use_cache,
+                ):
+                    yield sse_chunk(chunk)
+            except Exception as e:
+                # 重试耗尽后通过 SSE 返回错误事件，而不是把错误信息混入分析结果
+                yield sse_error(f"文档分析失败: {str(e)}", chunk="")
             
             # 发送结束信号
-            yield "data: [DONE]\n\n"
+            yield sse_done()
         
-        return sse_response(generate())
+        return resumable_sse_response(http_request, generate, request.model_dump())
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文档分析失败: {str(e)}")
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from ..models.schemas import FileUploadResponse
+from ..models.schemas import FileUploadResponse, LLMStage
 from ..services.file_service import FileService
 from ..utils import prompt_manager
 from ..services.openai_service import OpenAIService
@@ -33,7 +33,12 @@ async def upload_file(file: UploadFile = File(...)):
             {"role": "user", "content": file_content}
         ]
         full_content = ""
-        async for chunk in openai_service.stream_chat_completion(messages, temperature=0.7, response_format={"type": "json_object"}):
+        async for chunk in openai_service.stream_chat_completion(
+            messages,
+            temperature=0.7,
+            response_format={"type": "json_object"},
+            stage=LLMStage.EXPAND_OUTLINE,
+        ):
             full_content += chunk
         return FileUploadResponse(
             success=True,
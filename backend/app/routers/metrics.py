@@ -0,0 +1,79 @@
+"""运行指标相关API路由"""
+from typing import Optional
+from fastapi import APIRouter, Query
+from ..services.llm_scheduler import scheduler_registry
+from ..services.llm_client_registry import client_registry
+from ..services.llm_endpoint_router import endpoint_router
+from ..services.llm_capabilities import capability_registry
+from ..services.llm_cache import llm_cache
+from ..services.llm_cassette import llm_cassette
+from ..services.llm_metrics import json_validation_stats, hedge_stats, cancellation_stats
+from ..services.llm_telemetry import llm_telemetry
+from ..services.stream_hub import stream_hub
+from ..services.chapter_batch import chapter_batches
+
+router = APIRouter(prefix="/api/metrics", tags=["运行指标"])
+
+
+@router.get("/scheduler")
+async def get_scheduler_metrics():
+    """获取LLM调度器的队列深度、并发与等待时间"""
+    return {
+        "schedulers": scheduler_registry.get_stats(),
+        "clients": client_registry.get_stats(),
+    }
+
+
+@router.get("/endpoints")
+async def get_endpoint_metrics():
+    """获取各LLM端点的熔断状态、延迟与错误率"""
+    return {"endpoints": endpoint_router.get_stats()}
+
+
+@router.get("/capabilities")
+async def get_capability_metrics():
+    """获取各端点的能力探测结果（json_schema / json_object / 流式输出）及降级次数"""
+    return capability_registry.get_stats()
+
+
+@router.get("/cache")
+async def get_cache_metrics():
+    """获取LLM响应缓存的命中/未命中统计"""
+    return await llm_cache.aget_stats()
+
+
+@router.get("/cassette")
+async def get_cassette_metrics():
+    """获取LLM流量录制/回放的模式与计数"""
+    return llm_cassette.get_stats()
+
+
+@router.get("/json-validation")
+async def get_json_validation_metrics():
+    """获取结构化JSON生成的校验统计（按阶段、按失败位置）及对冲请求统计"""
+    return {
+        "validation": json_validation_stats.get_stats(),
+        "hedging": hedge_stats.get_stats(),
+    }
+
+
+@router.get("/cancellations")
+async def get_cancellation_metrics():
+    """获取客户端断开次数及因此取消的上游LLM调用统计"""
+    return cancellation_stats.get_stats()
+
+
+@router.get("/streams")
+async def get_stream_metrics():
+    """获取可续传流的数量、缓冲区占用、断线重连及多章节批次统计"""
+    return {**stream_hub.get_stats(), "chapter_batches": chapter_batches.get_stats()}
+
+
+@router.get("/llm")
+async def get_llm_metrics(
+    hours: float = Query(24, gt=0, description="统计最近多少小时的调用"),
+    stage: Optional[str] = Query(None, description="只统计指定阶段"),
+    model: Optional[str] = Query(None, description="只统计指定模型"),
+):
+    """按阶段和模型聚合LLM调用遥测（TTFT、吞吐、总耗时的百分位数，token用量，重试与JSON校验失败次数）"""
+    return await llm_telemetry.aquery(hours=hours, stage=stage, model=model)
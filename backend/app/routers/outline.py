@@ -1,19 +1,29 @@
 """目录相关API路由"""
-from fastapi import APIRouter, HTTPException
-from ..models.schemas import OutlineRequest, OutlineResponse
+from typing import Any, List
+from fastapi import APIRouter, HTTPException, Request
+from ..models.schemas import OutlineRequest, LLMStage
 from ..services.openai_service import OpenAIService
+from ..services.sse_session import resumable_sse_response
 from ..utils.config_manager import config_manager
 from ..utils import prompt_manager
-from ..utils.sse import sse_response
+from ..utils.json_stream import OutlineNodeExtractor
+from ..utils.sse import sse_chunk, sse_status, sse_error, sse_done
 import json
-import asyncio
 
 router = APIRouter(prefix="/api/outline", tags=["目录管理"])
 
 
 @router.post("/generate")
-async def generate_outline(request: OutlineRequest):
-    """生成标书目录结构（以SSE流式返回）"""
+async def generate_outline(request: OutlineRequest, http_request: Request):
+    """
+    生成标书目录结构（以SSE流式返回）
+
+    事件依次为：outline_level1（一级提纲通过校验后立即发送）→ 各一级章节补全后按完成先后发送的
+    outline_chapter（index 为其在一级提纲中的序号）→ 一个包含完整目录 JSON 的 chunk（兼容按 chunk 拼接的客户端）→ [DONE]。
+
+    内容相同（或 Idempotency-Key 相同）的请求共享进行中的同一次生成，Idempotency-Key 相同时结束后短时间内直接取回结果；
+    断线后带上 Last-Event-ID 重新请求即可从断点继续接收。
+    """
     try:
         # 加载配置
         config = config_manager.load_config()
@@ -21,60 +31,59 @@ async def generate_outline(request: OutlineRequest):
         if not config.get('api_key'):
             raise HTTPException(status_code=400, detail="请先配置OpenAI API密钥")
 
-        # 创建OpenAI服务实例
-        openai_service = OpenAIService()
-        
         async def generate():
+            # 创建OpenAI服务实例
+            openai_service = OpenAIService()
+            events = openai_service.generate_outline_v2_events(
+                overview=request.overview,
+                requirements=request.requirements,
+                use_cache=request.use_cache
+            )
+            outline: List[Any] = []
+            completed = 0
             try:
-                # 后台计算主任务
-                compute_task = asyncio.create_task(openai_service.generate_outline_v2(
-                    overview=request.overview,
-                    requirements=request.requirements
-                ))
-
-                # 在等待计算完成期间发送心跳，保持连接（发送空字符串chunk）
-                while not compute_task.done():
-                    yield f"data: {json.dumps({'chunk': ''}, ensure_ascii=False)}\n\n"
-                    await asyncio.sleep(1)
-
-                # 计算完成
-                result = await compute_task
-
-                # 确保为字符串
-                if isinstance(result, dict):
-                    result_str = json.dumps(result, ensure_ascii=False)
-                else:
-                    result_str = str(result)
-
-                # 分片发送实际数据
-                chunk_size = 128
-                chunk_delay = 0.1  # 每个分片之间增加一点点延迟，增强SSE逐步展示效果
-                for i in range(0, len(result_str), chunk_size):
-                    piece = result_str[i:i+chunk_size]
-                    yield f"data: {json.dumps({'chunk': piece}, ensure_ascii=False)}\n\n"
-                    await asyncio.sleep(chunk_delay)
+                # 等待期间连接空闲时会自动发送心跳注释，保持连接
+                async for event in events:
+                    if event["type"] == "level1":
+                        outline = [None] * len(event["outline"])
+                        yield sse_status("outline_level1", outline=event["outline"])
+                    else:
+                        outline[event["index"]] = event["chapter"]
+                        completed += 1
+                        yield sse_status(
+                            "outline_chapter",
+                            index=event["index"],
+                            chapter=event["chapter"],
+                            completed=completed,
+                            total=len(outline),
+                        )
+
+                # 完整目录一次性发送，不再切片限速
+                yield sse_chunk(json.dumps({"outline": outline}, ensure_ascii=False))
                 # 发送结束信号
-                yield "data: [DONE]\n\n"
+                yield sse_done()
             except Exception as e:
-                # 捕获后台任务中的异常，通过 SSE 友好返回给前端
-                error_message = f"目录生成失败: {str(e)}"
-                payload = {
-                    "chunk": "",
-                    "error": True,
-                    "message": error_message,
-                }
-                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
-                yield "data: [DONE]\n\n"
-
-        return sse_response(generate())
+                # 捕获生成过程中的异常，通过 SSE 友好返回给前端
+                yield sse_error(f"目录生成失败: {str(e)}", chunk="")
+                yield sse_done()
+            finally:
+                # 客户端断开时取消整棵目录生成（各章节的并发调用随之取消并关闭上游流）
+                await events.aclose()
+
+        return resumable_sse_response(http_request, generate, request.model_dump())
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"目录生成失败: {str(e)}")
 
 
 @router.post("/generate-stream")
-async def generate_outline_stream(request: OutlineRequest):
-    """流式生成标书目录结构"""
+async def generate_outline_stream(request: OutlineRequest, http_request: Request):
+    """
+    流式生成标书目录结构
+
+    原始 JSON 文本以 chunk 事件转发；同时在服务端增量解析，每个目录节点对象闭合时发送一条
+    node_completed 事件（id、title、description、path、leaf），前端无需等待整份 JSON 即可渲染已完成的章节。
+    """
     try:
         # 加载配置
         config = config_manager.load_config()
@@ -94,7 +103,7 @@ async def generate_outline_stream(request: OutlineRequest):
                 ]
                 
                 full_content = ""
-                async for chunk in openai_service.stream_chat_completion(messages, temperature=0.7, response_format={"type": "json_object"}):
+                async for chunk in openai_service.stream_chat_completion(messages, temperature=0.7, response_format={"type": "json_object"}, stage=LLMStage.OUTLINE_DETAIL, use_cache=request.use_cache):
                     full_content += chunk
                 print(full_content)
                 # 流式返回目录生成结果
@@ -112,14 +121,20 @@ async def generate_outline_stream(request: OutlineRequest):
                     {"role": "user", "content": user_prompt}
                 ]
                 
-                # 流式返回目录生成结果
-                async for chunk in openai_service.stream_chat_completion(messages, temperature=0.7, response_format={"type": "json_object"}):
-                    yield f"data: {json.dumps({'chunk': chunk}, ensure_ascii=False)}\n\n"
+                extractor = OutlineNodeExtractor()
+                try:
+                    # 流式返回目录生成结果
+                    async for chunk in openai_service.stream_chat_completion(messages, temperature=0.7, response_format={"type": "json_object"}, stage=LLMStage.OUTLINE_DETAIL, use_cache=request.use_cache):
+                        yield sse_chunk(chunk)
+                        for node in extractor.feed(chunk):
+                            yield sse_status("node_completed", **node)
+                except Exception as e:
+                    yield sse_error(f"目录生成失败: {str(e)}", chunk="")
                 
                 # 发送结束信号
-                yield "data: [DONE]\n\n"
+                yield sse_done()
         
-        return sse_response(generate())
+        return resumable_sse_response(http_request, generate, request.model_dump())
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"目录生成失败: {str(e)}")
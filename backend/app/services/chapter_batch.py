@@ -0,0 +1,162 @@
+"""多章节批量生成：一个连接内按并发上限调度多个章节，事件以 chapter_id 标记后合并为一个流"""
+import asyncio
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional
+
+from ..config import settings
+
+# 每个章节的事件流：输入章节请求，输出不带 chapter_id 的事件数据
+ChapterRunner = Callable[[Any], AsyncIterator[Dict[str, Any]]]
+
+_BATCH_END = object()
+
+
+def chapter_key(request: Any, index: int) -> str:
+    """章节在批次内的标识：优先使用 chapter.id，没有时使用序号"""
+    chapter_id = (request.chapter or {}).get("id")
+    return str(chapter_id) if chapter_id not in (None, "") else f"#{index}"
+
+
+class ChapterBatch:
+    """
+    一个批次。
+
+    待生成的章节按提交顺序排队，同时最多运行 concurrency 个；每个章节的事件带上 chapter_id 后写入同一个队列，
+    由 events() 依次输出。运行中可以追加章节或取消单个章节，所有章节结束后批次结束。
+    """
+
+    def __init__(self, batch_id: str, runner: ChapterRunner, concurrency: int):
+        self.batch_id = batch_id
+        self.concurrency = max(1, concurrency)
+        self.finished = False
+        self._runner = runner
+        self._pending: "OrderedDict[str, Any]" = OrderedDict()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._seen = 0
+        self.chapter_ids: List[str] = []  # 所有被接受过的章节，按提交顺序
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.stats: Dict[str, int] = {"added": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    @property
+    def running_count(self) -> int:
+        return len(self._running)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def add(self, requests: List[Any]) -> List[str]:
+        """追加章节，返回本次接受的 chapter_id；已在排队或运行中的章节会被忽略"""
+        if self.finished:
+            return []
+        accepted = []
+        for request in requests:
+            key = chapter_key(request, self._seen)
+            self._seen += 1
+            if key in self._pending or key in self._running:
+                continue
+            self._pending[key] = request
+            accepted.append(key)
+        self.chapter_ids.extend(accepted)
+        self.stats["added"] += len(accepted)
+        self._fill()
+        return accepted
+
+    def cancel(self, chapter_id: str) -> bool:
+        """取消排队中或生成中的章节"""
+        if chapter_id in self._pending:
+            del self._pending[chapter_id]
+            self.stats["cancelled"] += 1
+            self._queue.put_nowait({"status": "cancelled", "chapter_id": chapter_id})
+            self._check_done()
+            return True
+        task = self._running.get(chapter_id)
+        if task is not None and not task.done():
+            task.cancel()
+            return True
+        return False
+
+    def _fill(self) -> None:
+        while self._pending and len(self._running) < self.concurrency:
+            key, request = self._pending.popitem(last=False)
+            self._running[key] = asyncio.ensure_future(self._run_chapter(key, request))
+
+    def _check_done(self) -> None:
+        if not self._pending and not self._running and not self.finished:
+            self.finished = True
+            self._queue.put_nowait(_BATCH_END)
+
+    async def _run_chapter(self, chapter_id: str, request: Any) -> None:
+        status = "completed"
+        try:
+            async for payload in self._runner(request):
+                if payload.get("status") == "error":
+                    status = "failed"
+                self._queue.put_nowait({**payload, "chapter_id": chapter_id})
+        except asyncio.CancelledError:
+            status = "cancelled"
+            self._queue.put_nowait({"status": "cancelled", "chapter_id": chapter_id})
+        except Exception as e:
+            status = "failed"
+            self._queue.put_nowait({"status": "error", "chapter_id": chapter_id, "message": str(e)})
+        finally:
+            self.stats[status] += 1
+            self._running.pop(chapter_id, None)
+            self._fill()
+            self._check_done()
+
+    async def events(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """依次输出各章节的事件，全部章节结束后返回；提前关闭时取消所有章节"""
+        try:
+            self._check_done()
+            while True:
+                event = await self._queue.get()
+                if event is _BATCH_END:
+                    return
+                yield event
+        finally:
+            self.finished = True
+            self._pending.clear()
+            tasks = list(self._running.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class ChapterBatchManager:
+    """进行中批次的注册表，供追加/取消章节的控制接口按 batch_id 查找"""
+
+    def __init__(self):
+        self._batches: Dict[str, ChapterBatch] = {}
+        self.stats: Dict[str, int] = {"batches": 0}
+
+    def create(self, runner: ChapterRunner, requests: List[Any], concurrency: Optional[int] = None) -> ChapterBatch:
+        concurrency = min(concurrency or settings.content_batch_concurrency, settings.content_batch_max_concurrency)
+        batch = ChapterBatch(uuid.uuid4().hex[:16], runner, concurrency)
+        self._batches[batch.batch_id] = batch
+        self.stats["batches"] += 1
+        batch.add(requests)
+        return batch
+
+    def get(self, batch_id: str) -> Optional[ChapterBatch]:
+        batch = self._batches.get(batch_id)
+        if batch is not None and batch.finished:
+            del self._batches[batch_id]
+            return None
+        return batch
+
+    def release(self, batch: ChapterBatch) -> None:
+        self._batches.pop(batch.batch_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "active": len(self._batches),
+            "running_chapters": sum(b.running_count for b in self._batches.values()),
+            "pending_chapters": sum(b.pending_count for b in self._batches.values()),
+        }
+
+
+# 全局章节批次注册表实例
+chapter_batches = ChapterBatchManager()
@@ -0,0 +1,191 @@
+"""LLM 响应缓存：按请求内容寻址的本地 SQLite 缓存，命中时以流的形式回放"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from ..config import settings
+from ..utils.config_manager import config_manager
+
+
+def make_cache_key(model: str, messages: list, temperature: float, response_format: Optional[dict]) -> str:
+    """根据模型、消息、温度和响应格式计算内容哈希"""
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "response_format": response_format,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    基于 SQLite 的 LLM 响应缓存。
+
+    按原始分片保存完整的流式输出，命中后按相同分片回放；总大小超过上限时按最近访问时间淘汰。
+    SQLite 读写是阻塞调用，异步代码中应使用 aget / aput / ainvalidate / aget_stats，在线程池中执行。
+    """
+
+    def __init__(self, path: str = "", max_bytes: int = 0):
+        self.path = path or os.path.join(config_manager.config_dir, "llm_cache.sqlite3")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "invalidations": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    stage TEXT,
+                    chunks TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """读取缓存的分片列表，未命中返回 None"""
+        return self.get_first([key])
+
+    def get_first(self, keys: List[str]) -> Optional[List[str]]:
+        """按顺序查找多个候选 key，返回第一个命中的分片列表（整体只记一次命中或未命中）"""
+        with self._lock:
+            conn = self._connect()
+            for key in keys:
+                row = conn.execute("SELECT chunks FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    break
+            else:
+                self.stats["misses"] += 1
+                return None
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, chunks: List[str], model: str = "", stage: str = "") -> None:
+        """写入一次完整的流式输出"""
+        data = json.dumps(chunks, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        if self.max_bytes and size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, stage, chunks, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, stage, data, size, now, now),
+            )
+            self.stats["writes"] += 1
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """按 LRU 淘汰，直到总大小不超过上限"""
+        if not self.max_bytes:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        while total > self.max_bytes:
+            row = conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC LIMIT 1").fetchone()
+            if row is None:
+                break
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (row[0],))
+            total -= row[1]
+            self.stats["evictions"] += 1
+
+    def invalidate(self, key: str) -> None:
+        """删除指定缓存（例如缓存内容未通过 JSON 校验）"""
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            conn.commit()
+            if cursor.rowcount:
+                self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+
+    async def aget(self, key: str) -> Optional[List[str]]:
+        """get 的异步版本，不阻塞事件循环"""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aget_first(self, keys: List[str]) -> Optional[List[str]]:
+        """get_first 的异步版本，不阻塞事件循环"""
+        return await asyncio.to_thread(self.get_first, keys)
+
+    async def aput(self, key: str, chunks: List[str], model: str = "", stage: str = "") -> None:
+        """put 的异步版本，不阻塞事件循环"""
+        await asyncio.to_thread(self.put, key, chunks, model, stage)
+
+    async def ainvalidate(self, *keys: str) -> None:
+        """删除一个或多个缓存，不阻塞事件循环"""
+        def _invalidate_all():
+            for key in keys:
+                self.invalidate(key)
+        await asyncio.to_thread(_invalidate_all)
+
+    async def aget_stats(self) -> Dict[str, Any]:
+        """get_stats 的异步版本，不阻塞事件循环"""
+        return await asyncio.to_thread(self.get_stats)
+
+    async def replay(self, chunks: List[str]) -> AsyncGenerator[str, None]:
+        """以异步生成器的形式回放缓存的分片，消费方无法区分于实时流"""
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回命中率、条目数和占用空间"""
+        with self._lock:
+            conn = self._connect()
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": total,
+            "max_bytes": self.max_bytes,
+            "enabled": settings.llm_cache_enabled,
+            "stages": list(settings.llm_cache_stages),
+        }
+
+
+def cache_enabled_for(stage: str, use_cache: Optional[bool] = None) -> bool:
+    """判断当前调用是否使用缓存：请求显式指定优先，否则按阶段配置"""
+    if not settings.llm_cache_enabled:
+        return False
+    if use_cache is not None:
+        return use_cache
+    return stage in settings.llm_cache_stages
+
+
+# 全局缓存实例
+llm_cache = LLMResponseCache(settings.llm_cache_path, settings.llm_cache_max_bytes)
@@ -0,0 +1,282 @@
+"""端点能力探测：检测各端点/模型是否支持 json_schema 严格结构化输出、json_object 与流式输出，结果按端点缓存"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Optional, Set, Tuple
+
+from ..config import settings
+from .llm_client_registry import client_registry
+
+PROBE_PROMPT = '只返回如下 JSON，不要任何其他内容：{"ok": true}'
+PROBE_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "capability_probe",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"ok": {"type": "boolean"}},
+            "required": ["ok"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# 这些状态码说明端点明确拒绝了该参数，其余错误（网络、限流、5xx 等）视为暂时无法判断
+UNSUPPORTED_STATUS_CODES = {400, 415, 422}
+
+
+def mentions_stream_options(error: BaseException) -> bool:
+    """错误的 param、响应体或错误信息中是否提到 stream_options"""
+    param = getattr(error, "param", None)
+    if isinstance(param, str) and "stream_options" in param:
+        return True
+    body = getattr(error, "body", None)
+    text = json.dumps(body, ensure_ascii=False, default=str) if body is not None else ""
+    return "stream_options" in text or "stream_options" in str(error)
+
+
+class EndpointCapabilities:
+    """一个端点 + 模型组合支持的能力，None 表示未知（未探测或探测失败）"""
+
+    def __init__(
+        self,
+        json_schema: Optional[bool] = None,
+        json_object: Optional[bool] = None,
+        streaming: Optional[bool] = None,
+    ):
+        self.json_schema = json_schema
+        self.json_object = json_object
+        self.streaming = streaming
+        self.probed_at = time.time()
+
+    @property
+    def conclusive(self) -> bool:
+        return None not in (self.json_schema, self.json_object, self.streaming)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "json_schema": self.json_schema,
+            "json_object": self.json_object,
+            "streaming": self.streaming,
+            "probed_at": self.probed_at,
+        }
+
+
+class CompletionStream:
+    """把非流式响应包装成只有一个分片的流，供不支持流式输出的端点使用"""
+
+    def __init__(self, completion: Any):
+        self._completion = completion
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        completion = self._completion
+        choice = completion.choices[0] if completion.choices else None
+        delta = SimpleNamespace(content=choice.message.content if choice else None)
+        yield SimpleNamespace(
+            choices=[SimpleNamespace(index=0, delta=delta, finish_reason=choice.finish_reason if choice else None)],
+            usage=getattr(completion, "usage", None),
+        )
+
+    async def close(self) -> None:
+        pass
+
+
+class CapabilityRegistry:
+    """
+    端点能力注册表。
+
+    按 (base_url, model) 缓存探测结果。探测只在后台进行，生成请求从不等待探测：
+    结果出来之前按未知能力处理（json_schema 降级为 json_object，照常流式请求）。
+    同一组合同时只有一个探测任务；结果不完整（网络错误、限流等）时按指数退避重新探测，
+    间隔从 llm_capability_retry_interval 开始翻倍，最长 llm_capability_retry_max_interval。
+    """
+
+    def __init__(self):
+        self._cache: Dict[Tuple[str, str], EndpointCapabilities] = {}
+        self._probing: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._failures: Dict[Tuple[str, str], int] = {}
+        # 拒绝 stream_options 参数的端点 + 模型（首次被 4xx 拒绝后不再发送）
+        self._no_stream_options: Set[Tuple[str, str]] = set()
+        self.stats: Dict[str, int] = {
+            "probes": 0,
+            "probe_requests": 0,
+            "downgraded_json_schema": 0,
+            "downgraded_stream": 0,
+            "downgraded_stream_options": 0,
+        }
+
+    def _retry_interval(self, key: Tuple[str, str]) -> float:
+        failures = max(1, self._failures.get(key, 1))
+        return min(
+            settings.llm_capability_retry_interval * 2 ** (failures - 1),
+            settings.llm_capability_retry_max_interval,
+        )
+
+    def _fresh(self, key: Tuple[str, str]) -> Optional[EndpointCapabilities]:
+        capabilities = self._cache.get(key)
+        if capabilities is None:
+            return None
+        if not capabilities.conclusive and time.time() - capabilities.probed_at >= self._retry_interval(key):
+            return None
+        return capabilities
+
+    def get(self, client: Any, base_url: str, model: str) -> EndpointCapabilities:
+        """
+        获取端点能力，不阻塞
+
+        没有可用的探测结果时在后台发起探测，本次返回已有的（可能不完整的）结果或未知能力。
+        """
+        if not settings.llm_capability_probe_enabled:
+            return EndpointCapabilities()
+        key = (base_url or "", model)
+        capabilities = self._fresh(key)
+        if capabilities is not None:
+            return capabilities
+        self.probe_in_background(client, base_url, model)
+        return self._cache.get(key) or EndpointCapabilities()
+
+    async def _probe_and_store(self, client: Any, key: Tuple[str, str]) -> None:
+        base_url, model = key
+        try:
+            async with client_registry.in_use(client):
+                capabilities = await self.probe(client, model)
+        finally:
+            self._probing.pop(key, None)
+        self._cache[key] = capabilities
+        if capabilities.conclusive:
+            self._failures.pop(key, None)
+        else:
+            self._failures[key] = self._failures.get(key, 0) + 1
+        print(f"端点能力探测 {base_url or 'default'} / {model}: {capabilities.to_dict()}")
+
+    async def _check(self, request) -> Optional[bool]:
+        """执行一次探测请求：成功为 True，明确拒绝为 False，无法判断为 None"""
+        self.stats["probe_requests"] += 1
+        try:
+            return await asyncio.wait_for(request, timeout=settings.llm_capability_probe_timeout)
+        except asyncio.TimeoutError:
+            return None
+        except Exception as e:
+            if getattr(e, "status_code", None) in UNSUPPORTED_STATUS_CODES:
+                return False
+            return None
+
+    async def probe(self, client: Any, model: str) -> EndpointCapabilities:
+        """并发探测三项能力"""
+        messages = [{"role": "user", "content": PROBE_PROMPT}]
+
+        async def structured(response_format: Dict[str, Any]) -> bool:
+            response = await client.chat.completions.create(
+                model=model, messages=messages, response_format=response_format
+            )
+            try:
+                return isinstance(json.loads(response.choices[0].message.content or ""), dict)
+            except ValueError:
+                return False
+
+        async def streaming() -> bool:
+            stream = await client.chat.completions.create(model=model, messages=messages, stream=True)
+            try:
+                async for _ in stream:
+                    return True
+                return False
+            finally:
+                await stream.close()
+
+        self.stats["probes"] += 1
+        json_schema, json_object, stream = await asyncio.gather(
+            self._check(structured(PROBE_SCHEMA)),
+            self._check(structured({"type": "json_object"})),
+            self._check(streaming()),
+        )
+        # 三项都被拒绝时更可能是请求本身的问题（例如模型名错误），不据此下结论
+        if json_schema is False and json_object is False and stream is False:
+            return EndpointCapabilities()
+        return EndpointCapabilities(json_schema, json_object, stream)
+
+    def probe_in_background(self, client: Any, base_url: str, model: str) -> None:
+        """在后台探测端点能力，不阻塞当前请求；同一端点 + 模型已在探测或结果仍有效时不重复探测"""
+        if not settings.llm_capability_probe_enabled:
+            return
+        key = (base_url or "", model)
+        if key in self._probing or self._fresh(key) is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._probing[key] = loop.create_task(self._probe_and_store(client, key))
+
+    def resolve_response_format(
+        self, capabilities: EndpointCapabilities, response_format: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        按端点能力确定实际发送的 response_format
+
+        json_schema 只在确认支持时发送，否则降级为 json_object；
+        json_object 被明确拒绝时不再发送（提示词中已要求只返回 JSON）。
+        """
+        if response_format is None:
+            return None
+        if response_format.get("type") == "json_schema":
+            if capabilities.json_schema:
+                return response_format
+            self.stats["downgraded_json_schema"] += 1
+            response_format = {"type": "json_object"}
+        if response_format.get("type") == "json_object" and capabilities.json_object is False:
+            return None
+        return response_format
+
+    def use_streaming(self, capabilities: EndpointCapabilities) -> bool:
+        """端点是否使用流式请求；明确不支持时改用非流式请求"""
+        if capabilities.streaming is False:
+            self.stats["downgraded_stream"] += 1
+            return False
+        return True
+
+    def stream_params(self, base_url: str, model: str) -> Dict[str, Any]:
+        """流式请求的附加参数：配置开启且端点未拒绝过时请求在最后一个分片中返回 usage"""
+        if not settings.llm_stream_include_usage or (base_url or "", model) in self._no_stream_options:
+            return {}
+        return {"stream_options": {"include_usage": True}}
+
+    def reject_stream_options(self, base_url: str, model: str, error: BaseException) -> bool:
+        """
+        请求带 stream_options 被拒绝时调用
+
+        只有 4xx 错误的 param 或错误信息明确指向 stream_options 时，才记下该端点不支持并返回 True，
+        调用方去掉该参数后重试一次；其他 4xx（上下文超长、模型名错误等）返回 False，按原错误处理，不重发。
+        """
+        if getattr(error, "status_code", None) not in UNSUPPORTED_STATUS_CODES or not mentions_stream_options(error):
+            return False
+        key = (base_url or "", model)
+        if key not in self._no_stream_options:
+            self._no_stream_options.add(key)
+            self.stats["downgraded_stream_options"] += 1
+            print(f"端点 {base_url or 'default'} / {model} 不支持 stream_options，后续请求不再发送")
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "probing": len(self._probing),
+            "endpoints": [
+                {
+                    "base_url": base_url,
+                    "model": model,
+                    **capabilities.to_dict(),
+                    "failed_probes": self._failures.get((base_url, model), 0),
+                    "stream_options": (base_url, model) not in self._no_stream_options,
+                }
+                for (base_url, model), capabilities in self._cache.items()
+            ],
+        }
+
+
+# 全局端点能力注册表实例
+capability_registry = CapabilityRegistry()
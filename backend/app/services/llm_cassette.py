@@ -0,0 +1,128 @@
+"""LLM 流量录制与回放：把请求与带时间戳的流式响应保存到 cassette 文件，离线时按原始或压缩的节奏回放"""
+import asyncio
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..utils.config_manager import config_manager
+
+MODE_OFF = "off"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+TIMING_ORIGINAL = "original"
+TIMING_COMPRESSED = "compressed"
+TIMING_NONE = "none"
+
+
+class CassetteMissError(Exception):
+    """回放模式下 cassette 中没有匹配的请求"""
+
+
+class LLMCassette:
+    """
+    LLM 流量 cassette。
+
+    JSON Lines 格式，每行一次完整调用：请求哈希（与响应缓存相同的内容寻址）、阶段、模型，
+    以及每个分片相对首次发出请求的时间偏移。同一请求出现多次时按录制顺序依次回放，用完后重复最后一条。
+    """
+
+    def __init__(self, mode: str = MODE_OFF, path: str = "", timing: str = TIMING_ORIGINAL, speed: float = 10.0):
+        self.mode = mode
+        self.path = path or os.path.join(config_manager.config_dir, "llm_cassette.jsonl")
+        self.timing = timing
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._cursors: Dict[str, int] = defaultdict(int)
+        self.stats: Dict[str, int] = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == MODE_RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == MODE_REPLAY
+
+    def record(self, key: str, stage: str, model: str, chunks: List[Tuple[float, str]], usage: Optional[Dict[str, Any]] = None) -> None:
+        """追加一次完整调用"""
+        entry = {
+            "key": key,
+            "stage": stage,
+            "model": model,
+            "chunks": [[round(offset, 4), text] for offset, text in chunks],
+            "usage": usage,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.stats["recorded"] += 1
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        if self._entries is None:
+            entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        entries[entry["key"]].append(entry)
+            self._entries = entries
+        return self._entries
+
+    def lookup(self, key: str) -> Dict[str, Any]:
+        """取出下一条匹配的录制；没有时抛出 CassetteMissError"""
+        with self._lock:
+            candidates = self._load().get(key)
+            if not candidates:
+                self.stats["misses"] += 1
+                raise CassetteMissError(f"cassette 中没有匹配的请求: {key[:12]}")
+            index = min(self._cursors[key], len(candidates) - 1)
+            self._cursors[key] += 1
+            self.stats["replayed"] += 1
+            return candidates[index]
+
+    def _delay(self, seconds: float) -> float:
+        if self.timing == TIMING_NONE or seconds <= 0:
+            return 0.0
+        if self.timing == TIMING_COMPRESSED:
+            return seconds / max(self.speed, 1e-6)
+        return seconds
+
+    async def replay(self, entry: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """按录制时的节奏（或压缩后的节奏）回放分片"""
+        previous = 0.0
+        for offset, text in entry["chunks"]:
+            delay = self._delay(offset - previous)
+            previous = offset
+            if delay:
+                await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)
+            yield text
+
+    def reset(self) -> None:
+        """重新加载 cassette 并重置回放位置"""
+        with self._lock:
+            self._entries = None
+            self._cursors.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "path": self.path, "timing": self.timing, "speed": self.speed, **self.stats}
+
+
+# 全局 cassette 实例
+llm_cassette = LLMCassette(
+    settings.llm_cassette_mode,
+    settings.llm_cassette_path,
+    settings.llm_cassette_timing,
+    settings.llm_cassette_speed,
+)
@@ -0,0 +1,174 @@
+"""LLM 客户端注册表：进程内共享 AsyncOpenAI 客户端及其 HTTP 连接池"""
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+import httpx
+import openai
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClientRegistry:
+    """
+    按 (api_key, base_url) 缓存 AsyncOpenAI 客户端。
+
+    同一组配置下的所有请求复用同一个 httpx 连接池，避免每次请求都重新建立 TCP/TLS 连接。
+    使用客户端期间用 in_use() 登记；超出缓存上限被淘汰的客户端等所有使用结束后才关闭，不会中断进行中的流。
+    """
+
+    def __init__(self):
+        self._clients: "OrderedDict[Tuple[str, str], openai.AsyncOpenAI]" = OrderedDict()
+        self._in_use: Dict[int, int] = {}  # id(client) -> 进行中的使用数
+        self._retired: Dict[int, openai.AsyncOpenAI] = {}  # 已淘汰、等待使用结束后关闭的客户端
+        self._background_tasks: Set[asyncio.Task] = set()
+        self.stats: Dict[str, int] = {
+            "clients_created": 0,
+            "clients_reused": 0,
+            "clients_evicted": 0,
+            "clients_close_deferred": 0,
+            "connections_opened": 0,
+            "prewarm_requests": 0,
+        }
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        """httpcore trace 回调，用于统计新建连接数"""
+        if event_name == "connection.connect_tcp.complete":
+            self.stats["connections_opened"] += 1
+
+    async def _attach_trace(self, request: httpx.Request) -> None:
+        """请求事件钩子：为每个请求挂上 trace 回调"""
+        request.extensions["trace"] = self._trace
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        """创建带连接池限制和长连接配置的 httpx 客户端"""
+        limits = httpx.Limits(
+            max_connections=settings.llm_max_connections,
+            max_keepalive_connections=settings.llm_max_keepalive_connections,
+            keepalive_expiry=settings.llm_keepalive_expiry,
+        )
+        timeout = httpx.Timeout(
+            settings.llm_read_timeout,
+            connect=settings.llm_connect_timeout,
+        )
+        return httpx.AsyncClient(
+            limits=limits,
+            timeout=timeout,
+            event_hooks={"request": [self._attach_trace]},
+        )
+
+    def get_client(self, api_key: str, base_url: str = "") -> openai.AsyncOpenAI:
+        """获取（或创建）指定配置对应的共享客户端"""
+        key = (api_key or "", base_url or "")
+        client = self._clients.get(key)
+        if client is not None:
+            self._clients.move_to_end(key)
+            self.stats["clients_reused"] += 1
+            return client
+
+        client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url if base_url else None,
+            http_client=self._build_http_client(),
+            max_retries=0,  # 重试由 OpenAIService 统一处理（退避、Retry-After、故障转移与续写）
+        )
+        self._clients[key] = client
+        self.stats["clients_created"] += 1
+
+        # 超出缓存上限时淘汰最久未使用的客户端；仍在使用中的等使用结束后再关闭
+        while len(self._clients) > max(1, settings.llm_max_cached_clients):
+            _, stale = self._clients.popitem(last=False)
+            self.stats["clients_evicted"] += 1
+            if self._in_use.get(id(stale)):
+                self._retired[id(stale)] = stale
+                self.stats["clients_close_deferred"] += 1
+            else:
+                self._spawn(stale.close())
+
+        return client
+
+    @asynccontextmanager
+    async def in_use(self, client: openai.AsyncOpenAI) -> AsyncIterator[openai.AsyncOpenAI]:
+        """登记一次客户端使用（请求及读取流的整个过程），期间客户端即使被淘汰也不会关闭"""
+        key = id(client)
+        self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            yield client
+        finally:
+            remaining = self._in_use[key] - 1
+            if remaining:
+                self._in_use[key] = remaining
+            else:
+                del self._in_use[key]
+                retired = self._retired.pop(key, None)
+                if retired is not None:
+                    self._spawn(retired.close())
+
+    def _spawn(self, coro) -> None:
+        """在当前事件循环中执行后台任务，并保留引用防止被回收"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            coro.close()
+            return
+        task = loop.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def prewarm(self, api_key: str, base_url: str = "", connections: Optional[int] = None) -> int:
+        """
+        预热连接：并发发送轻量请求（获取模型列表），让连接池中提前建立好长连接。
+
+        Returns:
+            int: 成功完成的预热请求数
+        """
+        count = settings.llm_prewarm_connections if connections is None else connections
+        if count <= 0 or not api_key:
+            return 0
+
+        client = self.get_client(api_key, base_url)
+
+        async def _warm_one() -> bool:
+            try:
+                await client.models.list()
+                return True
+            except Exception as e:
+                logger.debug(f"连接预热失败: {str(e)}")
+                return False
+
+        async with self.in_use(client):
+            results = await asyncio.gather(*[_warm_one() for _ in range(count)])
+        self.stats["prewarm_requests"] += count
+        return sum(1 for ok in results if ok)
+
+    def prewarm_in_background(self, api_key: str, base_url: str = "") -> None:
+        """在后台预热连接，不阻塞当前请求"""
+        self._spawn(self.prewarm(api_key, base_url))
+
+    async def close_all(self) -> None:
+        """关闭所有缓存的客户端（包括已淘汰、仍在等待使用结束的客户端）"""
+        clients = list(self._clients.values()) + list(self._retired.values())
+        self._clients.clear()
+        self._retired.clear()
+        for client in clients:
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+    def get_stats(self) -> Dict[str, int]:
+        """返回注册表统计信息"""
+        return {
+            **self.stats,
+            "clients_cached": len(self._clients),
+            "clients_in_use": len(self._in_use),
+            "clients_pending_close": len(self._retired),
+        }
+
+
+# 全局客户端注册表实例
+client_registry = LLMClientRegistry()
@@ -0,0 +1,213 @@
+"""LLM 端点路由：在多个 OpenAI 兼容端点之间按权重、延迟与错误率选路，并为每个端点维护熔断器"""
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import openai
+
+from ..config import settings
+
+
+class CircuitBreaker:
+    """
+    端点熔断器。
+
+    连续失败达到阈值后进入 open 状态，冷却期内不再分配请求；
+    冷却结束后进入 half_open 状态，只放行一个试探请求，成功则恢复，失败则重新熔断。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    def available(self) -> bool:
+        """当前是否可以分配请求（不改变状态）"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - (self.opened_at or 0) >= self.cooldown
+        return not self.trial_in_flight
+
+    def on_dispatch(self) -> None:
+        """请求被分配到该端点"""
+        if self.state == self.OPEN and self.available():
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            self.trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+    def release(self) -> None:
+        """请求未得出结论（例如被调用方取消）时归还试探名额"""
+        self.trial_in_flight = False
+
+
+class LLMEndpoint:
+    """一个 OpenAI 兼容端点及其运行状态"""
+
+    def __init__(self, name: str, base_url: str, api_key: str, model_name: str, weight: float = 1.0):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model_name = model_name
+        self.weight = weight if weight > 0 else 1.0
+        self.breaker = CircuitBreaker(settings.llm_breaker_failure_threshold, settings.llm_breaker_cooldown)
+        self.ewma_ttft: Optional[float] = None  # 首 token 延迟的指数滑动平均（秒）
+        self.error_rate = 0.0  # 失败率的指数滑动平均
+        self.in_flight = 0
+        self.stats: Dict[str, int] = {"requests": 0, "successes": 0, "failures": 0, "failovers": 0}
+
+    @property
+    def key(self) -> Tuple[str, str, str, str]:
+        return (self.name, self.base_url, self.api_key, self.model_name)
+
+    def score(self, default_latency: float) -> float:
+        """路由得分，越小越优先：延迟 ×（1 + 在途请求）×（1 + 错误惩罚）；选中概率与 权重 / 得分 成正比"""
+        latency = self.ewma_ttft if self.ewma_ttft is not None else default_latency
+        return latency * (1 + self.in_flight) * (1 + settings.llm_router_error_penalty * self.error_rate)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "model": self.model_name,
+            "weight": self.weight,
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "times_opened": self.breaker.times_opened,
+            "ewma_ttft_ms": round(self.ewma_ttft * 1000, 1) if self.ewma_ttft is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "in_flight": self.in_flight,
+            **self.stats,
+        }
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """
+    判断异常是否应归咎于端点本身（计入熔断并触发故障转移/重试）。
+
+    只认可明确的端点故障：连接错误、超时，以及状态码为 408 / 409 / 429 / 5xx 的响应；
+    流读取中途的网络错误 SDK 不会再包装，按 httpx 的传输错误识别。
+    其余异常（参数或鉴权错误、本地代码错误等）换端点也无济于事，直接向上抛出。
+    """
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        # APITimeoutError 是 APIConnectionError 的子类
+        return True
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        return status in (408, 409, 429) or status >= 500
+    return False
+
+
+class EndpointRouter:
+    """
+    多端点路由器。
+
+    端点状态按 (名称, base_url, api_key, 模型) 在进程内保留，配置变化时自动新建，
+    不再出现在配置中且没有在途请求的端点随之移除。
+    选路时跳过熔断中的端点，在其余端点中按 权重 / 得分 的比例随机选择：
+    状态相同的端点之间流量按权重分配，更慢、更忙或错误更多的端点分到的流量相应减少，但不会完全断流。
+    尚无延迟样本的端点按已知最低延迟计分，保证新端点能够被探测到。
+    """
+
+    def __init__(self):
+        self._endpoints: Dict[Tuple[str, str, str, str], LLMEndpoint] = {}
+
+    def resolve(self, specs: Sequence[Dict[str, Any]]) -> List[LLMEndpoint]:
+        """把配置中的端点列表映射为带状态的端点对象"""
+        endpoints = []
+        for spec in specs:
+            endpoint = LLMEndpoint(
+                spec.get("name") or "default",
+                spec.get("base_url") or "",
+                spec.get("api_key") or "",
+                spec.get("model_name") or settings.default_model,
+                float(spec.get("weight") or 1.0),
+            )
+            existing = self._endpoints.get(endpoint.key)
+            if existing is None:
+                self._endpoints[endpoint.key] = endpoint
+                existing = endpoint
+            existing.weight = endpoint.weight
+            endpoints.append(existing)
+        # 配置变化后移除旧端点；仍有在途请求的先保留，等下次解析时再移除
+        current = {endpoint.key for endpoint in endpoints}
+        for key, endpoint in list(self._endpoints.items()):
+            if key not in current and endpoint.in_flight == 0:
+                del self._endpoints[key]
+        return endpoints
+
+    def select(self, endpoints: Sequence[LLMEndpoint], exclude: Sequence[LLMEndpoint] = ()) -> Optional[LLMEndpoint]:
+        """选择下一个端点；没有可用端点时返回 None"""
+        candidates = [endpoint for endpoint in endpoints if endpoint not in exclude]
+        if not candidates:
+            return None
+        available = [endpoint for endpoint in candidates if endpoint.breaker.available()]
+        if not available:
+            # 全部熔断时仍尝试最早熔断的端点，而不是直接失败
+            return min(candidates, key=lambda endpoint: endpoint.breaker.opened_at or 0)
+        if len(available) == 1:
+            return available[0]
+        known = [endpoint.ewma_ttft for endpoint in available if endpoint.ewma_ttft is not None]
+        default_latency = min(known) if known else 1.0
+        weights = [endpoint.weight / max(endpoint.score(default_latency), 1e-6) for endpoint in available]
+        return random.choices(available, weights=weights)[0]
+
+    def on_dispatch(self, endpoint: LLMEndpoint, failover: bool = False) -> None:
+        """请求开始发往该端点"""
+        endpoint.breaker.on_dispatch()
+        endpoint.in_flight += 1
+        endpoint.stats["requests"] += 1
+        if failover:
+            endpoint.stats["failovers"] += 1
+
+    def on_complete(self, endpoint: LLMEndpoint, ok: Optional[bool], ttft: Optional[float] = None) -> None:
+        """
+        请求结束。
+
+        ok 为 True / False 时分别记录成功或失败；为 None 表示调用方提前终止、无法判断端点好坏。
+        """
+        endpoint.in_flight = max(0, endpoint.in_flight - 1)
+        alpha = settings.llm_router_ewma_alpha
+        if ok is None:
+            endpoint.breaker.release()
+            return
+        if ok:
+            endpoint.stats["successes"] += 1
+            endpoint.breaker.record_success()
+            endpoint.error_rate *= 1 - alpha
+            if ttft is not None:
+                endpoint.ewma_ttft = ttft if endpoint.ewma_ttft is None else alpha * ttft + (1 - alpha) * endpoint.ewma_ttft
+        else:
+            endpoint.stats["failures"] += 1
+            endpoint.breaker.record_failure()
+            endpoint.error_rate = alpha + (1 - alpha) * endpoint.error_rate
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [endpoint.get_stats() for endpoint in self._endpoints.values()]
+
+
+# 全局端点路由实例
+endpoint_router = EndpointRouter()
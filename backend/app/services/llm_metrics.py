@@ -0,0 +1,161 @@
+"""LLM 调用相关的进程内统计"""
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from ..utils.token_util import estimate_tokens
+from ..utils.stats_util import percentile
+
+# 失败位置分桶（按已消费的估算 token 数）
+POSITION_BUCKETS = [64, 256, 1024, 4096]
+
+
+def _bucket_label(tokens: int) -> str:
+    lower = 0
+    for upper in POSITION_BUCKETS:
+        if tokens < upper:
+            return f"{lower}-{upper}"
+        lower = upper
+    return f"{lower}+"
+
+
+class JsonValidationStats:
+    """
+    结构化 JSON 生成的校验统计。
+
+    按阶段记录尝试次数、通过次数、提前终止和完整生成后才失败的次数，
+    并按失败位置分桶，用成功输出的平均长度估算提前终止节省的 token。
+    未通过校验的输出会先尝试本地修复，修复成功即省去一次重试，按修复后的输出长度估算节省的 token。
+    """
+
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, Any]] = defaultdict(self._new_stage)
+
+    @staticmethod
+    def _new_stage() -> Dict[str, Any]:
+        return {
+            "attempts": 0,
+            "passed": 0,
+            "early_aborts": 0,
+            "late_failures": 0,
+            "success_tokens": 0,
+            "abort_tokens": 0,
+            "abort_positions": defaultdict(int),
+            "repair_attempts": 0,
+            "repaired": 0,
+            "repair_tokens_saved": 0,
+            "repair_steps": defaultdict(int),
+        }
+
+    def record_pass(self, stage: str, content: str) -> None:
+        data = self._stages[stage]
+        data["attempts"] += 1
+        data["passed"] += 1
+        data["success_tokens"] += estimate_tokens(content)
+
+    def record_failure(self, stage: str, consumed_text: str, early: bool) -> None:
+        data = self._stages[stage]
+        data["attempts"] += 1
+        tokens = estimate_tokens(consumed_text)
+        if early:
+            data["early_aborts"] += 1
+            data["abort_tokens"] += tokens
+            data["abort_positions"][_bucket_label(tokens)] += 1
+        else:
+            data["late_failures"] += 1
+
+    def record_repair(self, stage: str, content: str, steps: List[str], ok: bool) -> None:
+        data = self._stages[stage]
+        data["repair_attempts"] += 1
+        if ok:
+            data["repaired"] += 1
+            data["repair_tokens_saved"] += estimate_tokens(content)
+            for step in steps:
+                data["repair_steps"][step] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        result = {}
+        for stage, data in self._stages.items():
+            avg_success = data["success_tokens"] / data["passed"] if data["passed"] else 0
+            saved = max(0, avg_success * data["early_aborts"] - data["abort_tokens"])
+            result[stage] = {
+                "attempts": data["attempts"],
+                "passed": data["passed"],
+                "early_aborts": data["early_aborts"],
+                "late_failures": data["late_failures"],
+                "avg_success_tokens": round(avg_success, 1),
+                "abort_positions": dict(data["abort_positions"]),
+                "estimated_tokens_saved": int(saved),
+                "repair_attempts": data["repair_attempts"],
+                "repaired": data["repaired"],
+                "repair_rate": round(data["repaired"] / data["repair_attempts"], 3) if data["repair_attempts"] else 0.0,
+                "repair_steps": dict(data["repair_steps"]),
+                "retries_avoided": data["repaired"],
+                "repair_tokens_saved": data["repair_tokens_saved"],
+            }
+        return result
+
+
+class LatencyTracker:
+    """按阶段保存最近的成功耗时，用于计算对冲触发阈值"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, stage: str, seconds: float) -> None:
+        self._samples[stage].append(seconds)
+
+    def percentile(self, stage: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """样本数不足 min_samples 时返回 None"""
+        samples = self._samples.get(stage)
+        if not samples or len(samples) < min_samples:
+            return None
+        return percentile(list(samples), q)
+
+
+class HedgeStats:
+    """对冲请求统计"""
+
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "candidates": 0, "hedges_on_latency": 0, "hedges_on_failure": 0, "won_by_hedge": 0, "cancelled": 0}
+        )
+
+    def record(self, stage: str, **counts: int) -> None:
+        data = self._stages[stage]
+        for key, value in counts.items():
+            data[key] += value
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {stage: dict(data) for stage, data in self._stages.items()}
+
+
+class CancellationStats:
+    """客户端断开与 LLM 调用取消统计"""
+
+    def __init__(self):
+        self._disconnects: Dict[str, int] = defaultdict(int)
+        self._cancelled_calls: Dict[str, int] = defaultdict(int)
+        self._cancelled_tokens: Dict[str, int] = defaultdict(int)
+
+    def record_disconnect(self, route: str) -> None:
+        """SSE 客户端在生成结束前断开"""
+        self._disconnects[route or "unknown"] += 1
+
+    def record_llm_cancelled(self, stage: str, streamed_text: str = "") -> None:
+        """一次上游 LLM 调用因取消而提前关闭"""
+        self._cancelled_calls[stage] += 1
+        self._cancelled_tokens[stage] += estimate_tokens(streamed_text)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "client_disconnects": dict(self._disconnects),
+            "llm_calls_cancelled": dict(self._cancelled_calls),
+            "tokens_streamed_before_cancel": dict(self._cancelled_tokens),
+        }
+
+
+# 全局统计实例
+json_validation_stats = JsonValidationStats()
+json_latency_tracker = LatencyTracker()
+hedge_stats = HedgeStats()
+cancellation_stats = CancellationStats()
@@ -0,0 +1,273 @@
+"""LLM 全局调度器：按服务商限制 RPM/TPM 与并发，并按优先级排队"""
+import asyncio
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from ..config import settings
+from ..models.schemas import GenerationPriority, LLMStage
+from ..utils.stats_util import summarize
+
+
+class Priority(IntEnum):
+    """调度优先级通道，数值越小越先执行"""
+    INTERACTIVE = 0
+    NORMAL = 1
+    BULK = 2
+
+
+# 各阶段默认优先级：文档分析为交互式请求，正文批量生成最后
+STAGE_PRIORITIES: Dict[LLMStage, Priority] = {
+    LLMStage.ANALYSIS: Priority.INTERACTIVE,
+    LLMStage.OUTLINE_L1: Priority.NORMAL,
+    LLMStage.OUTLINE_DETAIL: Priority.NORMAL,
+    LLMStage.EXPAND_OUTLINE: Priority.NORMAL,
+    LLMStage.CHAPTER_CONTENT: Priority.BULK,
+    LLMStage.DEFAULT: Priority.NORMAL,
+}
+
+
+def resolve_priority(stage: LLMStage, requested: Optional[GenerationPriority] = None) -> Priority:
+    """根据请求指定的优先级或阶段默认值确定调度通道"""
+    if requested is not None:
+        return Priority[GenerationPriority(requested).name]
+    return STAGE_PRIORITIES.get(stage, Priority.NORMAL)
+
+
+def usage_tokens(usage: Any) -> Optional[int]:
+    """服务商返回的本次请求 token 总量；usage 缺失或不完整时返回 None"""
+    if usage is None:
+        return None
+    total = getattr(usage, "total_tokens", None)
+    if isinstance(total, int):
+        return total
+    prompt = getattr(usage, "prompt_tokens", None)
+    completion = getattr(usage, "completion_tokens", None)
+    if isinstance(prompt, int) and isinstance(completion, int):
+        return prompt + completion
+    return None
+
+
+class TokenBucket:
+    """按分钟补充的令牌桶，capacity 为 0 表示不限制"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.capacity / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """返回可消费 amount 个令牌前需要等待的秒数"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.capacity
+
+    def consume(self, amount: float) -> None:
+        if self.unlimited:
+            return
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """按实际用量修正（delta 为正表示多扣，允许临时透支）"""
+        if self.unlimited:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class SchedulerTicket:
+    """一次调度许可"""
+
+    def __init__(self, priority: Priority, reserved_tokens: int):
+        self.priority = priority
+        self.reserved_tokens = reserved_tokens
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.actual_tokens: Optional[int] = None  # 调用结束后填写实际用量（优先取服务商返回的 usage），用于修正 TPM
+        self.released = False
+
+    @property
+    def wait_seconds(self) -> float:
+        if self.granted_at is None:
+            return time.monotonic() - self.enqueued_at
+        return self.granted_at - self.enqueued_at
+
+
+class LLMScheduler:
+    """
+    单个服务商的调度器。
+
+    所有请求按 (有效优先级, 入队顺序) 排队，只有在并发数、RPM 令牌桶和 TPM 令牌桶都允许时才放行。
+    有效优先级随排队时间提升：每等待 llm_priority_aging_seconds 秒提升一级，
+    持续到来的交互式请求不会让批量请求无限期等待。
+    """
+
+    def __init__(self, name: str, rpm: int = 0, tpm: int = 0, max_concurrency: int = 0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rpm_bucket = TokenBucket(rpm)
+        self.tpm_bucket = TokenBucket(tpm)
+        self.in_flight = 0
+        self._queue: List[tuple] = []
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._waits: Dict[Priority, Deque[float]] = {p: deque(maxlen=1000) for p in Priority}
+        self._granted: Dict[Priority, int] = {p: 0 for p in Priority}
+        self._aged_grants = 0  # 因排队时间提升了优先级后才被放行的请求数
+
+    def _queue_depth(self) -> Dict[str, int]:
+        depth = {p.name.lower(): 0 for p in Priority}
+        for priority, _, _, future in self._queue:
+            if not future.done():
+                depth[Priority(priority).name.lower()] += 1
+        return depth
+
+    @staticmethod
+    def _effective_priority(priority: int, waited: float) -> int:
+        aging = settings.llm_priority_aging_seconds
+        if aging <= 0:
+            return priority
+        return max(0, priority - int(waited / aging))
+
+    def _head(self) -> Optional[int]:
+        """清理已取消的请求，返回下一个应放行请求在队列中的下标"""
+        self._queue = [entry for entry in self._queue if not entry[3].done()]
+        if not self._queue:
+            return None
+        now = time.monotonic()
+        return min(
+            range(len(self._queue)),
+            key=lambda i: (
+                self._effective_priority(self._queue[i][0], now - self._queue[i][2].enqueued_at),
+                self._queue[i][1],
+            ),
+        )
+
+    def _dispatch(self) -> None:
+        """尽可能多地放行队首请求；被令牌桶阻塞时设置定时器稍后重试"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._queue:
+            if self.max_concurrency > 0 and self.in_flight >= self.max_concurrency:
+                return
+            index = self._head()
+            if index is None:
+                return
+            priority, _, ticket, future = self._queue[index]
+
+            wait = max(self.rpm_bucket.wait_time(1), self.tpm_bucket.wait_time(ticket.reserved_tokens))
+            if wait > 0:
+                loop = asyncio.get_running_loop()
+                self._timer = loop.call_later(wait, self._dispatch)
+                return
+
+            del self._queue[index]
+            self.rpm_bucket.consume(1)
+            self.tpm_bucket.consume(ticket.reserved_tokens)
+            self.in_flight += 1
+            ticket.granted_at = time.monotonic()
+            self._waits[ticket.priority].append(ticket.wait_seconds)
+            self._granted[ticket.priority] += 1
+            if self._effective_priority(priority, ticket.wait_seconds) < priority:
+                self._aged_grants += 1
+            future.set_result(ticket)
+
+    async def acquire(self, priority: Priority, estimated_tokens: int = 0) -> SchedulerTicket:
+        """排队等待调度许可"""
+        ticket = SchedulerTicket(priority, estimated_tokens)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((int(priority), next(self._counter), ticket, future))
+        self._dispatch()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # 已放行但调用方被取消时归还并发名额
+            if future.done() and not future.cancelled():
+                self.release(ticket)
+            else:
+                future.cancel()
+            raise
+
+    def release(self, ticket: SchedulerTicket, actual_tokens: Optional[int] = None) -> None:
+        """归还并发名额，并按实际 token 用量修正 TPM 令牌桶"""
+        if ticket.released or ticket.granted_at is None:
+            return
+        ticket.released = True
+        self.in_flight = max(0, self.in_flight - 1)
+        if actual_tokens is not None:
+            self.tpm_bucket.adjust(actual_tokens - ticket.reserved_tokens)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, estimated_tokens: int = 0) -> AsyncIterator[SchedulerTicket]:
+        """以上下文管理器形式获取调度许可；可在退出前设置 ticket.actual_tokens 修正用量"""
+        ticket = await self.acquire(priority, estimated_tokens)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket, ticket.actual_tokens)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回队列深度、并发数、令牌余量和各通道等待时间统计"""
+        self.rpm_bucket._refill()
+        self.tpm_bucket._refill()
+        return {
+            "provider": self.name,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self._queue_depth(),
+            "rpm": {"limit": int(self.rpm_bucket.capacity), "available": round(self.rpm_bucket.tokens, 2)},
+            "tpm": {"limit": int(self.tpm_bucket.capacity), "available": round(self.tpm_bucket.tokens, 2)},
+            "granted": {p.name.lower(): self._granted[p] for p in Priority},
+            "aged_grants": self._aged_grants,
+            "wait_seconds": {
+                p.name.lower(): {k: round(v, 4) for k, v in summarize(self._waits[p]).items()}
+                for p in Priority
+            },
+        }
+
+
+class SchedulerRegistry:
+    """按服务商（base_url）维护调度器实例"""
+
+    def __init__(self):
+        self._schedulers: Dict[str, LLMScheduler] = {}
+
+    def get(self, provider: str) -> LLMScheduler:
+        name = provider or "default"
+        scheduler = self._schedulers.get(name)
+        if scheduler is None:
+            scheduler = LLMScheduler(
+                name,
+                rpm=settings.llm_rpm_limit,
+                tpm=settings.llm_tpm_limit,
+                max_concurrency=settings.llm_max_concurrency,
+            )
+            self._schedulers[name] = scheduler
+        return scheduler
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [scheduler.get_stats() for scheduler in self._schedulers.values()]
+
+
+# 全局调度器注册表实例
+scheduler_registry = SchedulerRegistry()
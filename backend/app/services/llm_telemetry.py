@@ -0,0 +1,321 @@
+"""LLM 调用遥测：逐次记录调用耗时与用量到本地追加写日志，并提供聚合查询"""
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from ..config import settings
+from ..utils.config_manager import config_manager
+from ..utils.request_context import current_route, current_call_counter
+from ..utils.stats_util import summarize
+from ..utils.token_util import estimate_tokens
+
+
+class LLMCallRecord:
+    """一次 LLM 调用的遥测数据"""
+
+    def __init__(self, stage: str, model: str, meta: Optional[Dict[str, Any]] = None):
+        meta = meta or {}
+        self.call_id = uuid.uuid4().hex
+        self.route = current_route.get()
+        self.stage = stage
+        self.model = model
+        self.endpoint: Optional[str] = None
+        self.failovers = 0
+        self.upstream_retries = 0  # 因 429 / 5xx / 网络错误重新发起请求的次数
+        self.resumes = 0  # 流在中途断开后续写的次数
+        self.continuations = 0  # 因长度上限被截断后续写的次数
+        self.truncated = False  # 续写次数用完后仍被截断
+        self.retry = int(meta.get("retry", 0))
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self._dispatched: Optional[float] = None
+        self._first_dispatched: Optional[float] = None
+        self._first_token: Optional[float] = None
+        self._end: Optional[float] = None
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.cached_tokens: Optional[int] = None
+        self.prompt_layout = settings.prompt_layout
+        self.usage_source = "estimate"
+        self.estimated_prompt_tokens = 0
+        self.completion_chars: List[str] = []
+        self.token_times: List[float] = []
+        self.status = "aborted"
+        self.error: Optional[str] = None
+        self.cache_hit = False
+        self.cassette_replay = False
+
+    def mark_dispatched(self) -> None:
+        """调度器放行、开始向服务商发送请求"""
+        self._dispatched = time.monotonic()
+        if self._first_dispatched is None:
+            self._first_dispatched = self._dispatched
+
+    @property
+    def dispatched(self) -> bool:
+        """是否真正向服务商发出过请求"""
+        return self._first_dispatched is not None
+
+    def mark_token(self, text: str) -> None:
+        if self._first_token is None:
+            self._first_token = time.monotonic()
+        self.completion_chars.append(text)
+        self.token_times.append(time.monotonic())
+
+    def set_usage(self, usage: Any) -> None:
+        """记录服务商返回的真实用量（续写时一次调用包含多个请求，用量累加）"""
+        if usage is None:
+            return
+        previous = self.usage_source == "usage"
+        self.prompt_tokens = self._add(previous, self.prompt_tokens, getattr(usage, "prompt_tokens", None))
+        self.completion_tokens = self._add(previous, self.completion_tokens, getattr(usage, "completion_tokens", None))
+        self.usage_source = "usage"
+        # 前缀缓存命中的 token 数：OpenAI 为 prompt_tokens_details.cached_tokens，DeepSeek 为 prompt_cache_hit_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        if cached is None:
+            cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        if cached is None and getattr(usage, "model_extra", None):
+            cached = usage.model_extra.get("prompt_cache_hit_tokens")
+        self.cached_tokens = self._add(previous, self.cached_tokens, cached)
+
+    @staticmethod
+    def _add(accumulate: bool, current: Optional[int], value: Optional[int]) -> Optional[int]:
+        """accumulate 为 True 时累加用量，任一方缺失时取另一方"""
+        if not accumulate or current is None:
+            return value
+        if value is None:
+            return current
+        return current + value
+
+    def timed_chunks(self) -> List[tuple]:
+        """返回 (相对首次发出请求的秒数, 分片文本) 列表，用于录制 cassette"""
+        origin = self._first_dispatched if self._first_dispatched is not None else self._start
+        return [(t - origin, text) for t, text in zip(self.token_times, self.completion_chars)]
+
+    def usage_dict(self) -> Optional[Dict[str, Any]]:
+        if self.usage_source != "usage":
+            return None
+        return {"prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens, "cached_tokens": self.cached_tokens}
+
+    def finish(self, status: str = "ok", error: Optional[str] = None) -> None:
+        self._end = time.monotonic()
+        self.status = status
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self._end if self._end is not None else time.monotonic()
+        request_start = self._dispatched if self._dispatched is not None else self._start
+        completion_tokens = self.completion_tokens
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens("".join(self.completion_chars))
+        prompt_tokens = self.prompt_tokens if self.prompt_tokens is not None else self.estimated_prompt_tokens
+        ttft = (self._first_token - request_start) if self._first_token is not None else None
+        generation_time = (end - self._first_token) if self._first_token is not None else 0
+        return {
+            "type": "call",
+            "ts": round(self.started_at, 3),
+            "call_id": self.call_id,
+            "route": self.route,
+            "stage": self.stage,
+            "model": self.model,
+            "endpoint": self.endpoint,
+            "failovers": self.failovers,
+            "upstream_retries": self.upstream_retries,
+            "resumes": self.resumes,
+            "continuations": self.continuations,
+            "truncated": self.truncated,
+            "status": self.status,
+            "error": self.error,
+            "cache_hit": self.cache_hit,
+            "cassette_replay": self.cassette_replay,
+            "retry": self.retry,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "prompt_layout": self.prompt_layout,
+            "usage_source": self.usage_source,
+            "queue_wait_ms": round((request_start - self._start) * 1000, 1),
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "latency_ms": round((end - self._start) * 1000, 1),
+            "tokens_per_sec": round(completion_tokens / generation_time, 2) if generation_time > 0 else None,
+        }
+
+
+class LLMTelemetry:
+    """
+    追加写的 JSON Lines 遥测日志。
+
+    记录先放入内存缓冲，由后台任务每隔 llm_telemetry_flush_interval 秒在线程池中批量写入文件，
+    不在事件循环上做文件 IO；进程退出前调用 flush() 写入剩余记录。
+    """
+
+    def __init__(self, path: str = "", max_bytes: int = 0):
+        self.path = path or os.path.join(config_manager.config_dir, "llm_calls.jsonl")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._buffer: List[str] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def start_call(self, stage: str, model: str, meta: Optional[Dict[str, Any]] = None) -> LLMCallRecord:
+        record = LLMCallRecord(stage, model, meta)
+        if meta is not None:
+            meta["call_id"] = record.call_id
+        return record
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        if not settings.llm_telemetry_enabled:
+            return
+        self._buffer.append(json.dumps(entry, ensure_ascii=False) + "\n")
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 没有事件循环（脚本中直接调用）时同步写入
+            self.flush()
+            return
+        self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(settings.llm_telemetry_flush_interval)
+        await asyncio.to_thread(self.flush)
+
+    def flush(self) -> None:
+        """把缓冲中的记录写入日志文件（阻塞调用）"""
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+            if not lines:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(lines))
+            except OSError:
+                pass  # 遥测写入失败不影响生成
+
+    def record_call(self, record: LLMCallRecord) -> None:
+        counter = current_call_counter.get()
+        if counter is not None and record.dispatched and not record.cache_hit and not record.cassette_replay:
+            counter.calls += 1
+        self._append(record.to_dict())
+
+    def record_json_failure(self, call_id: Optional[str], stage: str, model: str, position: Optional[int], early: bool, error: str) -> None:
+        """记录一次 JSON 结构校验失败（与对应调用通过 call_id 关联）"""
+        self._append({
+            "type": "json_failure",
+            "ts": round(time.time(), 3),
+            "call_id": call_id,
+            "route": current_route.get(),
+            "stage": stage,
+            "model": model,
+            "position": position,
+            "early": early,
+            "error": error,
+        })
+
+    def _read(self, since: float) -> List[Dict[str, Any]]:
+        """
+        读取 since 之后的记录
+
+        从最新的文件末尾往前读，最多读取 llm_telemetry_query_max_bytes 字节，
+        遇到早于 since 的记录即停止（日志按时间顺序追加）。
+        """
+        entries: List[Dict[str, Any]] = []
+        budget = settings.llm_telemetry_query_max_bytes
+        for path in (self.path, self.path + ".1"):
+            if budget <= 0 or not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                start = max(0, size - budget)
+                f.seek(start)
+                data = f.read()
+            budget -= len(data)
+            lines = data.split(b"\n")
+            if start > 0:
+                lines = lines[1:]  # 第一行可能不完整
+            reached_start = False
+            for line in reversed(lines):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("ts", 0) < since:
+                    reached_start = True
+                    break
+                entries.append(entry)
+            if reached_start:
+                break
+        entries.reverse()
+        return entries
+
+    async def aquery(self, hours: float = 24, stage: Optional[str] = None, model: Optional[str] = None) -> Dict[str, Any]:
+        """query 的异步版本：先写入缓冲中的记录，再在线程池中读取与聚合"""
+        await asyncio.to_thread(self.flush)
+        return await asyncio.to_thread(self.query, hours, stage, model)
+
+    def query(self, hours: float = 24, stage: Optional[str] = None, model: Optional[str] = None) -> Dict[str, Any]:
+        """按阶段与模型聚合最近 hours 小时的调用，返回各指标的百分位数"""
+        since = time.time() - hours * 3600
+        groups: Dict[tuple, Dict[str, Any]] = defaultdict(lambda: {
+            "calls": 0, "errors": 0, "aborted": 0, "cancelled": 0, "cache_hits": 0, "retries": 0, "json_failures": 0,
+            "upstream_retries": 0, "resumes": 0, "continuations": 0, "truncated": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+            "ttft_ms": [], "latency_ms": [], "tokens_per_sec": [], "queue_wait_ms": [],
+        })
+        for entry in self._read(since):
+            if stage and entry.get("stage") != stage:
+                continue
+            if model and entry.get("model") != model:
+                continue
+            group = groups[(entry.get("stage"), entry.get("model"))]
+            if entry.get("type") == "json_failure":
+                group["json_failures"] += 1
+                continue
+            group["calls"] += 1
+            if entry.get("cache_hit"):
+                group["cache_hits"] += 1
+                continue
+            if entry.get("status") == "error":
+                group["errors"] += 1
+            elif entry.get("status") == "aborted":
+                group["aborted"] += 1
+            elif entry.get("status") == "cancelled":
+                group["cancelled"] += 1
+            if entry.get("retry"):
+                group["retries"] += 1
+            group["upstream_retries"] += entry.get("upstream_retries") or 0
+            group["resumes"] += entry.get("resumes") or 0
+            group["continuations"] += entry.get("continuations") or 0
+            if entry.get("truncated"):
+                group["truncated"] += 1
+            group["prompt_tokens"] += entry.get("prompt_tokens") or 0
+            group["completion_tokens"] += entry.get("completion_tokens") or 0
+            group["cached_tokens"] += entry.get("cached_tokens") or 0
+            for key in ("ttft_ms", "latency_ms", "tokens_per_sec", "queue_wait_ms"):
+                if entry.get(key) is not None and entry.get("status") == "ok":
+                    group[key].append(entry[key])
+
+        result = []
+        for (group_stage, group_model), data in sorted(groups.items(), key=lambda item: (str(item[0][0]), str(item[0][1]))):
+            item = {"stage": group_stage, "model": group_model}
+            for key, value in data.items():
+                if isinstance(value, list):
+                    item[key] = {k: round(v, 2) for k, v in summarize(value, (50, 90, 99)).items()}
+                else:
+                    item[key] = value
+            item["cached_token_ratio"] = round(data["cached_tokens"] / data["prompt_tokens"], 4) if data["prompt_tokens"] else 0.0
+            result.append(item)
+        return {"hours": hours, "groups": result}
+
+
+# 全局遥测实例
+llm_telemetry = LLMTelemetry(settings.llm_telemetry_path, settings.llm_telemetry_max_bytes)
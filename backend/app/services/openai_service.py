@@ -1,12 +1,30 @@
 """OpenAI服务"""
-import openai
-from typing import Dict, Any, List, AsyncGenerator
+from typing import Dict, Any, List, AsyncGenerator, Optional
 import json
 import asyncio
+import hashlib
+import random
+import time
 
 from ..utils.outline_util import get_random_indexes, calculate_nodes_distribution, generate_one_outline_json_by_level1
-from ..utils.json_util import check_json
+from ..utils.json_util import check_json, repair_json, json_schema_response_format
+from ..utils.json_stream import StreamingJsonValidator
 from ..utils.config_manager import config_manager
+from ..utils.token_util import estimate_messages_tokens, estimate_tokens
+from ..utils.retry_util import CONTINUE_PROMPT, LENGTH_CONTINUE_PROMPT, backoff_delay, trim_overlap
+from ..models.schemas import LLMStage, GenerationPriority
+from ..config import settings
+from .llm_client_registry import client_registry
+from .llm_endpoint_router import endpoint_router, is_endpoint_failure
+from .llm_scheduler import scheduler_registry, resolve_priority, usage_tokens
+from .llm_cache import llm_cache, make_cache_key, cache_enabled_for
+from .llm_metrics import json_validation_stats, json_latency_tracker, hedge_stats, cancellation_stats
+from .llm_telemetry import llm_telemetry
+from .llm_cassette import llm_cassette
+from .llm_capabilities import capability_registry, CompletionStream
+
+# 续写时缓冲的开头字符数，用于去掉与已输出内容重复的部分
+RESUME_HEAD_CHARS = 64
 
 
 class OpenAIService:
@@ -19,17 +37,24 @@ class OpenAIService:
         self.api_key = config.get('api_key', '')
         self.base_url = config.get('base_url', '')
         self.model_name = config.get('model_name', 'gpt-3.5-turbo')
+        # 各阶段单独指定的模型，未指定的阶段使用主模型
+        self.stage_models = config_manager.get_stage_models(config)
 
-        # 初始化OpenAI客户端 - 使用异步客户端
-        self.client = openai.AsyncOpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url if self.base_url else None
-        )
+        # 从全局注册表获取共享的异步客户端，复用已建立的HTTP连接
+        self.client = client_registry.get_client(self.api_key, self.base_url)
+
+        # 可用于生成的端点列表（未配置多端点时只有主配置一个）
+        self.endpoints = endpoint_router.resolve(config_manager.get_endpoints(config))
     
+    def model_for_stage(self, stage: LLMStage = LLMStage.DEFAULT) -> str:
+        """返回指定阶段使用的模型"""
+        return self.stage_models.get(LLMStage(stage).value) or self.model_name
+
     async def get_available_models(self) -> List[str]:
         """获取可用的模型列表"""
         try:
-            models = await self.client.models.list()
+            async with client_registry.in_use(self.client):
+                models = await self.client.models.list()
             chat_models = []
             for model in models.data:
                 model_id = model.id.lower()
@@ -43,40 +68,335 @@ class OpenAIService:
         self, 
         messages: list, 
         temperature: float = 0.7,
-        response_format: dict = None
+        response_format: dict = None,
+        stage: LLMStage = LLMStage.DEFAULT,
+        priority: Optional[GenerationPriority] = None,
+        use_cache: Optional[bool] = None,
+        call_meta: Optional[Dict[str, Any]] = None,
     ) -> AsyncGenerator[str, None]:
-        """流式聊天完成请求 - 真正的异步实现"""
-        try:
-            stream = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=temperature,
-                stream=True,
-                **({"response_format": response_format} if response_format is not None else {})
-            )
-
-            async for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
+        """
+        流式聊天完成请求 - 真正的异步实现
+
+        使用该阶段配置的模型（未配置时为主模型），相同输入优先从本地缓存回放（按 stage 配置或 use_cache 显式开关）；
+        未命中的请求经过服务商级别的调度器排队，受 RPM/TPM 与并发限制，
+        并按 stage / priority 决定所在的优先级通道。
+        配置了多个端点时按延迟与错误率选路，尚未输出任何 token 的失败请求自动转移到其他端点。
+        response_format 为 json_schema 时，只发给探测确认支持的端点，其余端点降级为 json_object。
+        429 / 5xx / 网络错误按带抖动的指数退避重试并遵循 Retry-After；
+        流在中途断开、或正文因长度上限被截断（finish_reason=length）时请模型从已输出的内容接着写，
+        消费方收到的是一条连续的文本流；续写次数用完仍被截断时 call_meta 中会带上 truncated=True。
+        重试耗尽后抛出异常，不会把错误信息混入输出内容。
+        cassette 录制模式下记录每次完整调用及分片时间；回放模式下只从 cassette 回放，不访问网络。
+        每次调用都会写入遥测日志；call_meta 可传入 retry 等附加信息，调用后其中会带上 call_id。
+        """
+        stage_name = LLMStage(stage).value
+        stage_model = self.stage_models.get(stage_name)
+        model_name = stage_model or self.model_name
+        record = llm_telemetry.start_call(stage_name, model_name, call_meta)
+        prompt_tokens = estimate_messages_tokens(messages)
+        record.estimated_prompt_tokens = prompt_tokens
 
+        try:
+            if llm_cassette.replaying:
+                entry = llm_cassette.lookup(make_cache_key(model_name, messages, temperature, response_format))
+                record.cassette_replay = True
+                record.mark_dispatched()
+                async for chunk in llm_cassette.replay(entry):
+                    record.mark_token(chunk)
+                    yield chunk
+                record.finish("ok")
+                return
+
+            use_response_cache = False
+            # 录制时跳过缓存，保证 cassette 中是服务商的真实响应与耗时
+            if not llm_cassette.recording and cache_enabled_for(stage, use_cache):
+                use_response_cache = True
+                # 缓存按实际响应的端点模型区分，查找时依次尝试各端点会使用的模型
+                cached_chunks = await llm_cache.aget_first(
+                    self._cache_keys(stage, messages, temperature, response_format)
+                )
+                if cached_chunks is not None:
+                    record.cache_hit = True
+                    async for chunk in llm_cache.replay(cached_chunks):
+                        record.mark_token(chunk)
+                        yield chunk
+                    record.finish("ok")
+                    return
+
+            reserved_tokens = prompt_tokens + settings.llm_expected_completion_tokens
+
+            chunks: List[str] = []
+            finish_reason: Optional[str] = None
+            attempted = []
+            retries = 0
+            # 因长度上限被截断时在同一端点上续写
+            continue_on: Optional[Any] = None
+            while True:
+                if continue_on is not None:
+                    endpoint, continue_on = continue_on, None
+                    failover = False
+                else:
+                    # 优先换到尚未尝试过的端点；都尝试过后在全部端点中重新选择
+                    untried = [e for e in self.endpoints if e not in attempted]
+                    endpoint = endpoint_router.select(untried or self.endpoints)
+                    failover = bool(attempted) and endpoint not in attempted
+                attempted.append(endpoint)
+                record.endpoint = endpoint.name
+                request_model = stage_model or endpoint.model_name
+                record.model = request_model
+                scheduler = scheduler_registry.get(endpoint.base_url)
+                client = client_registry.get_client(endpoint.api_key, endpoint.base_url)
+                # 按端点能力决定是否使用 json_schema 严格结构化输出、是否流式请求（探测在后台进行，结果出来前按未知处理）
+                capabilities = capability_registry.get(client, endpoint.base_url, request_model)
+                extra_params: Dict[str, Any] = {}
+                request_format = capability_registry.resolve_response_format(capabilities, response_format)
+                if request_format is not None:
+                    extra_params["response_format"] = request_format
+                streaming = capability_registry.use_streaming(capabilities)
+
+                # 流在中途断开或因长度上限被截断后续写：把已输出的内容作为 assistant 消息，请模型接着写
+                resuming = bool(chunks)
+                request_messages = messages
+                if resuming:
+                    request_messages = messages + [
+                        {"role": "assistant", "content": "".join(chunks)},
+                        {"role": "user", "content": LENGTH_CONTINUE_PROMPT if finish_reason == "length" else CONTINUE_PROMPT},
+                    ]
+
+                finish_reason = None
+                outcome: Optional[bool] = None
+                ttft: Optional[float] = None
+                error: Optional[Exception] = None
+                # 登记客户端使用，期间客户端被注册表淘汰也不会关闭，进行中的流不受影响
+                async with client_registry.in_use(client), scheduler.slot(resolve_priority(stage, priority), reserved_tokens) as ticket:
+                    record.mark_dispatched()
+                    endpoint_router.on_dispatch(endpoint, failover=failover)
+                    request_start = time.monotonic()
+                    completion_tokens = 0
+                    attempt_usage = None  # 本次请求服务商返回的用量（续写时 record 中是累加值）
+                    # 续写的开头先缓冲一段，去掉与已输出内容重复的部分后再输出
+                    head = ""
+                    head_checked = not resuming
+                    try:
+                        if streaming:
+                            stream_params = capability_registry.stream_params(endpoint.base_url, request_model)
+                            try:
+                                stream = await client.chat.completions.create(
+                                    model=request_model,
+                                    messages=request_messages,
+                                    temperature=temperature,
+                                    stream=True,
+                                    **extra_params,
+                                    **stream_params
+                                )
+                            except Exception as e:
+                                # 不少兼容端点不认 stream_options 并返回 400：去掉该参数重试一次
+                                if not stream_params or not capability_registry.reject_stream_options(
+                                    endpoint.base_url, request_model, e
+                                ):
+                                    raise
+                                stream = await client.chat.completions.create(
+                                    model=request_model,
+                                    messages=request_messages,
+                                    temperature=temperature,
+                                    stream=True,
+                                    **extra_params
+                                )
+                        else:
+                            stream = CompletionStream(await client.chat.completions.create(
+                                model=request_model,
+                                messages=request_messages,
+                                temperature=temperature,
+                                **extra_params
+                            ))
+                        try:
+                            async for chunk in stream:
+                                if getattr(chunk, "usage", None) is not None:
+                                    attempt_usage = chunk.usage
+                                    record.set_usage(chunk.usage)
+                                if chunk.choices and getattr(chunk.choices[0], "finish_reason", None):
+                                    finish_reason = chunk.choices[0].finish_reason
+                                if not chunk.choices or chunk.choices[0].delta.content is None:
+                                    continue
+                                content = chunk.choices[0].delta.content
+                                if ttft is None:
+                                    ttft = time.monotonic() - request_start
+                                completion_tokens += estimate_tokens(content)
+                                if not head_checked:
+                                    head += content
+                                    if len(head) < RESUME_HEAD_CHARS:
+                                        continue
+                                    content = trim_overlap("".join(chunks), head)
+                                    head_checked = True
+                                    if not content:
+                                        continue
+                                chunks.append(content)
+                                record.mark_token(content)
+                                yield content
+                            if not head_checked and head:
+                                content = trim_overlap("".join(chunks), head)
+                                if content:
+                                    chunks.append(content)
+                                    record.mark_token(content)
+                                    yield content
+                        finally:
+                            # 消费方提前停止时立即关闭上游HTTP流，释放连接
+                            await stream.close()
+                        outcome = True
+                    except Exception as e:
+                        if not is_endpoint_failure(e):
+                            raise
+                        outcome = False
+                        error = e
+                    finally:
+                        # 有服务商返回的 usage 时按真实用量修正 TPM，否则按本地估算
+                        actual = usage_tokens(attempt_usage)
+                        ticket.actual_tokens = actual if actual is not None else prompt_tokens + completion_tokens
+                        endpoint_router.on_complete(endpoint, outcome, ttft)
+                if outcome:
+                    # 输出达到服务商的长度上限：正文在预算内自动续写，结构化输出交由上层校验重试
+                    if finish_reason == "length" and response_format is None and chunks:
+                        if record.continuations < settings.llm_length_continuation_max:
+                            record.continuations += 1
+                            continue_on = endpoint
+                            print(f"输出因长度上限被截断，进行第 {record.continuations}/{settings.llm_length_continuation_max} 次续写")
+                            continue
+                        record.truncated = True
+                        if call_meta is not None:
+                            call_meta["truncated"] = True
+                        print(f"输出因长度上限被截断，已达到续写次数上限({settings.llm_length_continuation_max})")
+                    break
+
+                if chunks:
+                    # 结构化输出无法可靠地续写，交由上层的 JSON 校验重试
+                    if response_format is not None or record.resumes >= settings.llm_resume_max_attempts:
+                        raise error
+                    record.resumes += 1
+                    attempt = record.resumes
+                else:
+                    retries += 1
+                    if retries >= max(1, settings.llm_retry_max_attempts):
+                        raise error
+                    attempt = retries
+                record.upstream_retries += 1
+                failover_available = any(e not in attempted for e in self.endpoints)
+                if failover_available:
+                    record.failovers += 1
+                    delay = 0.0
+                else:
+                    delay = backoff_delay(
+                        attempt,
+                        settings.llm_retry_base_delay,
+                        settings.llm_retry_max_delay,
+                        error,
+                        settings.llm_retry_after_max,
+                    )
+                action = "续写" if chunks else "重试"
+                target = "转移到其他端点" if failover_available else f"{delay:.1f} 秒后{action}"
+                print(f"端点 {endpoint.name} 请求失败（{str(error)}），{target}")
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            record.finish("ok")
+            if llm_cassette.recording:
+                llm_cassette.record(
+                    make_cache_key(model_name, messages, temperature, response_format),
+                    stage_name,
+                    record.model,
+                    record.timed_chunks(),
+                    record.usage_dict(),
+                )
+            # 只缓存完整结束的流（达到续写上限仍被截断的不缓存，重新生成时还有机会写完）
+            if use_response_cache and chunks and not record.truncated:
+                await llm_cache.aput(
+                    make_cache_key(request_model, messages, temperature, response_format),
+                    chunks,
+                    model=request_model,
+                    stage=stage_name,
+                )
+
+        except asyncio.CancelledError:
+            # 调用方被取消（例如客户端断开），上游流已在 finally 中关闭
+            record.finish("cancelled")
+            cancellation_stats.record_llm_cancelled(stage_name, "".join(record.completion_chars))
+            raise
         except Exception as e:
-            yield f"错误: {str(e)}"
+            record.finish("error", str(e))
+            raise
+        finally:
+            llm_telemetry.record_call(record)
+
+    def _cache_keys(
+        self,
+        stage: LLMStage,
+        messages: list,
+        temperature: float,
+        response_format: dict | None,
+    ) -> List[str]:
+        """某次请求在各端点上的缓存 key（按端点实际使用的模型计算，去重后保持端点顺序）"""
+        stage_model = self.stage_models.get(LLMStage(stage).value)
+        models = list(dict.fromkeys(stage_model or e.model_name for e in self.endpoints)) or [self.model_for_stage(stage)]
+        return [make_cache_key(model, messages, temperature, response_format) for model in models]
+
+    async def invalidate_cached_response(
+        self,
+        messages: list,
+        temperature: float = 0.7,
+        response_format: dict | None = None,
+        stage: LLMStage = LLMStage.DEFAULT,
+    ) -> None:
+        """删除某次请求对应的缓存（缓存内容不可用时调用，避免重试命中同一结果）"""
+        await llm_cache.ainvalidate(*self._cache_keys(stage, messages, temperature, response_format))
 
     async def _collect_stream_text(
         self,
         messages: list,
         temperature: float = 0.7,
         response_format: dict | None = None,
+        stage: LLMStage = LLMStage.DEFAULT,
+        use_cache: Optional[bool] = None,
+        validator: Optional[StreamingJsonValidator] = None,
+        call_meta: Optional[Dict[str, Any]] = None,
     ) -> str:
-        """收集流式返回的文本到一个完整字符串"""
-        full_content = ""
-        async for chunk in self.stream_chat_completion(
+        """
+        收集流式返回的文本到一个完整字符串
+
+        传入 validator 时边接收边校验，结构一旦确定错误就停止接收并关闭上游流，返回已收到的部分。
+        """
+        parts: List[str] = []
+        stream = self.stream_chat_completion(
             messages,
             temperature=temperature,
             response_format=response_format,
-        ):
-            full_content += chunk
-        return full_content
+            stage=stage,
+            use_cache=use_cache,
+            call_meta=call_meta,
+        )
+        try:
+            async for chunk in stream:
+                parts.append(chunk)
+                if validator is not None and validator.feed(chunk):
+                    break
+        finally:
+            await stream.aclose()
+        return "".join(parts)
+
+    def _check_or_repair(self, content: str, schema: str | Dict[str, Any], stage_name: str, log_prefix: str = "") -> tuple:
+        """
+        校验输出结构，未通过时先在本地修复（代码块标记、前后说明文字、多余逗号、外层包裹），修复成功则不必重试。
+
+        返回 (内容, 是否通过, 错误信息)；修复成功时内容为修复后的 JSON。
+        """
+        isok, error_msg = check_json(str(content), schema)
+        if isok:
+            return content, True, ""
+        repaired, steps = repair_json(str(content), schema)
+        json_validation_stats.record_repair(stage_name, repaired or "", steps, repaired is not None)
+        if repaired is None:
+            return content, False, error_msg
+        prefix = f"{log_prefix} " if log_prefix else ""
+        print(f"{prefix}输出经本地修复后通过校验（{', '.join(steps)}）")
+        return repaired, True, ""
 
     async def _generate_with_json_check(
         self,
@@ -87,26 +407,74 @@ class OpenAIService:
         response_format: dict | None = None,
         log_prefix: str = "",
         raise_on_fail: bool = True,
+        stage: LLMStage = LLMStage.DEFAULT,
+        use_cache: Optional[bool] = None,
+        hedge: bool = False,
     ) -> str:
         """
         通用的带 JSON 结构校验与重试的生成函数。
 
+        除最后一次尝试外，生成过程中会按模板增量校验，结构一旦确定错误就终止上游流并立即重试；
+        完整输出未通过校验时先尝试本地修复，修复失败才重试。
+        hedge=True 时改为对冲模式，见 _generate_with_hedging。
+
         返回：通过校验的 full_content；如果 raise_on_fail=False，则在多次失败后返回最后一次内容。
         """
+        if hedge:
+            return await self._generate_with_hedging(
+                messages,
+                schema,
+                max_retries=max_retries,
+                temperature=temperature,
+                response_format=response_format,
+                log_prefix=log_prefix,
+                raise_on_fail=raise_on_fail,
+                stage=stage,
+                use_cache=use_cache,
+            )
+
         attempt = 0
         last_error_msg = ""
+        stage_name = LLMStage(stage).value
 
         while True:
+            # 最后一次尝试完整接收，保证 raise_on_fail=False 时返回的是完整输出
+            validator = StreamingJsonValidator(schema) if attempt < max_retries else None
+            call_meta: Dict[str, Any] = {"retry": attempt}
+            started_at = time.monotonic()
             full_content = await self._collect_stream_text(
                 messages,
                 temperature=temperature,
                 response_format=response_format,
+                stage=stage,
+                use_cache=use_cache,
+                validator=validator,
+                call_meta=call_meta,
             )
 
-            isok, error_msg = check_json(str(full_content), schema)
+            early_abort = validator is not None and validator.error is not None
+            if early_abort:
+                isok, error_msg = False, validator.error
+            else:
+                full_content, isok, error_msg = self._check_or_repair(full_content, schema, stage_name, log_prefix)
             if isok:
+                json_validation_stats.record_pass(stage_name, full_content)
+                json_latency_tracker.record(stage_name, time.monotonic() - started_at)
                 return full_content
 
+            json_validation_stats.record_failure(stage_name, full_content, early=early_abort)
+            llm_telemetry.record_json_failure(
+                call_meta.get("call_id"),
+                stage_name,
+                self.model_for_stage(stage),
+                validator.error_position if early_abort else None,
+                early_abort,
+                error_msg,
+            )
+
+            # 未通过校验的结果不能留在缓存中，否则重试会再次命中
+            await self.invalidate_cached_response(messages, temperature, response_format, stage)
+
             last_error_msg = error_msg
             prefix = f"{log_prefix} " if log_prefix else ""
 
@@ -118,9 +486,136 @@ class OpenAIService:
                 return full_content
 
             attempt += 1
+            if early_abort:
+                print(f"{prefix}流式校验在第 {validator.error_position} 个字符处失败，立即进行第 {attempt}/{max_retries} 次重试：{last_error_msg}")
+                continue
             print(f"{prefix}check_json 校验失败，进行第 {attempt}/{max_retries} 次重试：{last_error_msg}")
             await asyncio.sleep(0.5)
 
+    async def _generate_with_hedging(
+        self,
+        messages: list,
+        schema: str | Dict[str, Any],
+        max_retries: int = 3,
+        temperature: float = 0.7,
+        response_format: dict | None = None,
+        log_prefix: str = "",
+        raise_on_fail: bool = True,
+        stage: LLMStage = LLMStage.DEFAULT,
+        use_cache: Optional[bool] = None,
+    ) -> str:
+        """
+        对冲模式的 JSON 生成。
+
+        当最早的候选耗时超过该阶段历史成功耗时的百分位、或某个候选校验失败时，并行发起新的候选；
+        采用第一个通过 check_json 的结果并取消其余候选。额外候选数受 outline_hedge_max_extra 限制，
+        失败重试次数仍受 max_retries 限制。
+        """
+        stage_name = LLMStage(stage).value
+        prefix = f"{log_prefix} " if log_prefix else ""
+        hedge_budget = max(0, settings.outline_hedge_max_extra)
+        failures = 0
+        last_content = ""
+        last_error_msg = ""
+        running: Dict[asyncio.Task, float] = {}
+
+        async def run_candidate(final: bool, retry: int) -> tuple:
+            # 重试预算内的最后一个候选完整接收，保证失败时返回完整输出
+            validator = None if final else StreamingJsonValidator(schema)
+            call_meta: Dict[str, Any] = {"retry": retry}
+            content = await self._collect_stream_text(
+                messages,
+                temperature=temperature,
+                response_format=response_format,
+                stage=stage,
+                use_cache=use_cache,
+                validator=validator,
+                call_meta=call_meta,
+            )
+            if validator is not None and validator.error is not None:
+                error_msg = validator.error
+                llm_telemetry.record_json_failure(
+                    call_meta.get("call_id"), stage_name, self.model_for_stage(stage), validator.error_position, True, error_msg
+                )
+                return content, False, error_msg, True
+            content, isok, error_msg = self._check_or_repair(content, schema, stage_name, log_prefix)
+            if not isok:
+                llm_telemetry.record_json_failure(
+                    call_meta.get("call_id"), stage_name, self.model_for_stage(stage), None, False, error_msg
+                )
+            return content, isok, error_msg, False
+
+        def launch() -> asyncio.Task:
+            final = failures + len(running) >= max_retries
+            task = asyncio.create_task(run_candidate(final, failures + len(running)))
+            running[task] = time.monotonic()
+            hedge_stats.record(stage_name, candidates=1)
+            return task
+
+        hedge_stats.record(stage_name, calls=1)
+        first_task = launch()
+        try:
+            while running:
+                timeout = None
+                if hedge_budget > 0 and failures <= max_retries:
+                    threshold = json_latency_tracker.percentile(
+                        stage_name,
+                        settings.outline_hedge_percentile,
+                        min_samples=settings.outline_hedge_min_samples,
+                    )
+                    if threshold is None:
+                        threshold = settings.outline_hedge_default_delay
+                    timeout = max(0.0, min(running.values()) + threshold - time.monotonic())
+
+                done, _ = await asyncio.wait(list(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_budget -= 1
+                    hedge_stats.record(stage_name, hedges_on_latency=1)
+                    print(f"{prefix}生成耗时超过阈值，发起对冲请求")
+                    launch()
+                    continue
+
+                for task in done:
+                    started_at = running.pop(task)
+                    try:
+                        content, isok, error_msg, early_abort = task.result()
+                    except Exception as e:
+                        content, isok, error_msg, early_abort = "", False, str(e), False
+                    if isok:
+                        json_validation_stats.record_pass(stage_name, content)
+                        json_latency_tracker.record(stage_name, time.monotonic() - started_at)
+                        if task is not first_task:
+                            hedge_stats.record(stage_name, won_by_hedge=1)
+                        return content
+
+                    json_validation_stats.record_failure(stage_name, content, early=early_abort)
+                    await self.invalidate_cached_response(messages, temperature, response_format, stage)
+                    failures += 1
+                    last_content, last_error_msg = content, error_msg
+                    print(f"{prefix}候选校验失败（{failures}/{max_retries + 1}）：{error_msg}")
+
+                if failures > max_retries:
+                    continue
+                if not running:
+                    launch()
+                    # 失败说明该提示词容易偏离结构，额外并行一个候选
+                    if hedge_budget > 0 and failures + len(running) <= max_retries:
+                        hedge_budget -= 1
+                        hedge_stats.record(stage_name, hedges_on_failure=1)
+                        launch()
+        finally:
+            pending = [task for task in running if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                hedge_stats.record(stage_name, cancelled=len(pending))
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        print(f"{prefix}check_json 校验失败，已达到最大重试次数({max_retries})：{last_error_msg}")
+        if raise_on_fail:
+            raise Exception(f"{prefix}check_json 校验失败: {last_error_msg}")
+        return last_content
+
     async def generate_content_for_outline(self, outline: Dict[str, Any], project_overview: str = "") -> Dict[str, Any]:
         """为目录结构生成内容"""
         try:
@@ -164,20 +659,24 @@ class OpenAIService:
             if is_leaf:
                 # 为叶子节点生成内容，传递同级章节信息
                 content = ""
+                result_meta: Dict[str, Any] = {}
                 async for chunk in self._generate_chapter_content(
                     chapter, 
                     current_parent_chapters[:-1],  # 上级章节列表（排除当前章节）
                     chapters,  # 同级章节列表
-                    project_overview
+                    project_overview,
+                    result_meta=result_meta
                 ):
                     content += chunk
                 if content:
                     chapter['content'] = content
+                if result_meta.get('truncated'):
+                    chapter['truncated'] = True
             else:
                 # 递归处理子章节
                 await self._process_outline_recursive(chapter['children'], current_parent_chapters, project_overview)
     
-    async def _generate_chapter_content(self, chapter: dict, parent_chapters: list = None, sibling_chapters: list = None, project_overview: str = "") -> AsyncGenerator[str, None]:
+    async def _generate_chapter_content(self, chapter: dict, parent_chapters: list = None, sibling_chapters: list = None, project_overview: str = "", priority: Optional[GenerationPriority] = None, use_cache: Optional[bool] = None, result_meta: Optional[Dict[str, Any]] = None) -> AsyncGenerator[str, None]:
         """
         为单个章节流式生成内容
 
@@ -186,6 +685,9 @@ class OpenAIService:
             parent_chapters: 上级章节列表，每个元素包含章节id、标题和描述
             sibling_chapters: 同级章节列表，避免内容重复
             project_overview: 项目概述信息，提供项目背景和要求
+            priority: 调度优先级，默认按批量生成处理
+            use_cache: 是否使用响应缓存，None 表示按阶段配置
+            result_meta: 传入字典时，生成结束后其中带上 truncated（续写次数用完仍被长度上限截断）
 
         Yields:
             生成的内容流
@@ -227,6 +729,11 @@ class OpenAIService:
             project_info = ""
             if project_overview.strip():
                 project_info = f"项目概述信息：\n{project_overview}\n\n"
+
+            if settings.prompt_layout == "prefix_cache":
+                # 前缀缓存布局：项目概述并入系统提示词，同一份标书的所有章节共享逐字节一致的前缀
+                system_prompt = f"{system_prompt}\n{project_info}".rstrip() + "\n"
+                project_info = ""
             
             user_prompt = f"""请为以下标书章节生成具体内容：
 
@@ -244,20 +751,52 @@ class OpenAIService:
             ]
 
             # 流式返回生成的文本
-            async for chunk in self.stream_chat_completion(messages, temperature=0.7):
+            async for chunk in self.stream_chat_completion(
+                messages,
+                temperature=0.7,
+                stage=LLMStage.CHAPTER_CONTENT,
+                priority=priority,
+                use_cache=use_cache,
+                call_meta=result_meta,
+            ):
                 yield chunk
 
         except Exception as e:
             print(f"生成章节内容时出错: {str(e)}")
-            yield f"错误: {str(e)}"
+            raise
             
-    async def generate_outline_v2(self, overview: str, requirements: str) -> Dict[str, Any]:
-        schema_json = json.dumps([
-            {
-                "rating_item": "原评分项",
-                "new_title": "根据评分项修改的标题",
-            }
-        ])
+    async def generate_outline_v2(self, overview: str, requirements: str, use_cache: Optional[bool] = None) -> Dict[str, Any]:
+        """生成完整目录，各一级章节按一级提纲的顺序排列"""
+        outline: List[Any] = []
+        events = self.generate_outline_v2_events(overview, requirements, use_cache=use_cache)
+        try:
+            async for event in events:
+                if event["type"] == "level1":
+                    outline = [None] * len(event["outline"])
+                else:
+                    outline[event["index"]] = event["chapter"]
+        finally:
+            await events.aclose()
+        return {"outline": outline}
+
+    async def generate_outline_v2_events(
+        self, overview: str, requirements: str, use_cache: Optional[bool] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        逐步生成目录
+
+        一级提纲通过校验后立即产生 {"type": "level1", "outline": [...]}；之后各一级章节并发补全，
+        按完成先后产生 {"type": "chapter", "index": 序号, "chapter": {...}}。生成器提前关闭时取消未完成的章节。
+        """
+        # 顶层使用对象包裹列表：json_object / json_schema 模式都要求顶层是对象
+        schema_json = json.dumps({
+            "outline": [
+                {
+                    "rating_item": "原评分项",
+                    "new_title": "根据评分项修改的标题",
+                }
+            ]
+        })
 
         system_prompt = f"""
             ### 角色
@@ -301,34 +840,48 @@ class OpenAIService:
             schema=schema_json,
             max_retries=3,
             temperature=0.7,
-            response_format={"type": "json_object"},
+            response_format=json_schema_response_format(schema_json, "outline_level1"),
             log_prefix="一级提纲",
             raise_on_fail=True,
+            stage=LLMStage.OUTLINE_L1,
+            use_cache=use_cache,
+            hedge=settings.outline_hedge_enabled,
         )
 
         # 通过校验后再进行 JSON 解析
-        level_l1 = json.loads(full_content.strip())
+        level_l1 = json.loads(full_content.strip())["outline"]
+        yield {"type": "level1", "outline": level_l1}
 
         expected_word_count = 100000
         leaf_node_count = expected_word_count // 1500
         
-        # 随机重点章节
-        index1, index2 = get_random_indexes(len(level_l1))
+        # 随机重点章节（录制/回放 cassette 时按输入固定种子，保证两次运行的提示词一致）
+        rng = None
+        if llm_cassette.recording or llm_cassette.replaying:
+            rng = random.Random(hashlib.sha256(f"{overview}\n{requirements}".encode("utf-8")).hexdigest())
+        index1, index2 = get_random_indexes(len(level_l1), rng)
 
         nodes_distribution = calculate_nodes_distribution(len(level_l1), (index1, index2), leaf_node_count)
         
-        # 并发生成每个一级节点的提纲，保持结果顺序
-        tasks = [
-            self.process_level1_node(i, level1_node, nodes_distribution, level_l1, overview, requirements)
-            for i, level1_node in enumerate(level_l1)
-        ]
-        outline = await asyncio.gather(*tasks)
-        
-        
-        
-        return {"outline": outline}
+        async def run_node(i: int, level1_node: Dict[str, Any]) -> tuple:
+            chapter = await self.process_level1_node(
+                i, level1_node, nodes_distribution, level_l1, overview, requirements, use_cache=use_cache
+            )
+            return i, chapter
+
+        # 并发生成每个一级节点的提纲，按完成先后输出（带序号）
+        tasks = [asyncio.ensure_future(run_node(i, level1_node)) for i, level1_node in enumerate(level_l1)]
+        try:
+            for future in asyncio.as_completed(tasks):
+                i, chapter = await future
+                yield {"type": "chapter", "index": i, "chapter": chapter}
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
     
-    async def process_level1_node(self, i, level1_node, nodes_distribution, level_l1, overview, requirements):
+    async def process_level1_node(self, i, level1_node, nodes_distribution, level_l1, overview, requirements, use_cache: Optional[bool] = None):
         """处理单个一级节点的函数"""
 
         # 生成json
@@ -340,6 +893,29 @@ class OpenAIService:
                             for j, node in enumerate(level_l1) 
                             if j!= i])
 
+        if settings.prompt_layout == "prefix_cache":
+            messages = self._build_level1_node_prefix_messages(json_outline, other_outline, overview, requirements)
+        else:
+            messages = self._build_level1_node_messages(json_outline, other_outline, overview, requirements)
+
+        # 使用通用方法进行 JSON 校验与重试（失败时不抛异常，保持原有“返回最后一次结果”的行为）
+        full_content = await self._generate_with_json_check(
+            messages=messages,
+            schema=json_outline,
+            max_retries=3,
+            temperature=0.7,
+            response_format=json_schema_response_format(json_outline, "outline_chapter"),
+            log_prefix=f"第{i+1}章",
+            raise_on_fail=False,
+            stage=LLMStage.OUTLINE_DETAIL,
+            use_cache=use_cache,
+            hedge=settings.outline_hedge_enabled,
+        )
+
+        return json.loads(full_content.strip())
+
+    def _build_level1_node_messages(self, json_outline, other_outline, overview, requirements) -> list:
+        """一级节点补全的提示词（原有布局：本章节的 JSON 模板在系统提示词中）"""
         system_prompt = f"""
     ### 角色
     你是专业的标书编写专家，擅长根据项目需求编写标书。
@@ -379,20 +955,58 @@ class OpenAIService:
     直接返回json，不要任何额外说明或格式标记
 
     """
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
 
-        # 使用通用方法进行 JSON 校验与重试（失败时不抛异常，保持原有“返回最后一次结果”的行为）
-        full_content = await self._generate_with_json_check(
-            messages=messages,
-            schema=json_outline,
-            max_retries=3,
-            temperature=0.7,
-            response_format={"type": "json_object"},
-            log_prefix=f"第{i+1}章",
-            raise_on_fail=False,
-        )
+    def _build_level1_node_prefix_messages(self, json_outline, other_outline, overview, requirements) -> list:
+        """
+        一级节点补全的提示词（前缀缓存布局）
+
+        说明、项目概述和评分要求在所有一级节点之间逐字节一致，放在最前面；
+        本章节的 JSON 模板和其他章节标题放在最后一条消息中。
+        """
+        system_prompt = f"""
+    ### 角色
+    你是专业的标书编写专家，擅长根据项目需求编写标书。
+    
+    ### 任务
+    1. 根据得到项目概述(overview)、评分要求(requirements)补全标书的提纲的二三级目录
+    
+    ### 说明
+    1. 你将会得到一段json，这是提纲的其中一个章节，你需要再原结构上补全标题(title)和描述(description)
+    2. 二级标题根据一级标题撰写,三级标题根据二级标题撰写
+    3. 补全的内容要参考项目概述(overview)、评分要求(requirements)等项目信息
+    4. 你还会收到其他章节的标题(other_outline)，你需要确保本章节的内容不会包含其他章节的内容
+    
+    ### 注意事项
+    在原json上补全信息，禁止修改json结构，禁止修改一级标题
+
+    ### 项目信息
 
-        return json.loads(full_content.strip())
\ No newline at end of file
+    <overview>
+    {overview}
+    </overview>
+
+    <requirements>
+    {requirements}
+    </requirements>
+
+    """
+        user_prompt = f"""
+    <other_outline>
+    {other_outline}
+    </other_outline>
+
+    ### Output Format in JSON
+    {json_outline}
+
+
+    直接返回json，不要任何额外说明或格式标记
+
+    """
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
\ No newline at end of file
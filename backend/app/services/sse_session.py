@@ -0,0 +1,115 @@
+"""SSE 连接管理：客户端断开时取消生成、心跳保活，以及基于 stream_hub 的可续传 / 可共享响应"""
+import asyncio
+from typing import Any, AsyncGenerator, Callable, Optional
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from ..config import settings
+from ..utils.request_context import current_route
+from ..utils.sse import SSE_HEARTBEAT, SSEFrame, coalesce_frames, sse_response
+from .llm_metrics import cancellation_stats
+from .stream_hub import stream_hub, generation_key
+
+# 检查客户端是否断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    """轮询直到客户端断开"""
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def cancel_on_disconnect(
+    generator: AsyncGenerator[SSEFrame, Any],
+    request: Request,
+    heartbeat_interval: float = 0,
+) -> AsyncGenerator[SSEFrame, None]:
+    """
+    在客户端断开时取消生成器。
+
+    每个分片都与断开检测并发等待：客户端一旦断开，正在等待上游的生成器会在其挂起处收到 CancelledError，
+    从而逐层执行 finally，关闭上游 HTTP 流并取消后台任务，而不是等到下一次写出失败才发现。
+    heartbeat_interval > 0 时，生成器超过该时间没有输出就发送一次心跳注释，防止代理因空闲断开连接。
+    """
+    route = current_route.get()
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    next_item: Optional[asyncio.Future] = None
+    timeout = heartbeat_interval if heartbeat_interval > 0 else None
+    try:
+        while True:
+            if next_item is None:
+                next_item = asyncio.ensure_future(generator.__anext__())
+            await asyncio.wait({next_item, watcher}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if watcher.done():
+                cancellation_stats.record_disconnect(route)
+                return
+            if not next_item.done():
+                yield SSE_HEARTBEAT
+                continue
+            try:
+                item = next_item.result()
+            except StopAsyncIteration:
+                return
+            next_item = None
+            yield item
+    except asyncio.CancelledError:
+        # 服务器自身检测到断开并取消了响应任务
+        cancellation_stats.record_disconnect(route)
+        raise
+    finally:
+        watcher.cancel()
+        if next_item is not None and not next_item.done():
+            next_item.cancel()
+            await asyncio.gather(next_item, return_exceptions=True)
+        await generator.aclose()
+
+
+def resumable_sse_response(
+    request: Request,
+    factory: Callable[[], AsyncGenerator[SSEFrame, Any]],
+    fingerprint: Any = None,
+) -> StreamingResponse:
+    """
+    可断点续传的 SSE 响应。
+
+    请求头带有有效的 Last-Event-ID，且原有的流由同一接口、相同请求内容发起时，直接订阅原有的流，补发之后的事件并继续推送；
+    否则调用 factory 创建生成器，在后台开始一次新的生成。每个事件都带有 "<stream_id>:<序号>" 形式的 id，
+    流 id 同时通过 X-Stream-Id 响应头返回。客户端断开只会解除订阅，所有订阅者都断开且超过宽限期无人重连才取消生成。
+
+    请求头带有 Idempotency-Key，或传入了 fingerprint（请求内容）时，生成 id 由接口路径加幂等键/指纹计算：
+    相同的请求会订阅进行中的同一次生成，从头补发已产生的事件后继续接收。
+    只有显式的幂等键会在生成成功结束后的短时间内直接取回结果；按指纹只共享进行中的生成，
+    用户再次点击生成时仍会得到新的结果。
+    """
+    route = request.url.path
+    request_fingerprint = generation_key(route, fingerprint) if fingerprint is not None else None
+    session, after = None, 0
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        session, after = stream_hub.resume(last_event_id, route, request_fingerprint)
+    share_key = None
+    reuse_completed = False
+    idempotency_key = request.headers.get("idempotency-key")
+    if idempotency_key:
+        share_key = generation_key(route, {"idempotency_key": idempotency_key})
+        reuse_completed = True
+    elif request_fingerprint is not None:
+        share_key = request_fingerprint
+    if session is None and share_key is not None:
+        session = stream_hub.join(share_key, reuse_completed)
+    if session is None:
+        session = stream_hub.start(factory(), share_key, route, request_fingerprint)
+    # 订阅在创建响应时登记，在响应结束时（包括事件尚未开始发送就断开）解除，
+    # 最后一个订阅者离开后经过 stream_detach_grace 秒取消生成
+    session.attach()
+    return sse_response(
+        cancel_on_disconnect(
+            stream_hub.subscribe(session, after, coalesce_frames),
+            request,
+            settings.sse_heartbeat_interval,
+        ),
+        extra_headers={"X-Stream-Id": session.stream_id},
+        on_close=session.detach,
+    )
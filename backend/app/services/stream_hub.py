@@ -0,0 +1,348 @@
+"""
+可续传、可共享的 SSE 流：生成过程与 HTTP 连接解耦，事件保存在有界环形缓冲区中，
+断线后按 Last-Event-ID 补发；相同请求（或相同幂等键）的后来者订阅进行中的同一次生成，
+生成结束后的一段时间内直接取回结果
+"""
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncGenerator, Callable, Deque, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..utils.request_context import CallCounter, current_call_counter
+
+# 生成过程中出错时各接口发送的错误事件标记（见 utils.sse.sse_error），出错的结果不会被复用
+_ERROR_MARKER = b'"status":"error"'
+
+# 一批待发送的事件：[(序号, 不带 id 行的事件)]
+EventBatch = List[Tuple[int, bytes]]
+
+
+def generation_key(route: str, payload: Any) -> str:
+    """按接口与请求内容计算生成 id，内容完全相同的请求共享同一次生成"""
+    text = json.dumps([route, payload], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class StreamSession:
+    """
+    一次生成对应的流。
+
+    生成器在后台任务中运行，产生的每个 SSE 事件编号后写入环形缓冲区；订阅者（HTTP 连接）只从缓冲区读取，
+    上游 LLM 流始终全速读取，不受慢速客户端影响。缓冲区按事件数和字节数限长，超出时丢弃最早的事件。
+    最后一个订阅者断开后等待 stream_detach_grace 秒，期间没有重连才取消生成，释放上游 LLM 调用。
+    """
+
+    def __init__(
+        self,
+        stream_id: str,
+        generator: AsyncGenerator[Any, Any],
+        max_events: int,
+        key: Optional[str] = None,
+        route: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+    ):
+        self.stream_id = stream_id
+        self.key = key  # 生成 id，为 None 时不与其他请求共享
+        self.route = route  # 发起生成的接口路径
+        self.fingerprint = fingerprint  # 请求内容的哈希，续传时用于确认是同一个请求
+        self.events: Deque[Tuple[int, bytes]] = deque()  # (序号, 已编码的事件)
+        self.max_events = max(1, max_events)
+        self.next_seq = 1
+        self.bytes = 0
+        self.dropped = 0  # 因超出缓冲区被丢弃的事件数
+        self.finished = False
+        self.finished_at: Optional[float] = None
+        self.failed = False  # 生成出错或被取消，结果不可复用
+        self.created_at = time.monotonic()
+        self.subscribers = 0
+        self.joined = 0  # 共享进行中生成的订阅者数
+        self.llm_calls = CallCounter()
+        self._generator = generator
+        self._changed = asyncio.Event()
+        self._grace_timer: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+        self._hub: Optional["StreamHub"] = None
+
+    def start(self, hub: "StreamHub") -> None:
+        self._hub = hub
+        self._task = asyncio.ensure_future(self._run(hub))
+        self._task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        # 任务在开始运行之前就被取消时 _run 的 finally 不会执行，这里补上结束标记，
+        # 否则流永远处于进行中，既不会过期也不会被内存上限淘汰
+        if not self.finished:
+            self.failed = True
+            self.finished = True
+            self.finished_at = time.monotonic()
+            self._notify()
+
+    async def _run(self, hub: "StreamHub") -> None:
+        current_call_counter.set(self.llm_calls)
+        try:
+            async for event in self._generator:
+                self._append(event)
+                hub.enforce_memory_cap()
+        except asyncio.CancelledError:
+            self.failed = True
+        except Exception:
+            self.failed = True
+        finally:
+            await self._generator.aclose()
+            self.finished = True
+            self.finished_at = time.monotonic()
+            hub.stats["llm_calls_saved"] += self.joined * self.llm_calls.calls
+            self._notify()
+
+    def _append(self, event: Any) -> None:
+        if isinstance(event, str):
+            event = event.encode("utf-8")
+        if not self.failed and _ERROR_MARKER in event:
+            self.failed = True
+        self.events.append((self.next_seq, event))
+        self.next_seq += 1
+        self.bytes += len(event)
+        max_bytes = settings.stream_buffer_stream_bytes
+        while len(self.events) > self.max_events or (self.bytes > max_bytes and len(self.events) > 1):
+            self.drop_oldest()
+        self._notify()
+
+    def drop_oldest(self) -> None:
+        _, event = self.events.popleft()
+        self.bytes -= len(event)
+        self.dropped += 1
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def first_seq(self) -> int:
+        return self.events[0][0] if self.events else self.next_seq
+
+    def attach(self) -> None:
+        self.subscribers += 1
+        if self._grace_timer is not None:
+            self._grace_timer.cancel()
+            self._grace_timer = None
+
+    def detach(self) -> None:
+        self.subscribers = max(0, self.subscribers - 1)
+        if self.subscribers > 0 or self.finished:
+            return
+        grace = settings.stream_detach_grace
+        if grace <= 0:
+            self.cancel()
+        else:
+            self._grace_timer = asyncio.get_running_loop().call_later(grace, self.cancel)
+
+    def cancel(self) -> None:
+        """取消后台生成（没有订阅者时由宽限期定时器调用）"""
+        self._grace_timer = None
+        if self.subscribers == 0 and self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def with_id(self, seq: int, event: bytes) -> bytes:
+        """给事件加上 "id: <stream_id>:<序号>" 行"""
+        return b"id: %s:%d\n%s" % (self.stream_id.encode("ascii"), seq, event)
+
+    async def events_after(self, seq: int) -> AsyncGenerator[EventBatch, None]:
+        """从编号 seq 之后开始，每次取出当前积压的全部事件，生成结束且全部取出后返回"""
+        while True:
+            changed = self._changed
+            first = self.first_seq()
+            pending: EventBatch = []
+            if seq + 1 < first:
+                # 部分事件在发出前已被环形缓冲区淘汰（断线时间过长或读取过慢）
+                pending.append((first - 1, b'data: {"status":"gap","missed_events":%d}\n\n' % (first - seq - 1)))
+                if self._hub is not None:
+                    self._hub.stats["gaps"] += 1
+            # 从尾部向前取出尚未发送的事件
+            tail = []
+            for n, event in reversed(self.events):
+                if n <= seq:
+                    break
+                tail.append((n, event))
+            tail.reverse()
+            pending.extend(tail)
+            if pending:
+                seq = pending[-1][0]
+                yield pending
+                continue
+            if self.finished:
+                return
+            await changed.wait()
+
+
+class StreamHub:
+    """
+    可续传流的注册表。
+
+    事件 id 的格式为 "<stream_id>:<序号>"，客户端重连时带上 Last-Event-ID 即可找到对应的流并补发之后的事件。
+    订阅者积压的事件数达到 stream_slow_consumer_lag 时视为慢速客户端，积压的文本事件合并后一次写出。
+    带生成 id 启动的流可被相同请求共享：后来的订阅者从第一个事件开始补发并继续接收，上游只生成一次；
+    成功结束的流在 idempotency_result_ttl 秒内可由 join(reuse_completed=True) 直接取回（只用于显式的幂等键）。缓冲区已丢弃过事件的流无法完整补发，不再共享。
+    已结束的流保留 stream_buffer_ttl 秒；缓冲区总大小超过 stream_buffer_max_bytes 时，
+    先淘汰最早结束的流，仍超出则从占用最大的流中丢弃最早的事件。
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, StreamSession] = {}
+        self._by_key: Dict[str, str] = {}  # 生成 id -> 最近一次启动的流
+        self.stats: Dict[str, int] = {
+            "started": 0, "shared": 0, "replayed_completed": 0, "llm_calls_saved": 0,
+            "resumed": 0, "resume_misses": 0, "resume_mismatches": 0, "expired": 0, "evicted": 0, "gaps": 0,
+            "slow_consumer_events": 0, "coalesced_frames": 0, "max_lag_events": 0,
+        }
+
+    def start(
+        self,
+        generator: AsyncGenerator[Any, Any],
+        key: Optional[str] = None,
+        route: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+    ) -> StreamSession:
+        """
+        在后台开始一次生成；传入生成 id 时，之后的相同请求可通过 join 共享。
+        route / fingerprint 记录发起生成的接口与请求内容，续传时据此校验
+        """
+        self._expire()
+        session = StreamSession(
+            uuid.uuid4().hex[:16], generator, settings.stream_buffer_events, key, route, fingerprint
+        )
+        self._sessions[session.stream_id] = session
+        if key is not None:
+            self._by_key[key] = session.stream_id
+        session.start(self)
+        self.stats["started"] += 1
+        return session
+
+    def join(self, key: str, reuse_completed: bool = True) -> Optional[StreamSession]:
+        """
+        查找生成 id 对应的可完整补发的流：进行中的流直接共享；
+        reuse_completed 为 True 时，成功结束不超过 idempotency_result_ttl 秒的流也会被取回
+        """
+        self._expire()
+        session = self._sessions.get(self._by_key.get(key, ""))
+        if session is None or session.dropped:
+            return None
+        if not session.finished:
+            session.joined += 1
+            self.stats["shared"] += 1
+            return session
+        if (
+            reuse_completed
+            and not session.failed
+            and time.monotonic() - session.finished_at < settings.idempotency_result_ttl
+        ):
+            self.stats["replayed_completed"] += 1
+            self.stats["llm_calls_saved"] += session.llm_calls.calls
+            return session
+        return None
+
+    def resume(
+        self, last_event_id: str, route: Optional[str] = None, fingerprint: Optional[str] = None
+    ) -> Tuple[Optional[StreamSession], int]:
+        """
+        按 Last-Event-ID 查找流；返回 (流, 客户端已收到的最后序号)，找不到时流为 None
+
+        流 id 之外还要求接口路径与请求内容指纹一致，防止别的请求带着旧的 Last-Event-ID 读到不相干的结果；
+        不一致时按找不到处理，由调用方开始新的生成
+        """
+        self._expire()
+        stream_id, _, seq = last_event_id.strip().partition(":")
+        session = self._sessions.get(stream_id)
+        if session is not None and (session.route != route or session.fingerprint != fingerprint):
+            self.stats["resume_mismatches"] += 1
+            session = None
+        if session is None or not seq.isdigit():
+            self.stats["resume_misses"] += 1
+            return None, 0
+        self.stats["resumed"] += 1
+        return session, int(seq)
+
+    async def subscribe(
+        self,
+        session: StreamSession,
+        after: int = 0,
+        coalesce: Optional[Callable[[EventBatch], EventBatch]] = None,
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        读取一个流的事件
+
+        每次把积压的事件拼接成一次写出；积压达到慢速客户端阈值时先用 coalesce 合并事件（见 utils.sse.coalesce_frames，由 services.sse_session 传入）。
+        订阅者计数不在这里维护：生成器可能在开始迭代之前就被丢弃，finally 不一定执行，
+        调用方应在创建响应时 session.attach()，并在响应结束（包括未开始发送就断开）时 session.detach()。
+        """
+        async for batch in session.events_after(after):
+            lag = len(batch)
+            if lag > self.stats["max_lag_events"]:
+                self.stats["max_lag_events"] = lag
+            if lag >= settings.stream_slow_consumer_lag:
+                self.stats["slow_consumer_events"] += 1
+                if coalesce is not None:
+                    merged = coalesce(batch)
+                    self.stats["coalesced_frames"] += lag - len(merged)
+                    batch = merged
+            if len(batch) == 1:
+                yield session.with_id(*batch[0])
+            else:
+                yield b"".join(session.with_id(n, event) for n, event in batch)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        ttl = settings.stream_buffer_ttl
+        for stream_id, session in list(self._sessions.items()):
+            if session.finished and session.subscribers == 0 and now - session.finished_at >= ttl:
+                self._remove(session)
+                self.stats["expired"] += 1
+
+    def _remove(self, session: StreamSession) -> None:
+        del self._sessions[session.stream_id]
+        if session.key is not None and self._by_key.get(session.key) == session.stream_id:
+            del self._by_key[session.key]
+
+    def total_bytes(self) -> int:
+        return sum(session.bytes for session in self._sessions.values())
+
+    def enforce_memory_cap(self) -> None:
+        cap = settings.stream_buffer_max_bytes
+        total = self.total_bytes()
+        if total <= cap:
+            return
+        finished = sorted(
+            (s for s in self._sessions.values() if s.finished and s.subscribers == 0),
+            key=lambda s: s.finished_at,
+        )
+        for session in finished:
+            if total <= cap:
+                return
+            total -= session.bytes
+            self._remove(session)
+            self.stats["evicted"] += 1
+        while total > cap:
+            largest = max(self._sessions.values(), key=lambda s: s.bytes, default=None)
+            if largest is None or len(largest.events) <= 1:
+                return
+            before = largest.bytes
+            largest.drop_oldest()
+            total -= before - largest.bytes
+
+    def get_stats(self) -> Dict[str, Any]:
+        sessions: List[StreamSession] = list(self._sessions.values())
+        return {
+            **self.stats,
+            "active": sum(1 for s in sessions if not s.finished),
+            "shared_active": sum(1 for s in sessions if not s.finished and s.subscribers > 1),
+            "buffered": len(sessions),
+            "subscribers": sum(s.subscribers for s in sessions),
+            "buffer_bytes": self.total_bytes(),
+            "dropped_events": sum(s.dropped for s in sessions),
+        }
+
+
+# 全局可续传流注册表实例
+stream_hub = StreamHub()
@@ -1,7 +1,7 @@
 """配置管理工具"""
 import json
 import os
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 
 class ConfigManager:
@@ -14,6 +14,9 @@ class ConfigManager:
         
         # 确保配置目录存在
         os.makedirs(self.config_dir, exist_ok=True)
+
+        # 配置缓存：(文件修改时间, 配置内容)，文件未变化时不重复读取
+        self._cache: Optional[tuple] = None
     
     def load_config(self) -> Dict:
         """从本地JSON文件加载配置"""
@@ -23,31 +26,85 @@ class ConfigManager:
             'model_name': 'gpt-3.5-turbo'
         }
         
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    loaded_config = json.load(f)
-                    default_config.update(loaded_config)
-            except Exception:
-                pass  # 如果读取失败，使用默认配置
-        
-        return default_config
+        try:
+            mtime = os.path.getmtime(self.config_file)
+        except OSError:
+            return default_config
+
+        if self._cache is not None and self._cache[0] == mtime:
+            return dict(self._cache[1])
+
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                loaded_config = json.load(f)
+                default_config.update(loaded_config)
+        except Exception:
+            return default_config  # 如果读取失败，使用默认配置
+
+        self._cache = (mtime, default_config)
+        return dict(default_config)
     
-    def save_config(self, api_key: str, base_url: str, model_name: str) -> bool:
-        """保存配置到本地JSON文件"""
-        config = {
+    def save_config(
+        self,
+        api_key: str,
+        base_url: str,
+        model_name: str,
+        endpoints: Optional[List[Dict]] = None,
+        stage_models: Optional[Dict[str, str]] = None,
+    ) -> bool:
+        """保存配置到本地JSON文件（与已有配置合并，未传入 endpoints / stage_models 时保留原有设置）"""
+        config = self.load_config()
+        config.update({
             'api_key': api_key,
             'base_url': base_url,
             'model_name': model_name
-        }
+        })
+        if endpoints is not None:
+            config['endpoints'] = endpoints
+        if stage_models is not None:
+            config['stage_models'] = {stage: model for stage, model in stage_models.items() if model}
         
         try:
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(config, f, ensure_ascii=False, indent=2)
+            self._cache = None
             return True
         except Exception:
             return False
 
+    def get_stage_models(self, config: Optional[Dict] = None) -> Dict[str, str]:
+        """返回各生成阶段单独指定的模型（analysis / outline_l1 / outline_detail / chapter_content / expand_outline）"""
+        config = config if config is not None else self.load_config()
+        return {stage: model for stage, model in (config.get('stage_models') or {}).items() if model}
+
+    def get_endpoints(self, config: Optional[Dict] = None) -> List[Dict]:
+        """
+        返回启用的LLM端点列表。
+
+        配置了 endpoints 时使用其中 enabled 的条目（未填写的 api_key / model_name 继承主配置），
+        否则由主配置的 base_url / api_key / model_name 组成唯一的端点。
+        """
+        config = config if config is not None else self.load_config()
+        primary = {
+            'name': 'default',
+            'base_url': config.get('base_url', ''),
+            'api_key': config.get('api_key', ''),
+            'model_name': config.get('model_name', 'gpt-3.5-turbo'),
+            'weight': 1.0,
+        }
+        endpoints = []
+        for index, item in enumerate(config.get('endpoints') or []):
+            if not item.get('enabled', True):
+                continue
+            endpoints.append({
+                'name': item.get('name') or f"endpoint-{index + 1}",
+                'base_url': item.get('base_url') or '',
+                'api_key': item.get('api_key') or primary['api_key'],
+                'model_name': item.get('model_name') or primary['model_name'],
+                'weight': float(item.get('weight') or 1.0),
+            })
+        return endpoints or [primary]
+
 
 # 全局配置管理器实例
 config_manager = ConfigManager()
\ No newline at end of file
@@ -0,0 +1,488 @@
+"""增量 JSON 解析与流式结构校验"""
+import json
+from typing import Any, Callable, List, Optional, Tuple
+
+from .json_util import compile_schema
+
+# 路径元素：对象键（str）或数组下标（int）
+Path = Tuple[Any, ...]
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = set("0123456789+-.eE")
+_LITERALS = {"t": ("true", True), "f": ("false", False), "n": ("null", None)}
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JsonStreamError(ValueError):
+    """增量解析时遇到的语法错误"""
+
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} (位置 {position})")
+        self.position = position
+
+
+def format_path(path: Path) -> str:
+    """把路径格式化为与 check_json 一致的形式，例如 .children[0].title"""
+    result = ""
+    for part in path:
+        result += f"[{part}]" if isinstance(part, int) else f".{part}"
+    return result
+
+
+class _Frame:
+    """解析栈中的一个容器"""
+    __slots__ = ("kind", "value", "path", "key", "expect")
+
+    def __init__(self, kind: str, value: Any, path: Path):
+        self.kind = kind  # "object" / "array"
+        self.value = value
+        self.path = path
+        self.key: Optional[str] = None
+        # object: key / colon / value / comma_or_end / key_or_end
+        # array: value_or_end / value / comma_or_end
+        self.expect = "key_or_end" if kind == "object" else "value_or_end"
+
+
+class IncrementalJsonParser:
+    """
+    增量 JSON 解析器。
+
+    可以分多次 feed 任意切分的文本，边解析边构建值，并在以下时机回调：
+    - on_value_start(path, kind): 某个值开始，kind 为 object / array / string / number / true / false / null
+    - on_value_end(path, value): 某个值（包括容器）解析完成
+    遇到语法错误时抛出 JsonStreamError。
+    """
+
+    def __init__(
+        self,
+        on_value_start: Optional[Callable[[Path, str], None]] = None,
+        on_value_end: Optional[Callable[[Path, Any], None]] = None,
+    ):
+        self.on_value_start = on_value_start
+        self.on_value_end = on_value_end
+        self.position = 0
+        self.done = False
+        self.result: Any = None
+        self._stack: List[_Frame] = []
+        self._started = False
+        # 正在读取的标量类型："string" / "key" / "number" / "literal"
+        self._token: Optional[str] = None
+        self._buffer: List[str] = []
+        self._escape = ""
+        self._literal = ""
+
+    # ---- 内部工具 ----
+    def _error(self, message: str) -> JsonStreamError:
+        return JsonStreamError(message, self.position)
+
+    def _current_path(self) -> Path:
+        """下一个值所在的路径"""
+        if not self._stack:
+            return ()
+        frame = self._stack[-1]
+        if frame.kind == "object":
+            return frame.path + (frame.key,)
+        return frame.path + (len(frame.value),)
+
+    def _start_value(self, kind: str) -> Path:
+        path = self._current_path()
+        if self.on_value_start:
+            self.on_value_start(path, kind)
+        return path
+
+    def _finish_value(self, value: Any) -> None:
+        """一个值解析完成，挂到父容器上"""
+        path = self._current_path()
+        if not self._stack:
+            self.result = value
+            self.done = True
+        else:
+            frame = self._stack[-1]
+            if frame.kind == "object":
+                frame.value[frame.key] = value
+            else:
+                frame.value.append(value)
+            frame.expect = "comma_or_end"
+        if self.on_value_end:
+            self.on_value_end(path, value)
+
+    @property
+    def started(self) -> bool:
+        """是否已经开始解析第一个值"""
+        return self._started
+
+    def _expecting_value(self) -> bool:
+        if not self._stack:
+            return not self._started
+        return self._stack[-1].expect in ("value", "value_or_end")
+
+    # ---- 主流程 ----
+    def feed(self, text: str) -> None:
+        """输入一段文本"""
+        i = 0
+        n = len(text)
+        while i < n:
+            if self._token == "string" or self._token == "key":
+                i = self._consume_string(text, i)
+                continue
+            if self._token == "number":
+                ch = text[i]
+                if ch in _NUMBER_CHARS:
+                    self._buffer.append(ch)
+                    i += 1
+                    self.position += 1
+                    continue
+                self._end_number()
+                continue
+            if self._token == "literal":
+                ch = text[i]
+                expected_text, value = _LITERALS[self._literal[0]]
+                expected = expected_text[len(self._literal)]
+                if ch != expected:
+                    raise self._error(f"无效的字面量 '{self._literal + ch}'")
+                self._literal += ch
+                i += 1
+                self.position += 1
+                if self._literal == expected_text:
+                    self._token = None
+                    self._finish_value(value)
+                continue
+
+            ch = text[i]
+            if ch in _WHITESPACE:
+                i += 1
+                self.position += 1
+                continue
+            self._consume_structural(ch)
+            i += 1
+            self.position += 1
+
+    def _consume_structural(self, ch: str) -> None:
+        if self.done:
+            raise self._error("JSON 结束后存在多余内容")
+        frame = self._stack[-1] if self._stack else None
+
+        if frame is not None and frame.kind == "object" and frame.expect in ("key", "key_or_end"):
+            if ch == '"':
+                self._token = "key"
+                self._buffer = []
+                return
+            if ch == "}" and frame.expect == "key_or_end":
+                self._close_container()
+                return
+            raise self._error(f"期望对象键，实际为 '{ch}'")
+
+        if frame is not None and frame.expect == "colon":
+            if ch != ":":
+                raise self._error(f"期望 ':'，实际为 '{ch}'")
+            frame.expect = "value"
+            return
+
+        if frame is not None and frame.expect == "comma_or_end":
+            if ch == ",":
+                frame.expect = "key" if frame.kind == "object" else "value"
+                return
+            if (ch == "}" and frame.kind == "object") or (ch == "]" and frame.kind == "array"):
+                self._close_container()
+                return
+            raise self._error(f"期望 ',' 或容器结束，实际为 '{ch}'")
+
+        if frame is not None and frame.kind == "array" and frame.expect == "value_or_end" and ch == "]":
+            self._close_container()
+            return
+
+        if not self._expecting_value():
+            raise self._error(f"意外的字符 '{ch}'")
+        self._started = True
+
+        if ch == "{":
+            path = self._start_value("object")
+            self._stack.append(_Frame("object", {}, path))
+        elif ch == "[":
+            path = self._start_value("array")
+            self._stack.append(_Frame("array", [], path))
+        elif ch == '"':
+            self._start_value("string")
+            self._token = "string"
+            self._buffer = []
+        elif ch == "-" or ch.isdigit():
+            self._start_value("number")
+            self._token = "number"
+            self._buffer = [ch]
+        elif ch in _LITERALS:
+            self._start_value(_LITERALS[ch][0])
+            self._token = "literal"
+            self._literal = ch
+        else:
+            raise self._error(f"无效的值起始字符 '{ch}'")
+
+    def _close_container(self) -> None:
+        frame = self._stack.pop()
+        self._finish_value(frame.value)
+
+    def _end_number(self) -> None:
+        raw = "".join(self._buffer)
+        self._token = None
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            raise self._error(f"无效的数字 '{raw}'")
+        self._finish_value(value)
+
+    def _consume_string(self, text: str, i: int) -> int:
+        """读取字符串内容，返回新的下标"""
+        n = len(text)
+        while i < n:
+            if self._escape:
+                self._escape += text[i]
+                i += 1
+                self.position += 1
+                if self._escape[1] == "u":
+                    if len(self._escape) < 6:
+                        continue
+                    try:
+                        code = int(self._escape[2:], 16)
+                    except ValueError:
+                        raise self._error(f"无效的转义序列 '{self._escape}'")
+                    # 合并 UTF-16 代理对
+                    last = self._buffer[-1] if self._buffer else ""
+                    if 0xDC00 <= code <= 0xDFFF and len(last) == 1 and 0xD800 <= ord(last) <= 0xDBFF:
+                        self._buffer[-1] = chr(0x10000 + ((ord(last) - 0xD800) << 10) + (code - 0xDC00))
+                    else:
+                        self._buffer.append(chr(code))
+                elif self._escape[1] in _ESCAPES:
+                    self._buffer.append(_ESCAPES[self._escape[1]])
+                else:
+                    raise self._error(f"无效的转义序列 '{self._escape}'")
+                self._escape = ""
+                continue
+
+            # 快速跳过普通字符
+            quote = text.find('"', i)
+            backslash = text.find("\\", i)
+            stop = min(p for p in (quote, backslash, n) if p != -1)
+            if stop > i:
+                segment = text[i:stop]
+                if any(ord(c) < 0x20 for c in segment):
+                    raise self._error("字符串中包含未转义的控制字符")
+                self._buffer.append(segment)
+                self.position += stop - i
+                i = stop
+                continue
+
+            ch = text[i]
+            i += 1
+            self.position += 1
+            if ch == "\\":
+                self._escape = "\\"
+                continue
+            # 字符串结束
+            value = "".join(self._buffer)
+            token = self._token
+            self._token = None
+            self._buffer = []
+            if token == "key":
+                frame = self._stack[-1]
+                frame.key = value
+                frame.expect = "colon"
+            else:
+                self._finish_value(value)
+            return i
+        return i
+
+    def close(self) -> Any:
+        """输入结束，返回解析结果；JSON 不完整时抛出 JsonStreamError"""
+        if self._token == "number":
+            self._end_number()
+        if not self.done:
+            raise self._error("JSON 不完整")
+        return self.result
+
+
+def _template_at(template: Any, path: Path) -> Tuple[bool, Any]:
+    """按路径查找模板节点；返回 (是否受约束, 模板节点)"""
+    node = template
+    for part in path:
+        if isinstance(part, int):
+            if not isinstance(node, list) or not node:
+                return False, None
+            node = node[0]
+        else:
+            if not isinstance(node, dict) or part not in node:
+                return False, None
+            node = node[part]
+    return True, node
+
+
+def _kind_matches(template: Any, kind: str) -> bool:
+    if isinstance(template, bool):
+        return kind in ("true", "false")
+    if isinstance(template, (int, float)):
+        return kind == "number"
+    if isinstance(template, str):
+        return kind == "string"
+    if isinstance(template, list):
+        return kind == "array"
+    if isinstance(template, dict):
+        return kind == "object"
+    if template is None:
+        return kind == "null"
+    return True
+
+
+_KIND_NAMES = {
+    "object": "dict", "array": "list", "string": "str", "number": "int",
+    "true": "bool", "false": "bool", "null": "NoneType",
+}
+
+
+class _StructureError(JsonStreamError):
+    """结构不符合模板（区别于语法错误）"""
+
+    def __init__(self, message: str, position: int, repairable: bool = False):
+        super().__init__(message, position)
+        self.repairable = repairable
+
+
+class StreamingJsonValidator:
+    """
+    流式结构校验器：按模板 JSON（与 check_json 相同的规则）在文本到达时校验。
+
+    一旦结构可以被证明不符合模板（类型不匹配、对象缺少必需键、列表为空），
+    feed 立即返回错误信息，调用方可以据此提前终止上游流。
+    本地修复（repair_json）能处理的问题不会提前终止：JSON 前面的说明文字或代码块标记直接跳过，
+    语法错误（如多余的逗号）和顶层外形不一致只记录在 deferred 中并停止校验，等完整输出后再修复。
+    """
+
+    def __init__(self, schema: str | dict | list):
+        self.template = compile_schema(schema).template
+        self.error: Optional[str] = None
+        self.error_position: Optional[int] = None
+        self.deferred: Optional[str] = None
+        self._parser = IncrementalJsonParser(self._on_value_start, self._on_value_end)
+
+    @property
+    def position(self) -> int:
+        """已消费的字符数"""
+        return self._parser.position
+
+    def _on_value_start(self, path: Path, kind: str) -> None:
+        constrained, template = _template_at(self.template, path)
+        if constrained and not _kind_matches(template, kind):
+            raise _StructureError(
+                f"路径 '{format_path(path)}' 的类型不匹配: 期望 {type(template).__name__}, 实际 {_KIND_NAMES[kind]}",
+                self._parser.position,
+                repairable=not path,  # 顶层外形不一致可能只是多/少了 {"outline": ...} 包裹
+            )
+
+    def _on_value_end(self, path: Path, value: Any) -> None:
+        constrained, template = _template_at(self.template, path)
+        if not constrained:
+            return
+        if isinstance(template, dict):
+            for key in template:
+                if key not in value:
+                    raise _StructureError(f"路径 '{format_path(path)}' 缺少必需的键 '{key}'", self._parser.position)
+        elif isinstance(template, list) and template and not value:
+            raise _StructureError(f"路径 '{format_path(path)}' 的列表为空，但期望有内容", self._parser.position)
+
+    def feed(self, text: str) -> Optional[str]:
+        """输入一段文本；结构已确定错误时返回错误信息，否则返回 None"""
+        if self.error is not None or self.deferred is not None:
+            return self.error
+        if not self._parser.started:
+            # 跳过 JSON 之前的说明文字和代码块标记
+            start = next((i for i, ch in enumerate(text) if ch in "{["), None)
+            if start is None:
+                return None
+            text = text[start:]
+        if self._parser.done:
+            return None
+        try:
+            self._parser.feed(text)
+        except _StructureError as e:
+            if e.repairable:
+                self.deferred = str(e)
+            else:
+                self.error = str(e)
+                self.error_position = e.position
+        except JsonStreamError as e:
+            # JSON 结束后的多余内容（如代码块结束标记）不影响结构；其余语法错误留给本地修复
+            if not self._parser.done:
+                self.deferred = str(e)
+        return self.error
+
+    def close(self) -> Optional[str]:
+        """输入结束；返回最终的错误信息（通过或已留给本地修复时返回 None）"""
+        if self.error is None and self.deferred is None:
+            try:
+                self._parser.close()
+            except JsonStreamError as e:
+                self.error = str(e)
+                self.error_position = e.position
+        return self.error
+
+
+def _outline_node_path(path: Path) -> Optional[List[int]]:
+    """
+    判断路径是否指向目录节点，是则返回节点在各级 children 中的下标
+
+    目录节点位于 outline[i]、outline[i].children[j]……（也接受没有 {"outline": ...} 包裹的顶层列表）。
+    """
+    if path and path[0] == "outline":
+        path = path[1:]
+    if not path or len(path) % 2 != 1:
+        return None
+    indexes = [path[0]]
+    for k in range(1, len(path), 2):
+        if path[k] != "children":
+            return None
+        indexes.append(path[k + 1])
+    return indexes if all(isinstance(i, int) for i in indexes) else None
+
+
+class OutlineNodeExtractor:
+    """
+    从流式输出的目录 JSON 中提取已完整生成的节点。
+
+    每个节点对象闭合时产生一条记录 {id, title, description, path, leaf}，path 为该节点在各级 children 中的下标；
+    子节点先于父节点闭合。遇到语法错误后停止提取（原始文本不受影响，由调用方完整解析后再处理）。
+    """
+
+    def __init__(self):
+        self.error: Optional[str] = None
+        self._completed: List[dict] = []
+        self._parser = IncrementalJsonParser(on_value_end=self._on_value_end)
+
+    def _on_value_end(self, path: Path, value: Any) -> None:
+        if not isinstance(value, dict):
+            return
+        indexes = _outline_node_path(path)
+        if indexes is None:
+            return
+        children = value.get("children")
+        self._completed.append({
+            "id": value.get("id"),
+            "title": value.get("title"),
+            "description": value.get("description"),
+            "path": indexes,
+            "leaf": not children,
+        })
+
+    def feed(self, text: str) -> List[dict]:
+        """输入一段文本，返回这段文本中闭合的节点"""
+        if self.error is not None or self._parser.done:
+            return []
+        if not self._parser.started:
+            # 跳过 JSON 之前的说明文字和代码块标记
+            start = next((i for i, ch in enumerate(text) if ch in "{["), None)
+            if start is None:
+                return []
+            text = text[start:]
+        try:
+            self._parser.feed(text)
+        except JsonStreamError as e:
+            if not self._parser.done:
+                self.error = str(e)
+        completed, self._completed = self._completed, []
+        return completed
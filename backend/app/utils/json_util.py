@@ -1,4 +1,114 @@
 import json
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 编译后的节点校验函数：(目标值, 路径) -> 错误信息，通过时返回 None
+_Check = Callable[[Any, str], Optional[str]]
+
+
+def _type_mismatch(path: str, template: Any, target: Any) -> str:
+    return f"路径 '{path}' 的类型不匹配: 期望 {type(template).__name__}, 实际 {type(target).__name__}"
+
+
+def _compile_node(template: Any) -> _Check:
+    """把模板节点编译为校验函数，规则与原有的递归比对一致"""
+    # 数字类型（int 和 float 可以互换）
+    if isinstance(template, (int, float)):
+        def check_number(target: Any, path: str) -> Optional[str]:
+            if isinstance(target, (int, float)):
+                return None
+            return _type_mismatch(path, template, target)
+        return check_number
+
+    expected_type = type(template)
+
+    if isinstance(template, list):
+        # 列表中的每个元素都按模板中第一个元素的格式校验；模板列表为空时允许任何列表
+        item_check = _compile_node(template[0]) if template else None
+
+        def check_list(target: Any, path: str) -> Optional[str]:
+            if type(target) is not list:
+                return _type_mismatch(path, template, target)
+            if item_check is None:
+                return None
+            if not target:
+                return f"路径 '{path}' 的列表为空，但期望有内容"
+            for i, item in enumerate(target):
+                error = item_check(item, f"{path}[{i}]")
+                if error:
+                    return error
+            return None
+        return check_list
+
+    if isinstance(template, dict):
+        # 所有键都是必需的，并且值的类型要正确
+        fields = [(key, _compile_node(value)) for key, value in template.items()]
+
+        def check_dict(target: Any, path: str) -> Optional[str]:
+            if type(target) is not dict:
+                return _type_mismatch(path, template, target)
+            for key, field_check in fields:
+                if key not in target:
+                    return f"路径 '{path}' 缺少必需的键 '{key}'"
+                error = field_check(target[key], f"{path}.{key}")
+                if error:
+                    return error
+            return None
+        return check_dict
+
+    def check_type(target: Any, path: str) -> Optional[str]:
+        if type(target) is not expected_type:
+            return _type_mismatch(path, template, target)
+        return None
+    return check_type
+
+
+class CompiledSchema:
+    """编译后的模板校验器：模板只解析一次，之后每次校验直接执行预先构建的校验函数"""
+
+    def __init__(self, template: Any):
+        self.template = template
+        self._check = _compile_node(template)
+
+    def validate(self, data: Any) -> Tuple[bool, str]:
+        error = self._check(data, "")
+        return (False, error) if error else (True, "")
+
+
+_COMPILED_BY_ID_SIZE = 256
+
+# 按对象 id 缓存 dict / list 模板的校验器：id -> (模板对象, 校验器)。
+# 同时持有模板对象的引用，保证缓存期间 id 不会被其他对象复用
+_compiled_by_id: "OrderedDict[int, Tuple[Any, CompiledSchema]]" = OrderedDict()
+
+
+@lru_cache(maxsize=256)
+def _compile_text(schema_text: str) -> CompiledSchema:
+    return CompiledSchema(json.loads(schema_text))
+
+
+def compile_schema(schema: str | dict | list) -> CompiledSchema:
+    """
+    获取模板对应的校验器，相同模板只编译一次
+
+    dict / list 模板先按对象身份查找，同一个模板对象重复校验（流式校验、check_json、repair_json、重试）
+    时不再序列化；未命中时按序列化后的内容查找，内容相同的不同对象共享同一个校验器。
+    模板对象在首次使用后不应再修改。
+    """
+    if isinstance(schema, str):
+        return _compile_text(schema)
+    entry = _compiled_by_id.get(id(schema))
+    if entry is not None and entry[0] is schema:
+        _compiled_by_id.move_to_end(id(schema))
+        return entry[1]
+    compiled = _compile_text(json.dumps(schema, ensure_ascii=False, sort_keys=True))
+    _compiled_by_id[id(schema)] = (schema, compiled)
+    if len(_compiled_by_id) > _COMPILED_BY_ID_SIZE:
+        _compiled_by_id.popitem(last=False)
+    return compiled
+
+
 def check_json(json_str: str, schema: str | dict) -> tuple[bool, str]:
     """
     根据模板 JSON 校验目标字符串的格式是否符合要求
@@ -19,54 +129,164 @@ def check_json(json_str: str, schema: str | dict) -> tuple[bool, str]:
             return False, f"JSON 解析错误: {str(e)}"
         
         # 处理 schema 参数
+        if not isinstance(schema, (str, dict)):
+            return False, "schema 必须是 JSON 字符串或字典对象"
         try:
-            if isinstance(schema, str):
-                schema = json.loads(schema)
-            elif not isinstance(schema, dict):
-                return False, "schema 必须是 JSON 字符串或字典对象"
+            validator = compile_schema(schema)
         except json.JSONDecodeError as e:
             return False, f"schema 解析错误: {str(e)}"
-        
-        def check_structure(target, template, path=""):
-            # 处理数字类型（int 和 float 可以互换）
-            if isinstance(template, (int, float)) and isinstance(target, (int, float)):
-                return True, ""
-                
-            # 检查基本数据类型
-            if type(template) != type(target) and not (isinstance(template, (int, float)) and isinstance(target, (int, float))):
-                return False, f"路径 '{path}' 的类型不匹配: 期望 {type(template).__name__}, 实际 {type(target).__name__}"
-                
-            # 如果是列表类型
-            if isinstance(template, list):
-                if not template:  # 如果模板列表为空，则允许任何列表
-                    return True, ""
-                if not target:  # 如果目标列表为空，但模板不为空
-                    return False, f"路径 '{path}' 的列表为空，但期望有内容"
-                    
-                # 检查列表中的每个元素是否符合模板中第一个元素的格式
-                template_item = template[0]
-                for i, item in enumerate(target):
-                    is_valid, error = check_structure(item, template_item, f"{path}[{i}]")
-                    if not is_valid:
-                        return False, error
-                return True, ""
-                
-            # 如果是字典类型
-            elif isinstance(template, dict):
-                # 检查所有必需的键是否存在，并且值的类型是否正确
-                for key in template:
-                    if key not in target:
-                        return False, f"路径 '{path}' 缺少必需的键 '{key}'"
-                    is_valid, error = check_structure(target[key], template[key], f"{path}.{key}")
-                    if not is_valid:
-                        return False, error
-                return True, ""
-                
-            # 对于其他基本类型，返回 True
-            return True, ""
-                
-        is_valid, error = check_structure(data, schema)
-        return is_valid, error if not is_valid else ""
+
+        return validator.validate(data)
         
     except Exception as e:
-        return False, f"未预期的错误: {str(e)}"
\ No newline at end of file
+        return False, f"未预期的错误: {str(e)}"
+
+
+def _strip_fences(text: str) -> str:
+    """去掉 Markdown 代码块标记（```json ... ```）"""
+    lines = [line for line in text.strip().splitlines() if not line.strip().startswith("```")]
+    return "\n".join(lines)
+
+
+def _extract_outermost(text: str) -> Optional[str]:
+    """提取第一个完整的 JSON 对象或数组（跳过前后的说明文字）"""
+    start = next((i for i, ch in enumerate(text) if ch in "{["), None)
+    if start is None:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def _remove_trailing_commas(text: str) -> str:
+    """去掉容器结束符前多余的逗号（字符串内的内容不受影响）"""
+    result: List[str] = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == ",":
+            following = text[i + 1:].lstrip()
+            if following[:1] in ("}", "]"):
+                continue
+        result.append(ch)
+    return "".join(result)
+
+
+def _reshape(data: Any, template: Any) -> Tuple[Any, Optional[str]]:
+    """处理 {"outline": [...]} 与 [...] 两种外层形式不一致的情况"""
+    if isinstance(template, list) and isinstance(data, dict) and len(data) == 1:
+        value = next(iter(data.values()))
+        if isinstance(value, list):
+            return value, "unwrap"
+    if isinstance(template, dict) and len(template) == 1 and isinstance(data, list):
+        key, value = next(iter(template.items()))
+        if isinstance(value, list):
+            return {key: data}, "wrap"
+    return data, None
+
+
+def repair_json(text: str, schema: str | dict | list) -> Tuple[Optional[str], List[str]]:
+    """
+    在本地修复未通过校验的输出，避免为格式问题再请求一次模型
+
+    依次尝试：去掉代码块标记、提取最外层的 JSON 对象或数组、去掉多余的逗号、
+    按模板包裹或拆开 {"outline": [...]} 外层。
+
+    Returns:
+        (修复后的 JSON 字符串, 实际生效的修复步骤)；无法修复时返回 (None, 已尝试的步骤)
+    """
+    steps: List[str] = []
+    candidate = _strip_fences(text)
+    if candidate != text.strip():
+        steps.append("strip_fences")
+
+    extracted = _extract_outermost(candidate)
+    if extracted is None:
+        return None, steps
+    if extracted != candidate.strip():
+        steps.append("extract")
+
+    fixed = _remove_trailing_commas(extracted)
+    if fixed != extracted:
+        steps.append("trailing_commas")
+
+    try:
+        data = json.loads(fixed)
+    except ValueError:
+        return None, steps
+
+    validator = compile_schema(schema)
+    data, reshape_step = _reshape(data, validator.template)
+    if reshape_step:
+        steps.append(reshape_step)
+
+    isok, _ = validator.validate(data)
+    if not isok:
+        return None, steps
+    return json.dumps(data, ensure_ascii=False), steps
+
+
+def template_to_json_schema(template: Any) -> Dict[str, Any]:
+    """
+    把模板 JSON 转换为严格模式（strict）的 JSON Schema
+
+    与 check_json 的约定一致：对象的所有键都是必需的且不允许额外的键，列表按第一个元素的结构校验。
+    """
+    if isinstance(template, dict):
+        return {
+            "type": "object",
+            "properties": {key: template_to_json_schema(value) for key, value in template.items()},
+            "required": list(template.keys()),
+            "additionalProperties": False,
+        }
+    if isinstance(template, list):
+        item = template_to_json_schema(template[0]) if template else {"type": "string"}
+        return {"type": "array", "items": item}
+    if isinstance(template, bool):
+        return {"type": "boolean"}
+    if isinstance(template, (int, float)):
+        return {"type": "number"}
+    if template is None:
+        return {"type": "null"}
+    return {"type": "string"}
+
+
+def json_schema_response_format(template: Any, name: str) -> Dict[str, Any]:
+    """
+    根据模板构造 json_schema 类型的 response_format
+
+    json_schema 的顶层必须是对象；端点不支持 json_schema 时由 OpenAIService 自动降级为 json_object。
+    """
+    if isinstance(template, str):
+        template = json.loads(template)
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": template_to_json_schema(template)},
+    }
@@ -1,13 +1,14 @@
 import random
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 
-def get_random_indexes(max_index: int) -> Tuple[int, int]:
+def get_random_indexes(max_index: int, rng: Optional[random.Random] = None) -> Tuple[int, int]:
     """
     从0到max_index范围内随机选择两个不同的索引
     
     Args:
         max_index: 索引的最大值（不包含）
+        rng: 随机数生成器，传入固定种子的实例可得到可复现的结果
         
     Returns:
         Tuple[int, int]: 两个不同的随机索引
@@ -19,7 +20,7 @@ def get_random_indexes(max_index: int) -> Tuple[int, int]:
     all_pairs = [(i, j) for i in range(max_index) for j in range(max_index) if i != j]
     
     # 随机选择一对索引
-    selected_pair = random.choice(all_pairs)
+    selected_pair = (rng or random).choice(all_pairs)
     
     return selected_pair
 
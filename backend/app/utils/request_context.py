@@ -0,0 +1,32 @@
+"""请求上下文：记录当前处理的 API 路由，供服务层打点使用"""
+from contextvars import ContextVar
+from typing import Optional
+
+current_route: ContextVar[str] = ContextVar("current_route", default="")
+
+
+class CallCounter:
+    """统计一次生成（及其派生的后台任务）实际向服务商发起的 LLM 调用次数"""
+
+    def __init__(self):
+        self.calls = 0
+
+
+current_call_counter: ContextVar[Optional[CallCounter]] = ContextVar("current_call_counter", default=None)
+
+
+class RequestContextMiddleware:
+    """ASGI 中间件：把请求路径写入上下文变量（流式响应的生成器中同样可读）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = current_route.set(scope.get("path", ""))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_route.reset(token)
@@ -0,0 +1,68 @@
+"""LLM 请求重试与断点续写相关工具"""
+import random
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+# 续写时发送给模型的指令
+CONTINUE_PROMPT = "你的上一条回复因网络原因中断了。请从中断处直接接着往下写，不要重复已经输出的内容，也不要添加任何说明。"
+LENGTH_CONTINUE_PROMPT = "你的上一条回复因长度限制被截断了。请从截断处直接接着往下写，不要重复已经输出的内容，也不要添加任何说明。"
+
+
+def retry_after_seconds(error: Any) -> Optional[float]:
+    """从异常携带的响应头中读取服务商建议的重试等待时间（retry-after-ms / retry-after）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # HTTP 日期格式
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, base: float, cap: float, error: Any = None, retry_after_cap: float = 120.0) -> float:
+    """
+    计算第 attempt 次重试前的等待时间（秒）。
+
+    采用带抖动的指数退避（full jitter），退避上限为 cap，避免大量并发请求在同一时刻重试；
+    服务商给出 Retry-After 时至少等待该时长（不超过 retry_after_cap）。
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** max(0, attempt - 1))))
+    retry_after = retry_after_seconds(error) if error is not None else None
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, retry_after_cap))
+    return delay
+
+
+def trim_overlap(previous: str, continuation: str, min_overlap: int = 8, window: int = 200) -> str:
+    """
+    去掉续写内容开头与已输出内容结尾重复的部分。
+
+    模型续写时有时会把中断前的最后几句话再写一遍；在 previous 末尾 window 个字符内
+    查找与 continuation 开头相同的最长片段，长度不少于 min_overlap 时将其去掉。
+    """
+    tail = previous[-window:]
+    for size in range(min(len(tail), len(continuation)), min_overlap - 1, -1):
+        if tail.endswith(continuation[:size]):
+            return continuation[size:]
+    return continuation
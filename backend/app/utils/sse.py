@@ -1,8 +1,18 @@
-"""SSE (Server-Sent Events) 相关工具"""
-from typing import AsyncGenerator, Any, Dict, Optional
+"""SSE (Server-Sent Events) 相关工具：字节级事件编码、事件合并与响应包装（断开取消与可续传响应见 services.sse_session）"""
+import asyncio
+import json
+from typing import AsyncGenerator, AsyncIterator, Any, Callable, Dict, List, Optional, Tuple, Union
 
 from fastapi.responses import StreamingResponse
 
+# orjson 为可选依赖：安装后 JSON 序列化快数倍，未安装时退回标准库，输出格式相同
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
 
 DEFAULT_SSE_HEADERS: Dict[str, str] = {
     "Cache-Control": "no-cache",
@@ -10,29 +20,215 @@ DEFAULT_SSE_HEADERS: Dict[str, str] = {
     "Content-Type": "text/event-stream",
 }
 
+# 结束信号与心跳（以冒号开头的注释行，客户端会忽略）
+SSE_DONE = b"data: [DONE]\n\n"
+SSE_HEARTBEAT = b": ping\n\n"
+
+SSEFrame = Union[bytes, str]
+
+
+def dumps_json(payload: Any) -> bytes:
+    """序列化为紧凑的 UTF-8 JSON（非 ASCII 字符不转义）"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads_json(data: bytes) -> Any:
+    """解析 UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def format_sse(payload: Dict[str, Any]) -> bytes:
+    """把数据编码为一条 SSE 事件"""
+    return b"data: " + dumps_json(payload) + b"\n\n"
+
+
+def sse_chunk(chunk: str) -> bytes:
+    """文本分片事件 {"chunk": ...}"""
+    return format_sse({"chunk": chunk})
+
+
+def sse_status(status: str, **fields: Any) -> bytes:
+    """状态事件 {"status": ..., ...}"""
+    return format_sse({"status": status, **fields})
+
+
+def sse_error(message: str, **fields: Any) -> bytes:
+    """错误事件：同时带 status=error 与 error=true，兼容两种判断方式"""
+    return format_sse({**fields, "status": "error", "error": True, "message": message})
+
+
+def sse_done() -> bytes:
+    """结束信号"""
+    return SSE_DONE
+
+
+# 可合并的文本字段：两个事件只有该字段不同时，拼接该字段合并为一个事件
+_MERGEABLE_FIELDS = ("delta", "chunk")
+
+
+def _mergeable(event: bytes) -> Optional[Tuple[str, Dict[str, Any], str]]:
+    """解析可合并的文本事件，返回 (字段名, 其余字段, 文本)；不可合并时返回 None"""
+    if not event.startswith(b"data: {") or (b'"delta":' not in event and b'"chunk":' not in event):
+        return None
+    try:
+        payload = loads_json(event[6:])
+    except ValueError:
+        return None
+    for field in _MERGEABLE_FIELDS:
+        text = payload.get(field)
+        if isinstance(text, str):
+            rest = {k: v for k, v in payload.items() if k != field}
+            return field, rest, text
+    return None
+
+
+def coalesce_frames(batch: List[Tuple[int, bytes]]) -> List[Tuple[int, bytes]]:
+    """
+    合并慢速客户端积压的事件：连续的 delta / chunk 事件在其余字段相同时合并为一个，
+    合并后的事件使用最后一个被合并事件的序号，断线续传的位置仍然正确；其他事件原样保留。
+    """
+    merged: List[Tuple[int, bytes]] = []
+    group: Optional[Tuple[str, Dict[str, Any]]] = None
+    texts: List[str] = []
+    group_seq = 0
+    group_count = 0
+    group_event = b""
+
+    def flush() -> None:
+        if group is None:
+            return
+        if group_count == 1:
+            merged.append((group_seq, group_event))
+        else:
+            field, rest = group
+            merged.append((group_seq, format_sse({**rest, field: "".join(texts)})))
+
+    for seq, event in batch:
+        parsed = _mergeable(event)
+        if parsed is None:
+            flush()
+            group = None
+            merged.append((seq, event))
+            continue
+        field, rest, text = parsed
+        if group is not None and group == (field, rest):
+            texts.append(text)
+            group_count += 1
+        else:
+            flush()
+            group = (field, rest)
+            texts = [text]
+            group_count = 1
+            group_event = event
+        group_seq = seq
+    flush()
+    return merged
+
+
+async def coalesce_chunks(
+    source: AsyncIterator[str],
+    window: float,
+    max_bytes: int,
+) -> AsyncGenerator[str, None]:
+    """
+    把文本分片合并成帧：从帧内第一个分片到达起经过 window 秒，或累计达到 max_bytes 字节时输出一帧。
+
+    上游由后台任务读取，逐分片只做追加，每帧只设置一次定时器；上游停顿时到期的帧照常发出。
+    window <= 0 时不合并。
+    """
+    loop = asyncio.get_running_loop()
+    buffer: List[str] = []
+    size = 0
+    ready = asyncio.Event()
+    timer: Optional[asyncio.TimerHandle] = None
+    finished = False
+    error: Optional[BaseException] = None
+
+    async def pump() -> None:
+        nonlocal size, timer, finished, error
+        try:
+            async for chunk in source:
+                buffer.append(chunk)
+                size += len(chunk.encode("utf-8"))
+                if size >= max_bytes or window <= 0:
+                    ready.set()
+                elif timer is None:
+                    timer = loop.call_later(window, ready.set)
+        except Exception as e:
+            error = e
+        finally:
+            finished = True
+            ready.set()
+
+    task = asyncio.ensure_future(pump())
+    try:
+        while True:
+            await ready.wait()
+            ready.clear()
+            if timer is not None:
+                timer.cancel()
+                timer = None
+            if buffer:
+                frame = "".join(buffer)
+                buffer.clear()
+                size = 0
+                yield frame
+            if finished and not buffer:
+                break
+        if error is not None:
+            raise error
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if not task.done():
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """响应结束时（正常结束、出错或客户端断开，包括尚未开始发送事件）调用 on_close"""
+
+    def __init__(self, *args: Any, on_close: Callable[[], None], **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._on_close()
+
 
 def sse_response(
-    generator: AsyncGenerator[str, Any],
+    generator: AsyncGenerator[SSEFrame, Any],
     media_type: str = "text/event-stream",
     extra_headers: Optional[Dict[str, str]] = None,
+    on_close: Optional[Callable[[], None]] = None,
 ) -> StreamingResponse:
     """
     包装 SSE 异步生成器为 StreamingResponse，统一 headers 和 media_type。
 
     Args:
-        generator: 异步生成器，yield 已经带好 "data: ..." 和 "\n\n" 的字符串
+        generator: 异步生成器，yield 已经编码好的完整事件（format_sse 等返回的字节，或带好 "data: ..." 和 "\n\n" 的字符串）
         media_type: 响应的 media_type，默认使用 text/event-stream
         extra_headers: 额外需要添加或覆盖的响应头
+        on_close: 响应结束时调用（生成器可能从未开始迭代，不能依赖其 finally 做清理）
     """
     headers = DEFAULT_SSE_HEADERS.copy()
     if extra_headers:
         headers.update(extra_headers)
 
+    if on_close is not None:
+        return _ClosingStreamingResponse(generator, media_type=media_type, headers=headers, on_close=on_close)
     return StreamingResponse(
         generator,
         media_type=media_type,
         headers=headers,
     )
-
-
-
@@ -0,0 +1,37 @@
+"""统计相关工具"""
+from typing import Dict, Iterable, List, Sequence
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    计算百分位数（线性插值）
+
+    Args:
+        values: 数值序列
+        q: 百分位，取值 0-100
+
+    Returns:
+        float: 百分位数值，序列为空时返回 0.0
+    """
+    if not values:
+        return 0.0
+    data = sorted(values)
+    if len(data) == 1:
+        return float(data[0])
+    pos = (len(data) - 1) * max(0.0, min(100.0, q)) / 100.0
+    lower = int(pos)
+    upper = min(lower + 1, len(data) - 1)
+    frac = pos - lower
+    return float(data[lower] + (data[upper] - data[lower]) * frac)
+
+
+def summarize(values: Iterable[float], quantiles: List[float] = (50, 90, 99)) -> Dict[str, float]:
+    """返回 count / mean / 各百分位数的汇总"""
+    data = list(values)
+    result: Dict[str, float] = {
+        "count": len(data),
+        "mean": (sum(data) / len(data)) if data else 0.0,
+    }
+    for q in quantiles:
+        result[f"p{int(q)}"] = percentile(data, q)
+    return result
@@ -0,0 +1,26 @@
+"""Token 数量估算工具（无需分词器的粗略估算）"""
+from typing import Iterable
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数
+
+    中文等宽字符按每字约 1 个 token 计算，其余字符按每 4 个约 1 个 token 计算。
+    """
+    if not text:
+        return 0
+    wide = sum(1 for ch in text if ord(ch) > 0x2E80)
+    narrow = len(text) - wide
+    return wide + (narrow + 3) // 4
+
+
+def estimate_messages_tokens(messages: Iterable[dict]) -> int:
+    """估算一组 chat messages 的 token 数（每条消息额外计 4 个 token 的格式开销）"""
+    total = 0
+    for message in messages:
+        content = message.get("content") or ""
+        if not isinstance(content, str):
+            content = str(content)
+        total += estimate_tokens(content) + 4
+    return total
@@ -0,0 +1,121 @@
+"""
+客户端连接复用基准测试
+
+对比两种方式的首 token 延迟（TTFT）与新建连接数：
+- fresh:  每次请求新建 AsyncOpenAI 客户端（旧行为）
+- pooled: 通过 client_registry 复用共享连接池（可选预热）
+
+运行方式（在 backend 目录下，先启动模拟服务）：
+    python -m benchmarks.mock_openai_server --port 9000
+    python -m benchmarks.bench_client_pool --base-url http://127.0.0.1:9000/v1 --requests 66 --concurrency 5
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List
+
+import httpx
+import openai
+
+from app.services.llm_client_registry import LLMClientRegistry
+from app.utils.stats_util import summarize
+
+
+async def _measure_ttft(client: openai.AsyncOpenAI, model: str) -> float:
+    """发送一次流式请求，返回首 token 延迟（毫秒）"""
+    start = time.perf_counter()
+    ttft = None
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": "ping"}],
+        stream=True,
+    )
+    async for chunk in stream:
+        if ttft is None and chunk.choices and chunk.choices[0].delta.content:
+            ttft = (time.perf_counter() - start) * 1000
+    return ttft if ttft is not None else (time.perf_counter() - start) * 1000
+
+
+async def run_fresh(args) -> Dict[str, Any]:
+    """每次请求创建新客户端"""
+    connections = {"opened": 0}
+
+    async def trace(event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            connections["opened"] += 1
+
+    async def attach(request: httpx.Request) -> None:
+        request.extensions["trace"] = trace
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one() -> float:
+        async with semaphore:
+            client = openai.AsyncOpenAI(
+                api_key=args.api_key,
+                base_url=args.base_url,
+                http_client=httpx.AsyncClient(event_hooks={"request": [attach]}),
+            )
+            try:
+                return await _measure_ttft(client, args.model)
+            finally:
+                await client.close()
+
+    ttfts: List[float] = await asyncio.gather(*[one() for _ in range(args.requests)])
+    return {"ttft_ms": summarize(ttfts), "connections_opened": connections["opened"]}
+
+
+async def run_pooled(args) -> Dict[str, Any]:
+    """复用注册表中的共享客户端"""
+    registry = LLMClientRegistry()
+    if args.prewarm:
+        await registry.prewarm(args.api_key, args.base_url, connections=args.concurrency)
+    warm_connections = registry.stats["connections_opened"]
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one() -> float:
+        async with semaphore:
+            client = registry.get_client(args.api_key, args.base_url)
+            return await _measure_ttft(client, args.model)
+
+    ttfts: List[float] = await asyncio.gather(*[one() for _ in range(args.requests)])
+    stats = registry.get_stats()
+    await registry.close_all()
+    return {
+        "ttft_ms": summarize(ttfts),
+        "connections_opened": stats["connections_opened"] - warm_connections,
+        "prewarm_connections": warm_connections,
+        "clients_created": stats["clients_created"],
+    }
+
+
+def _print_result(name: str, result: Dict[str, Any]) -> None:
+    ttft = result["ttft_ms"]
+    print(f"[{name}] 请求数={ttft['count']} TTFT p50={ttft['p50']:.1f}ms p99={ttft['p99']:.1f}ms "
+          f"mean={ttft['mean']:.1f}ms 新建连接={result['connections_opened']}")
+    if "prewarm_connections" in result:
+        print(f"[{name}] 预热连接={result['prewarm_connections']} 创建客户端={result['clients_created']}")
+
+
+async def main_async(args) -> None:
+    fresh = await run_fresh(args)
+    _print_result("fresh", fresh)
+    pooled = await run_pooled(args)
+    _print_result("pooled", pooled)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 客户端连接复用基准测试")
+    parser.add_argument("--base-url", default="http://127.0.0.1:9000/v1")
+    parser.add_argument("--api-key", default="mock-key")
+    parser.add_argument("--model", default="mock-gpt")
+    parser.add_argument("--requests", type=int, default=66, help="请求总数（默认模拟一份标书的叶子章节数）")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--no-prewarm", dest="prewarm", action="store_false", help="pooled 模式下不预热连接")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+多端点故障转移基准测试
+
+通过 OpenAIService 向多个端点并发发送流式请求，统计成功率、TTFT，以及各端点的请求分配、熔断状态和故障转移次数。
+
+运行方式（在 backend 目录下）：
+    # 自动启动三个本地模拟端点：正常、慢速、持续报错
+    python -m benchmarks.bench_failover --spawn --requests 66 --concurrency 8
+
+    # 使用已启动的端点，格式为 base_url 或 base_url,权重
+    python -m benchmarks.bench_failover --endpoint http://127.0.0.1:9000/v1 --endpoint http://127.0.0.1:9001/v1,2
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from app.config import settings
+from app.services.llm_endpoint_router import endpoint_router
+from app.services.openai_service import OpenAIService
+from app.utils.stats_util import summarize
+
+# --spawn 时启动的模拟端点：(端口, 额外参数)
+SPAWN_PROFILES = [
+    (9101, ["--ttft", "0.2"]),
+    (9102, ["--ttft", "1.5"]),
+    (9103, ["--error-rate", "1.0", "--error-status", "503"]),
+]
+
+
+def _parse_endpoint(value: str, index: int) -> Dict[str, Any]:
+    base_url, _, weight = value.partition(",")
+    return {"name": f"bench-{index + 1}", "base_url": base_url, "weight": float(weight or 1.0)}
+
+
+async def _wait_ready(base_url: str, timeout: float = 15.0) -> None:
+    """等待模拟端点可用"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(f"{base_url}/models")
+                if response.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"模拟端点未就绪: {base_url}")
+
+
+async def run(args, endpoints: List[Dict[str, Any]]) -> Dict[str, Any]:
+    service = OpenAIService()
+    service.endpoints = endpoint_router.resolve([
+        {**endpoint, "api_key": args.api_key, "model_name": args.model} for endpoint in endpoints
+    ])
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one() -> Dict[str, Any]:
+        async with semaphore:
+            start = time.perf_counter()
+            ttft = None
+            try:
+                async for _ in service.stream_chat_completion(
+                    [{"role": "user", "content": "ping"}], use_cache=False
+                ):
+                    if ttft is None:
+                        ttft = (time.perf_counter() - start) * 1000
+            except Exception:
+                return {"ok": False, "ttft_ms": None}
+            return {"ok": True, "ttft_ms": ttft}
+
+    results = await asyncio.gather(*[one() for _ in range(args.requests)])
+    ttfts = [r["ttft_ms"] for r in results if r["ok"] and r["ttft_ms"] is not None]
+    return {
+        "succeeded": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "ttft_ms": summarize(ttfts),
+    }
+
+
+async def main_async(args) -> None:
+    processes = []
+    endpoints = [_parse_endpoint(value, i) for i, value in enumerate(args.endpoint or [])]
+    try:
+        if args.spawn:
+            for port, extra in SPAWN_PROFILES:
+                processes.append(subprocess.Popen(
+                    [sys.executable, "-m", "benchmarks.mock_openai_server", "--port", str(port), *extra]
+                ))
+                endpoints.append(_parse_endpoint(f"http://127.0.0.1:{port}/v1", len(endpoints)))
+            await asyncio.gather(*[_wait_ready(endpoint["base_url"]) for endpoint in endpoints])
+        if not endpoints:
+            raise SystemExit("请通过 --endpoint 指定端点，或使用 --spawn 启动本地模拟端点")
+
+        result = await run(args, endpoints)
+        ttft = result["ttft_ms"]
+        print(f"成功={result['succeeded']} 失败={result['failed']} "
+              f"TTFT p50={ttft['p50']:.1f}ms p99={ttft['p99']:.1f}ms")
+        for stats in endpoint_router.get_stats():
+            print(f"  [{stats['name']}] {stats['base_url']} 状态={stats['state']} 请求={stats['requests']} "
+                  f"成功={stats['successes']} 失败={stats['failures']} 转移进入={stats['failovers']} "
+                  f"EWMA TTFT={stats['ewma_ttft_ms']}ms")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多端点故障转移基准测试")
+    parser.add_argument("--endpoint", action="append", help="端点 base_url，可附带权重：base_url,权重；可重复")
+    parser.add_argument("--spawn", action="store_true", help="自动启动正常/慢速/报错三个本地模拟端点")
+    parser.add_argument("--api-key", default="mock-key")
+    parser.add_argument("--model", default="mock-gpt")
+    parser.add_argument("--requests", type=int, default=66)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    # 基准测试不写入本地遥测日志
+    settings.llm_telemetry_enabled = False
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
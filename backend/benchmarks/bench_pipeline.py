@@ -0,0 +1,322 @@
+"""
+端到端流水线压测
+
+模拟 N 个并发用户完整走一遍标书生成流程：
+    上传招标文件 → 分析项目概述 / 技术评分要求（analyze-stream）→ 生成目录（outline/generate）
+    → 逐个叶子章节生成正文（generate-chapter-stream）→ 导出 Word（export-word）
+统计整体吞吐、各阶段耗时百分位，以及后端进程的 CPU 与内存占用（需安装 psutil）。
+
+运行方式（在 backend 目录下）：
+    # 自动启动本地模拟服务和一个使用临时配置目录的后端进程
+    python -m benchmarks.bench_pipeline --spawn --users 5 --chapter-concurrency 5
+
+    # 压测已启动的后端（后端需已配置好模拟服务地址），--backend-pid 用于采集资源占用
+    python -m benchmarks.bench_pipeline --backend http://127.0.0.1:8000 --backend-pid 12345 --users 5
+
+    # 用真实服务商录制一次完整流程，之后离线回放作为回归基准（timing=none 时只剩后端自身开销）
+    python -m benchmarks.bench_pipeline --spawn --users 1 --base-url https://api.example.com/v1 --api-key sk-xxx \
+        --model some-model --cassette tender.jsonl --cassette-mode record
+    python -m benchmarks.bench_pipeline --spawn --users 1 --cassette tender.jsonl --cassette-mode replay --cassette-timing none
+
+    # 所有生成请求带上 use_cache=true：同一份招标文件第二次运行时分析、目录和正文都从 LLM 响应缓存回放
+    python -m benchmarks.bench_pipeline --spawn --users 1 --use-cache
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app.utils.stats_util import summarize
+
+try:
+    import psutil
+except ImportError:  # 未安装时不采集资源占用
+    psutil = None
+
+MOCK_PORT = 9201
+BACKEND_PORT = 8201
+STAGES = ["upload", "analyze_overview", "analyze_requirements", "outline_first_chapter", "outline", "chapter", "chapters_total", "export", "pipeline"]
+
+
+class ResourceSampler:
+    """定时采集后端进程的 CPU 与内存占用"""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.5):
+        self.interval = interval
+        self.cpu: List[float] = []
+        self.rss_mb: List[float] = []
+        self._process = psutil.Process(pid) if (psutil is not None and pid) else None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        self._process.cpu_percent(None)
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.cpu.append(self._process.cpu_percent(None))
+                self.rss_mb.append(self._process.memory_info().rss / 1024 / 1024)
+            except psutil.Error:
+                return
+
+    def start(self) -> None:
+        if self._process is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def report(self) -> Optional[Dict[str, float]]:
+        if not self.cpu:
+            return None
+        return {
+            "cpu_mean": sum(self.cpu) / len(self.cpu),
+            "cpu_max": max(self.cpu),
+            "rss_mb_max": max(self.rss_mb),
+            "rss_mb_last": self.rss_mb[-1],
+        }
+
+
+def _build_tender_docx(path: str, paragraphs: int) -> None:
+    """生成一份用于上传的模拟招标文件"""
+    import docx
+
+    document = docx.Document()
+    document.add_heading("某智慧园区信息化建设项目招标文件", level=1)
+    for i in range(paragraphs):
+        document.add_paragraph(
+            f"第{i + 1}条 项目需建设统一的数据平台、运维监控体系与安全防护体系，"
+            f"技术方案评分项{i % 8 + 1}：方案完整性、可实施性与先进性，满分10分。"
+        )
+    document.save(path)
+
+
+async def _iter_sse(response: httpx.Response) -> AsyncIterator[Any]:
+    """逐条解析 SSE 的 data 行"""
+    async for line in response.aiter_lines():
+        if not line.startswith("data: "):
+            continue
+        data = line[len("data: "):]
+        if data == "[DONE]":
+            return
+        yield json.loads(data)
+
+
+def _leaf_jobs(chapters: List[Dict[str, Any]], parents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按前端的方式收集叶子章节及其上级、同级章节"""
+    jobs = []
+    for chapter in chapters:
+        info = {"id": chapter.get("id"), "title": chapter.get("title"), "description": chapter.get("description", "")}
+        children = chapter.get("children") or []
+        if children:
+            jobs.extend(_leaf_jobs(children, parents + [info]))
+        else:
+            jobs.append({"chapter": chapter, "parent_chapters": parents, "sibling_chapters": chapters})
+    return jobs
+
+
+async def run_user(client: httpx.AsyncClient, args, tender_path: str, timings: Dict[str, List[float]]) -> None:
+    """单个用户的完整流程"""
+    pipeline_start = time.perf_counter()
+
+    start = time.perf_counter()
+    content_type = "application/pdf" if tender_path.lower().endswith(".pdf") else \
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    with open(tender_path, "rb") as f:
+        response = await client.post(
+            "/api/document/upload",
+            files={"file": (os.path.basename(tender_path), f, content_type)},
+        )
+    upload = response.json()
+    if not upload.get("success"):
+        raise RuntimeError(f"上传失败: {upload.get('message')}")
+    timings["upload"].append(time.perf_counter() - start)
+    cache_flag = {"use_cache": True} if args.use_cache else {}
+
+    async def analyze(analysis_type: str) -> str:
+        start = time.perf_counter()
+        parts = []
+        payload = {"file_content": upload["file_content"], "analysis_type": analysis_type, **cache_flag}
+        async with client.stream("POST", "/api/document/analyze-stream", json=payload) as response:
+            async for event in _iter_sse(response):
+                if event.get("error"):
+                    raise RuntimeError(event.get("message"))
+                parts.append(event.get("chunk", ""))
+        timings[f"analyze_{analysis_type}"].append(time.perf_counter() - start)
+        return "".join(parts)
+
+    overview, requirements = await asyncio.gather(analyze("overview"), analyze("requirements"))
+
+    start = time.perf_counter()
+    parts = []
+    async with client.stream("POST", "/api/outline/generate", json={"overview": overview, "requirements": requirements, **cache_flag}) as response:
+        async for event in _iter_sse(response):
+            if event.get("error"):
+                raise RuntimeError(event.get("message"))
+            if event.get("status") == "outline_chapter" and event.get("completed") == 1:
+                timings["outline_first_chapter"].append(time.perf_counter() - start)
+            parts.append(event.get("chunk", ""))
+    outline = json.loads("".join(parts))["outline"]
+    timings["outline"].append(time.perf_counter() - start)
+
+    semaphore = asyncio.Semaphore(args.chapter_concurrency)
+
+    async def generate_chapter(job: Dict[str, Any]) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            content = ""
+            payload = {**job, "project_overview": overview, **cache_flag}
+            async with client.stream("POST", "/api/content/generate-chapter-stream", json=payload) as response:
+                async for event in _iter_sse(response):
+                    if event.get("status") == "error":
+                        raise RuntimeError(event.get("message"))
+                    if event.get("status") == "completed":
+                        content = event.get("content", "")
+            job["chapter"]["content"] = content
+            timings["chapter"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[generate_chapter(job) for job in _leaf_jobs(outline, [])])
+    timings["chapters_total"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    response = await client.post(
+        "/api/document/export-word",
+        json={"project_name": "压测项目", "project_overview": overview, "outline": outline},
+    )
+    response.raise_for_status()
+    timings["export"].append(time.perf_counter() - start)
+    timings["pipeline"].append(time.perf_counter() - pipeline_start)
+
+
+async def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.3)
+    raise RuntimeError(f"服务未就绪: {url}")
+
+
+def _print_report(timings: Dict[str, List[float]], wall: float, users: int, failures: int, resources: Optional[Dict[str, float]]) -> None:
+    completed = len(timings["pipeline"])
+    print(f"用户数={users} 完成={completed} 失败={failures} 总耗时={wall:.1f}s")
+    print(f"吞吐: {completed / wall * 60:.2f} 份标书/分钟, {len(timings['chapter']) / wall:.2f} 章节/秒")
+    for stage in STAGES:
+        if not timings.get(stage):
+            continue
+        stats = summarize(timings[stage])
+        print(f"  {stage:<22} n={stats['count']:<4} p50={stats['p50']:.2f}s p90={stats['p90']:.2f}s p99={stats['p99']:.2f}s")
+    if resources:
+        print(f"后端资源: CPU 平均={resources['cpu_mean']:.1f}% 峰值={resources['cpu_max']:.1f}% "
+              f"内存峰值={resources['rss_mb_max']:.1f}MB 结束时={resources['rss_mb_last']:.1f}MB")
+    elif psutil is None:
+        print("未安装 psutil，跳过后端资源采集")
+
+
+async def main_async(args) -> None:
+    processes = []
+    backend_url = args.backend
+    backend_pid = args.backend_pid
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        if args.spawn:
+            llm_base_url = args.base_url
+            if not llm_base_url:
+                processes.append(subprocess.Popen(
+                    [sys.executable, "-m", "benchmarks.mock_openai_server", "--port", str(MOCK_PORT),
+                     "--ttft", str(args.mock_ttft), "--tps", str(args.mock_tps)]
+                ))
+                llm_base_url = f"http://127.0.0.1:{MOCK_PORT}/v1"
+            # 后端使用临时 HOME，避免覆盖本机的用户配置、缓存和遥测日志
+            env = {**os.environ, "HOME": workdir, "USERPROFILE": workdir}
+            if args.cassette:
+                env.update({
+                    "LLM_CASSETTE_MODE": args.cassette_mode,
+                    "LLM_CASSETTE_PATH": os.path.abspath(args.cassette),
+                    "LLM_CASSETTE_TIMING": args.cassette_timing,
+                    "LLM_CASSETTE_SPEED": str(args.cassette_speed),
+                })
+            backend = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(BACKEND_PORT), "--log-level", "warning"],
+                env=env,
+            )
+            processes.append(backend)
+            backend_url = f"http://127.0.0.1:{BACKEND_PORT}"
+            backend_pid = backend.pid
+            if not args.base_url:
+                await _wait_ready(f"{llm_base_url}/models")
+            await _wait_ready(f"{backend_url}/health")
+            async with httpx.AsyncClient(base_url=backend_url) as client:
+                await client.post("/api/config/save", json={
+                    "api_key": args.api_key,
+                    "base_url": llm_base_url,
+                    "model_name": args.model,
+                })
+
+        tender_path = args.file
+        if not tender_path:
+            tender_path = os.path.join(workdir, "tender.docx")
+            _build_tender_docx(tender_path, args.paragraphs)
+
+        timings: Dict[str, List[float]] = defaultdict(list)
+        sampler = ResourceSampler(backend_pid)
+        sampler.start()
+        start = time.perf_counter()
+        async with httpx.AsyncClient(base_url=backend_url, timeout=None) as client:
+            results = await asyncio.gather(
+                *[run_user(client, args, tender_path, timings) for _ in range(args.users)],
+                return_exceptions=True,
+            )
+        wall = time.perf_counter() - start
+        await sampler.stop()
+
+        failures = [r for r in results if isinstance(r, Exception)]
+        for error in failures[:3]:
+            print(f"流程失败: {error}")
+        _print_report(timings, wall, args.users, len(failures), sampler.report())
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端流水线压测")
+    parser.add_argument("--backend", default="http://127.0.0.1:8000", help="后端地址（--spawn 时忽略）")
+    parser.add_argument("--backend-pid", type=int, default=None, help="后端进程 PID，用于采集 CPU/内存")
+    parser.add_argument("--spawn", action="store_true", help="自动启动模拟服务和后端")
+    parser.add_argument("--users", type=int, default=3, help="并发用户数")
+    parser.add_argument("--chapter-concurrency", type=int, default=5, help="每个用户同时生成的章节数")
+    parser.add_argument("--file", default=None, help="上传的招标文件（docx/pdf），留空自动生成")
+    parser.add_argument("--paragraphs", type=int, default=200, help="自动生成招标文件的段落数")
+    parser.add_argument("--mock-ttft", type=float, default=0.3, help="--spawn 时模拟服务的首 token 延迟")
+    parser.add_argument("--mock-tps", type=float, default=200.0, help="--spawn 时模拟服务的输出速度")
+    parser.add_argument("--base-url", default=None, help="--spawn 时改用真实服务商（不启动模拟服务）")
+    parser.add_argument("--api-key", default="mock-key")
+    parser.add_argument("--model", default="mock-gpt")
+    parser.add_argument("--cassette", default=None, help="--spawn 时后端使用的 cassette 文件")
+    parser.add_argument("--cassette-mode", choices=["record", "replay"], default="replay")
+    parser.add_argument("--cassette-timing", choices=["original", "compressed", "none"], default="original")
+    parser.add_argument("--cassette-speed", type=float, default=10.0)
+    parser.add_argument("--use-cache", action="store_true", help="生成请求带上 use_cache=true，重复运行时从 LLM 响应缓存回放")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
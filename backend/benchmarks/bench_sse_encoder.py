@@ -0,0 +1,52 @@
+"""
+SSE 事件编码基准测试
+
+对比旧的编码方式（json.dumps(ensure_ascii=False) 拼成字符串，再由 Starlette 编码为 UTF-8）
+与 utils.sse 的字节级编码（安装 orjson 时使用 orjson，否则退回标准库）每秒能编码的事件数。
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.bench_sse_encoder --frames 200000
+    # 模拟 v2 协议合并后的较大分片
+    python -m benchmarks.bench_sse_encoder --frames 50000 --chunk-chars 200
+"""
+import argparse
+import json
+import time
+from typing import Callable, List
+
+from app.utils import sse
+
+
+def _legacy(chunk: str) -> bytes:
+    return f"data: {json.dumps({'chunk': chunk}, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _stdlib(chunk: str) -> bytes:
+    return b"data: " + json.dumps({"chunk": chunk}, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n\n"
+
+
+def run(name: str, encode: Callable[[str], bytes], chunks: List[str]) -> None:
+    start = time.perf_counter()
+    total = 0
+    for chunk in chunks:
+        total += len(encode(chunk))
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<24} {len(chunks) / elapsed:>12,.0f} 帧/秒  平均 {total / len(chunks):.1f} 字节/帧")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE 事件编码基准测试")
+    parser.add_argument("--frames", type=int, default=200000, help="编码的事件数")
+    parser.add_argument("--chunk-chars", type=int, default=2, help="每个分片的字数")
+    args = parser.parse_args()
+
+    text = "技术方案实施\"步骤\"与质量保障措施\n"
+    chunks = [(text * (args.chunk_chars // len(text) + 1))[i % len(text):][:args.chunk_chars] for i in range(args.frames)]
+    print(f"{args.frames} 个事件，每个分片 {args.chunk_chars} 字，orjson {'已安装' if sse.ORJSON_AVAILABLE else '未安装'}")
+    run("旧编码（str + encode）", _legacy, chunks)
+    run("标准库字节编码", _stdlib, chunks)
+    run("sse.sse_chunk", sse.sse_chunk, chunks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+章节流式协议基准测试
+
+用合成的 token 流驱动 generate-chapter-stream 的事件编码，对比旧协议（1，每个事件附带完整内容）
+与增量协议（2，按时间窗口/字节数合并）每个章节发送的字节数、事件数和服务端 CPU 时间。
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.bench_sse_protocol --chars 3000 --chapters 20
+    # 模拟真实输出速度（每秒 60 个 token），观察时间窗口合并的效果
+    python -m benchmarks.bench_sse_protocol --chars 3000 --chapters 3 --tps 60
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, AsyncGenerator, Dict
+
+from app.config import settings
+from app.routers.content import chapter_stream_events
+
+
+async def _token_source(text: str, token_chars: int, tps: float) -> AsyncGenerator[str, None]:
+    interval = 1.0 / tps if tps > 0 else 0
+    for i in range(0, len(text), token_chars):
+        if interval:
+            await asyncio.sleep(interval)
+        yield text[i:i + token_chars]
+
+
+async def run_protocol(protocol: int, args) -> Dict[str, Any]:
+    text = "".join(f"第{i % 10}段技术方案内容，" for i in range(args.chars // 8 + 1))[:args.chars]
+    total_bytes = 0
+    total_events = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(args.chapters):
+        async for event in chapter_stream_events(_token_source(text, args.token_chars, args.tps), protocol):
+            total_bytes += len(event)
+            total_events += 1
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    return {
+        "protocol": protocol,
+        "bytes_per_chapter": total_bytes / args.chapters,
+        "events_per_chapter": total_events / args.chapters,
+        "cpu_ms_per_chapter": cpu * 1000 / args.chapters,
+        "wall_s": wall,
+    }
+
+
+async def main_async(args) -> None:
+    settings.sse_coalesce_window = args.window
+    settings.sse_coalesce_max_bytes = args.max_bytes
+    print(f"章节 {args.chars} 字，每个 token {args.token_chars} 字，tps={args.tps or '不限'}，"
+          f"合并窗口 {args.window}s / {args.max_bytes} 字节")
+    for protocol in (1, 2):
+        result = await run_protocol(protocol, args)
+        print(f"  协议 {protocol}: 每章节 {result['bytes_per_chapter'] / 1024:.1f} KB，"
+              f"{result['events_per_chapter']:.0f} 个事件，CPU {result['cpu_ms_per_chapter']:.2f} ms，"
+              f"总耗时 {result['wall_s']:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="章节流式协议基准测试")
+    parser.add_argument("--chars", type=int, default=3000, help="每个章节的字数")
+    parser.add_argument("--token-chars", type=int, default=2, help="每个 token 的字数")
+    parser.add_argument("--tps", type=float, default=0, help="每秒 token 数，0 表示不等待（只测 CPU）")
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--window", type=float, default=settings.sse_coalesce_window, help="合并时间窗口（秒）")
+    parser.add_argument("--max-bytes", type=int, default=settings.sse_coalesce_max_bytes, help="合并字节阈值")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+本地 OpenAI 兼容模拟服务
+
+用于在不消耗真实 API 额度的情况下压测后端。支持 /v1/models 与 /v1/chat/completions（流式/非流式）。
+
+- 普通请求返回固定长度的中文文本；
+- 要求 JSON 输出（response_format=json_object）的请求按提示词中的 JSON 模板返回结构合法的目录，
+  覆盖一级提纲、一级节点补全（二三级目录）、整体目录生成和方案扩写目录提取；
+- 可配置首 token 延迟、输出速度、错误注入和 429 限流注入；
+- 可模拟不支持 json_schema 结构化输出或不支持流式输出的服务商（用于验证能力探测与降级）；
+- 可模拟输出长度上限（finish_reason=length），用于验证截断后的自动续写。
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.mock_openai_server --port 9000 --ttft 0.3 --tps 60
+    python -m benchmarks.mock_openai_server --port 9001 --error-rate 0.5 --error-status 503
+    python -m benchmarks.mock_openai_server --port 9002 --rate-limit-rate 0.2 --retry-after 1
+    python -m benchmarks.mock_openai_server --port 9003 --no-json-schema --no-stream
+"""
+import argparse
+import ast
+import asyncio
+import copy
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class MockConfig:
+    """模拟服务参数"""
+    ttft: float = 0.3  # 首 token 延迟（秒）
+    tps: float = 60.0  # 每秒输出 token 数
+    tokens: int = 200  # 每次回复的 token 数
+    model: str = "mock-gpt"
+    error_rate: float = 0.0  # 请求直接返回错误的概率
+    error_status: int = 500  # 注入错误时返回的 HTTP 状态码
+    rate_limit_rate: float = 0.0  # 返回 429 的概率
+    retry_after: float = 1.0  # 429 响应携带的 Retry-After（秒）
+    outline_items: int = 6  # 一级提纲的条目数
+    outline_children: int = 3  # 通用目录模板中每个节点的子节点数
+    json_chunk_chars: int = 4  # JSON 输出按多少个字符切成一个 token
+    json_schema: bool = True  # 是否支持 response_format=json_schema，不支持时返回 400
+    streaming: bool = True  # 是否支持流式输出，不支持时流式请求返回 400
+    length_limit: int = 0  # 单次回复最多输出的 token 数，超出时以 finish_reason=length 截断，0 表示不限制
+
+
+config = MockConfig()
+app = FastAPI(title="Mock OpenAI")
+
+
+def _chunk_payload(completion_id: str, model: str, content: str = None, finish_reason: str = None) -> Dict[str, Any]:
+    """构造一个 chat.completion.chunk"""
+    delta: Dict[str, Any] = {}
+    if content is not None:
+        delta["content"] = content
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def _extract_templates(text: str) -> List[Any]:
+    """提取文本中所有可以解析的 JSON（或 Python 字面量形式的）对象与数组"""
+    templates = []
+    i = 0
+    while i < len(text):
+        if text[i] not in "{[":
+            i += 1
+            continue
+        depth = 0
+        end = None
+        in_string: Optional[str] = None
+        j = i
+        while j < len(text):
+            ch = text[j]
+            j += 1
+            if in_string:
+                if ch == "\\":
+                    j += 1  # 跳过转义字符
+                elif ch == in_string:
+                    in_string = None
+            elif ch in "\"'":
+                in_string = ch
+            elif ch in "{[":
+                depth += 1
+            elif ch in "}]":
+                depth -= 1
+                if depth == 0:
+                    end = j
+                    break
+        if end is None:
+            i += 1
+            continue
+        raw = text[i:end]
+        value = None
+        for parse in (json.loads, ast.literal_eval):
+            try:
+                value = parse(raw)
+                break
+            except (ValueError, SyntaxError):
+                continue
+        if isinstance(value, (dict, list)) and value:
+            templates.append(value)
+            i = end
+        else:
+            i += 1
+    return templates
+
+
+def _fill_node(node: Any, path: str, expand: bool) -> Any:
+    """按模板填充目录节点：空字符串替换为模拟文本，expand=True 时把单元素示例列表扩展为多个"""
+    if isinstance(node, list):
+        items = node
+        if expand and len(node) == 1:
+            items = [copy.deepcopy(node[0]) for _ in range(config.outline_children)]
+        return [_fill_node(item, f"{path}.{k + 1}" if path else f"{k + 1}", expand) for k, item in enumerate(items)]
+    if isinstance(node, dict):
+        result = {}
+        for key, value in node.items():
+            if key == "id" and expand:
+                result[key] = path
+            elif isinstance(value, str):
+                result[key] = value or f"模拟{key} {node.get('id', path)}"
+            else:
+                result[key] = _fill_node(value, path, expand)
+        return result
+    return node
+
+
+def _has_ids(items: Any) -> bool:
+    return isinstance(items, list) and bool(items) and isinstance(items[0], dict) and "id" in items[0]
+
+
+def _level1_items(template: List[Any]) -> List[Dict[str, str]]:
+    """一级提纲：[{rating_item, new_title}] 扩展为 outline_items 条"""
+    item = template[0] if template else {}
+    return [
+        {key: f"模拟{key} {k + 1}" for key in (item if isinstance(item, dict) else {"title": ""})}
+        for k in range(config.outline_items)
+    ]
+
+
+def _canned_json(body: Dict[str, Any]) -> str:
+    """根据提示词中的 JSON 模板构造结构合法的回复"""
+    text = "\n".join(str(message.get("content") or "") for message in body.get("messages", []))
+    templates = _extract_templates(text)
+    if not templates:
+        return json.dumps({"result": "mock"}, ensure_ascii=False)
+    # 取最大的模板作为输出格式
+    template = max(templates, key=lambda item: len(json.dumps(item, ensure_ascii=False)))
+
+    if isinstance(template, list):
+        result = _level1_items(template)
+    elif "outline" in template and not _has_ids(template["outline"]):
+        # 一级提纲：{"outline": [{rating_item, new_title}]}
+        result = {"outline": _level1_items(template["outline"])}
+    elif "outline" in template:
+        # 整体目录 / 扩写目录提取的示例模板
+        result = {"outline": _fill_node(template["outline"], "", expand=True)}
+    else:
+        # 一级节点补全：模板已给出二三级节点数量，只补全标题和描述
+        result = _fill_node(template, template.get("id", ""), expand=False)
+    return json.dumps(result, ensure_ascii=False)
+
+
+def _reply_tokens(body: Dict[str, Any]) -> list:
+    """生成回复 token 序列"""
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") in ("json_object", "json_schema"):
+        text = _canned_json(body)
+        size = max(1, config.json_chunk_chars)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+    return [f"字{i % 10}" for i in range(config.tokens)]
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": config.model, "object": "model", "owned_by": "mock"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema" and not config.json_schema:
+        return JSONResponse(
+            {"error": {"message": "response_format.type 'json_schema' is not supported", "type": "invalid_request_error"}},
+            status_code=400,
+        )
+    if body.get("stream") and not config.streaming:
+        return JSONResponse(
+            {"error": {"message": "stream is not supported", "type": "invalid_request_error"}},
+            status_code=400,
+        )
+    if config.rate_limit_rate > 0 and random.random() < config.rate_limit_rate:
+        return JSONResponse(
+            {"error": {"message": "mock rate limit", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={"retry-after": str(config.retry_after)},
+        )
+    if config.error_rate > 0 and random.random() < config.error_rate:
+        return JSONResponse(
+            {"error": {"message": "mock injected error", "type": "server_error", "code": config.error_status}},
+            status_code=config.error_status,
+        )
+    model = body.get("model") or config.model
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    tokens = _reply_tokens(body)
+    finish_reason = "stop"
+    if config.length_limit > 0 and len(tokens) > config.length_limit:
+        tokens = tokens[:config.length_limit]
+        finish_reason = "length"
+    usage = {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+
+    if not body.get("stream"):
+        await asyncio.sleep(config.ttft + len(tokens) / max(config.tps, 1e-6))
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": finish_reason}],
+            "usage": usage,
+        })
+
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    async def generate():
+        await asyncio.sleep(config.ttft)
+        interval = 1.0 / config.tps if config.tps > 0 else 0
+        for token in tokens:
+            yield f"data: {json.dumps(_chunk_payload(completion_id, model, token), ensure_ascii=False)}\n\n"
+            if interval:
+                await asyncio.sleep(interval)
+        yield f"data: {json.dumps(_chunk_payload(completion_id, model, finish_reason=finish_reason))}\n\n"
+        if include_usage:
+            payload = _chunk_payload(completion_id, model)
+            payload["choices"] = []
+            payload["usage"] = usage
+            yield f"data: {json.dumps(payload)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--ttft", type=float, default=config.ttft, help="首 token 延迟（秒）")
+    parser.add_argument("--tps", type=float, default=config.tps, help="每秒输出 token 数")
+    parser.add_argument("--tokens", type=int, default=config.tokens, help="每次回复的 token 数")
+    parser.add_argument("--error-rate", type=float, default=config.error_rate, help="注入错误的概率（0~1）")
+    parser.add_argument("--error-status", type=int, default=config.error_status, help="注入错误的 HTTP 状态码")
+    parser.add_argument("--rate-limit-rate", type=float, default=config.rate_limit_rate, help="返回 429 的概率（0~1）")
+    parser.add_argument("--retry-after", type=float, default=config.retry_after, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--outline-items", type=int, default=config.outline_items, help="一级提纲条目数")
+    parser.add_argument("--outline-children", type=int, default=config.outline_children, help="通用目录模板每个节点的子节点数")
+    parser.add_argument("--no-json-schema", action="store_true", help="模拟不支持 json_schema 结构化输出的服务商")
+    parser.add_argument("--no-stream", action="store_true", help="模拟不支持流式输出的服务商")
+    parser.add_argument("--length-limit", type=int, default=config.length_limit, help="单次回复的 token 上限，超出时以 finish_reason=length 截断")
+    args = parser.parse_args()
+
+    config.ttft = args.ttft
+    config.tps = args.tps
+    config.tokens = args.tokens
+    config.error_rate = args.error_rate
+    config.error_status = args.error_status
+    config.rate_limit_rate = args.rate_limit_rate
+    config.retry_after = args.retry_after
+    config.outline_items = args.outline_items
+    config.outline_children = args.outline_children
+    config.json_schema = not args.no_json_schema
+    config.streaming = not args.no_stream
+    config.length_limit = args.length_limit
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
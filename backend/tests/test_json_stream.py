@@ -0,0 +1,174 @@
+"""增量 JSON 解析与流式结构校验"""
+import json
+
+import pytest
+
+from app.utils.json_stream import IncrementalJsonParser, JsonStreamError, OutlineNodeExtractor, StreamingJsonValidator
+
+OUTLINE_SCHEMA = {"outline": [{"id": "1", "title": "", "description": "", "children": []}]}
+
+DOCUMENTS = [
+    {"outline": [{"id": "1", "title": "技术方案", "description": "说明", "children": [{"id": "1.1", "title": "x"}]}]},
+    [1, -2.5, 3e2, True, False, None, "a\"b\\c\n\t/"],
+    {"empty": {}, "list": [], "nested": [[[]]], "unicode": "中文 😀"},
+    "just a string",
+    -0.125,
+]
+
+
+def _feed_chars(parser: IncrementalJsonParser, text: str) -> None:
+    for ch in text:
+        parser.feed(ch)
+
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+def test_char_by_char_matches_json_loads(document):
+    for text in (json.dumps(document), json.dumps(document, ensure_ascii=False, indent=2)):
+        parser = IncrementalJsonParser()
+        _feed_chars(parser, text)
+        assert parser.close() == json.loads(text)
+
+
+def test_value_callbacks_report_paths():
+    starts, ends = [], []
+    parser = IncrementalJsonParser(
+        on_value_start=lambda path, kind: starts.append((path, kind)),
+        on_value_end=lambda path, value: ends.append(path),
+    )
+    parser.feed('{"a": [1, {"b": null}]}')
+    parser.close()
+    assert starts == [
+        ((), "object"), (("a",), "array"), (("a", 0), "number"), (("a", 1), "object"), (("a", 1, "b"), "null"),
+    ]
+    assert ends == [("a", 0), ("a", 1, "b"), ("a", 1), ("a",), ()]
+
+
+def test_surrogate_pair_escape_split_across_chunks():
+    text = json.dumps({"emoji": "😀x"})  # 默认 ensure_ascii 把表情编码为 UTF-16 代理对
+    assert "\\ud83d\\ude00" in text
+    parser = IncrementalJsonParser()
+    _feed_chars(parser, text)
+    assert parser.close() == {"emoji": "😀x"}
+
+    # 在代理对中间切分
+    parser = IncrementalJsonParser()
+    cut = text.index("\\ude00") - 2
+    parser.feed(text[:cut])
+    parser.feed(text[cut:])
+    assert parser.close() == {"emoji": "😀x"}
+
+
+def test_lone_surrogate_kept_like_json_loads():
+    text = '"\\ud83d"'
+    parser = IncrementalJsonParser()
+    parser.feed(text)
+    assert parser.close() == json.loads(text)
+
+
+@pytest.mark.parametrize("text", ['{"a" 1}', '[1,,2]', '{"a": tru}', '"a\\q"', '{"a": "x\ny"}', "[1] 2"])
+def test_syntax_errors_raise(text):
+    parser = IncrementalJsonParser()
+    with pytest.raises(JsonStreamError):
+        _feed_chars(parser, text)
+        parser.close()
+
+
+def test_incomplete_input_raises_on_close():
+    parser = IncrementalJsonParser()
+    parser.feed('{"a": [1, 2')
+    with pytest.raises(JsonStreamError):
+        parser.close()
+
+
+def test_trailing_number_completed_on_close():
+    parser = IncrementalJsonParser()
+    parser.feed("12")
+    parser.feed("3")
+    assert parser.close() == 123
+
+
+def test_validator_accepts_matching_stream_char_by_char():
+    validator = StreamingJsonValidator(OUTLINE_SCHEMA)
+    text = "好的，目录如下：\n```json\n" + json.dumps(DOCUMENTS[0], ensure_ascii=False) + "\n```"
+    for ch in text:
+        assert validator.feed(ch) is None
+    assert validator.close() is None
+
+
+def test_validator_aborts_early_on_type_mismatch():
+    validator = StreamingJsonValidator(OUTLINE_SCHEMA)
+    text = '{"outline": [{"id": 1, "title": "' + "很长的标题" * 100 + '"}]}'
+    error = None
+    for i, ch in enumerate(text):
+        error = validator.feed(ch)
+        if error:
+            break
+    assert error is not None and ".outline[0].id" in error
+    # 在错误值读完时就停止，不必等剩余的输出
+    assert i < text.index("title")
+
+
+def test_validator_aborts_on_missing_key_when_object_closes():
+    validator = StreamingJsonValidator(OUTLINE_SCHEMA)
+    text = '{"outline": [{"id": "1", "title": "a", "children": []}, {"id": "2"'
+    error = validator.feed(text)
+    assert error is not None and "description" in error
+
+
+def test_validator_defers_repairable_problems():
+    # 顶层少了 {"outline": ...} 包裹：交给 repair_json，不提前终止
+    validator = StreamingJsonValidator(OUTLINE_SCHEMA)
+    assert validator.feed('[{"id": "1"') is None
+    assert validator.deferred is not None
+    assert validator.close() is None
+
+    # 多余的逗号属于语法错误，同样留给本地修复
+    validator = StreamingJsonValidator(OUTLINE_SCHEMA)
+    assert validator.feed('{"outline": [{"id": "1", "title": "a", "description": "", "children": []},]}') is None
+    assert validator.deferred is not None
+
+
+def test_validator_reports_incomplete_output_on_close():
+    validator = StreamingJsonValidator(OUTLINE_SCHEMA)
+    validator.feed('{"outline": [')
+    assert validator.close() is not None
+
+
+def test_outline_extractor_emits_children_before_parents():
+    document = {"outline": [
+        {"id": "1", "title": "一", "description": "d1", "children": [
+            {"id": "1.1", "title": "一.一", "description": "", "children": []},
+            {"id": "1.2", "title": "一.二", "description": "", "children": [
+                {"id": "1.2.1", "title": "深层", "description": ""},
+            ]},
+        ]},
+        {"id": "2", "title": "二", "description": "d2", "children": []},
+    ]}
+    text = "```json\n" + json.dumps(document, ensure_ascii=False) + "\n```"
+    extractor = OutlineNodeExtractor()
+    nodes = []
+    for ch in text:
+        nodes.extend(extractor.feed(ch))
+    assert [(n["id"], n["path"], n["leaf"]) for n in nodes] == [
+        ("1.1", [0, 0], True),
+        ("1.2.1", [0, 1, 0], True),
+        ("1.2", [0, 1], False),
+        ("1", [0], False),
+        ("2", [1], True),
+    ]
+    assert nodes[3]["description"] == "d1"
+    assert extractor.error is None
+
+
+def test_outline_extractor_emits_node_as_soon_as_it_closes():
+    extractor = OutlineNodeExtractor()
+    assert extractor.feed('[{"id": "1", "title": "a", "children": [{"id": "1.1", "title": "b"') == []
+    assert [n["id"] for n in extractor.feed("}")] == ["1.1"]
+    assert [n["id"] for n in extractor.feed("]}")] == ["1"]
+
+
+def test_outline_extractor_stops_on_syntax_error():
+    extractor = OutlineNodeExtractor()
+    assert [n["id"] for n in extractor.feed('[{"id": "1", "title": "a"}, {"id": "2",, ')] == ["1"]
+    assert extractor.error is not None
+    assert extractor.feed('"title": "b"}]') == []
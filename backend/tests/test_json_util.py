@@ -0,0 +1,64 @@
+"""模板校验器缓存与本地 JSON 修复"""
+import json
+
+from app.utils import json_util
+from app.utils.json_util import check_json, compile_schema, repair_json
+
+OUTLINE_SCHEMA = {"outline": [{"id": "1", "title": "", "children": []}]}
+NODE = {"id": "1", "title": "技术方案", "children": []}
+
+
+def test_compile_schema_reuses_validator_without_reserializing(monkeypatch):
+    schema = {"outline": [{"id": "1", "title": ""}]}
+    compiled = compile_schema(schema)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("同一个模板对象不应再次序列化")
+
+    monkeypatch.setattr(json_util.json, "dumps", fail)
+    assert compile_schema(schema) is compiled
+
+
+def test_compile_schema_shares_validator_between_equal_templates():
+    first = {"a": 1, "b": [""]}
+    second = {"b": [""], "a": 1}
+    assert compile_schema(first) is compile_schema(second)
+
+
+def test_check_json_accepts_dict_and_text_schema():
+    data = json.dumps({"outline": [NODE]}, ensure_ascii=False)
+    assert check_json(data, OUTLINE_SCHEMA) == (True, "")
+    assert check_json(data, json.dumps(OUTLINE_SCHEMA)) == (True, "")
+    isok, error = check_json('{"outline": []}', OUTLINE_SCHEMA)
+    assert not isok and "列表为空" in error
+
+
+def test_repair_strips_fences_and_surrounding_text():
+    text = "以下是目录：\n```json\n" + json.dumps({"outline": [NODE]}, ensure_ascii=False) + "\n```\n希望对你有帮助"
+    repaired, steps = repair_json(text, OUTLINE_SCHEMA)
+    assert json.loads(repaired) == {"outline": [NODE]}
+    assert steps == ["strip_fences", "extract"]
+
+
+def test_repair_removes_trailing_commas_outside_strings():
+    text = '{"outline": [{"id": "1", "title": "a,]", "children": [],},],}'
+    repaired, steps = repair_json(text, OUTLINE_SCHEMA)
+    assert json.loads(repaired) == {"outline": [{"id": "1", "title": "a,]", "children": []}]}
+    assert steps == ["trailing_commas"]
+
+
+def test_repair_wraps_and_unwraps_outline():
+    repaired, steps = repair_json(json.dumps([NODE]), OUTLINE_SCHEMA)
+    assert json.loads(repaired) == {"outline": [NODE]}
+    assert steps == ["wrap"]
+
+    repaired, steps = repair_json(json.dumps({"chapters": [NODE]}), [NODE])
+    assert json.loads(repaired) == [NODE]
+    assert steps == ["unwrap"]
+
+
+def test_repair_gives_up_on_unfixable_output():
+    assert repair_json("没有 JSON", OUTLINE_SCHEMA) == (None, [])
+    assert repair_json('{"outline": [{"id": "1"', OUTLINE_SCHEMA)[0] is None
+    # 语法修好了但结构仍不符合模板
+    assert repair_json('{"outline": [{"id": 1, "title": "", "children": []}]}', OUTLINE_SCHEMA)[0] is None
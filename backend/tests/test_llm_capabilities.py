@@ -0,0 +1,40 @@
+"""端点能力注册表：stream_options 拒绝判断"""
+import httpx
+import openai
+
+from app.services.llm_capabilities import CapabilityRegistry, mentions_stream_options
+
+
+def _status_error(status: int, message: str, param=None) -> openai.APIStatusError:
+    request = httpx.Request("POST", "http://llm.test/v1/chat/completions")
+    body = {"message": message, "type": "invalid_request_error", "param": param}
+    response = httpx.Response(status, request=request, json={"error": body})
+    return openai.APIStatusError(f"Error code: {status} - {message}", response=response, body=body)
+
+
+def test_mentions_stream_options_in_message_or_param():
+    assert mentions_stream_options(_status_error(400, "Unrecognized request argument supplied: stream_options"))
+    assert mentions_stream_options(_status_error(400, "invalid value", param="stream_options.include_usage"))
+    assert not mentions_stream_options(_status_error(400, "This model's maximum context length is 8192 tokens"))
+
+
+def test_reject_stream_options_only_when_error_names_it():
+    registry = CapabilityRegistry()
+    assert registry.stream_params("http://llm.test", "m") == {"stream_options": {"include_usage": True}}
+
+    # 与 stream_options 无关的 400（上下文超长、模型名错误）不能把端点记为不支持
+    assert not registry.reject_stream_options("http://llm.test", "m", _status_error(400, "context_length_exceeded"))
+    assert not registry.reject_stream_options("http://llm.test", "m", _status_error(404, "model not found: stream_options"))
+    assert registry.stream_params("http://llm.test", "m") != {}
+
+    assert registry.reject_stream_options(
+        "http://llm.test", "m", _status_error(400, "Unrecognized request argument supplied: stream_options")
+    )
+    assert registry.stream_params("http://llm.test", "m") == {}
+    assert registry.stream_params("http://llm.test", "other") != {}
+    assert registry.stats["downgraded_stream_options"] == 1
+
+
+def test_reject_stream_options_ignores_non_http_errors():
+    registry = CapabilityRegistry()
+    assert not registry.reject_stream_options("", "m", ValueError("stream_options"))
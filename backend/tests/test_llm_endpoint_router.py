@@ -0,0 +1,91 @@
+"""多端点路由：端点故障判断、配置变化与加权选路"""
+import random
+from collections import Counter
+
+import httpx
+import openai
+import pytest
+
+from app.services.llm_endpoint_router import EndpointRouter, is_endpoint_failure
+
+_REQUEST = httpx.Request("POST", "http://llm.test/v1/chat/completions")
+
+
+def _status_error(status: int) -> openai.APIStatusError:
+    response = httpx.Response(status, request=_REQUEST, json={"error": {"message": "x"}})
+    return openai.APIStatusError(f"Error code: {status}", response=response, body=None)
+
+
+@pytest.mark.parametrize("status", [408, 409, 429, 500, 502, 503, 529])
+def test_retryable_statuses_are_endpoint_failures(status):
+    assert is_endpoint_failure(_status_error(status))
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404, 413, 422])
+def test_client_errors_are_not_endpoint_failures(status):
+    assert not is_endpoint_failure(_status_error(status))
+
+
+def test_connection_errors_and_timeouts_are_endpoint_failures():
+    assert is_endpoint_failure(openai.APIConnectionError(request=_REQUEST))
+    assert is_endpoint_failure(openai.APITimeoutError(request=_REQUEST))
+    # 流读取中途断开时 SDK 不再包装，直接抛出 httpx 的传输错误
+    assert is_endpoint_failure(httpx.ReadError("connection reset"))
+    assert is_endpoint_failure(httpx.RemoteProtocolError("peer closed connection"))
+
+
+def test_local_errors_are_not_endpoint_failures():
+    assert not is_endpoint_failure(ValueError("bad json"))
+    assert not is_endpoint_failure(KeyError("choices"))
+
+
+def _spec(name: str, weight: float = 1.0) -> dict:
+    return {"name": name, "base_url": f"http://{name}.test/v1", "api_key": "k", "model_name": "m", "weight": weight}
+
+
+def test_resolve_keeps_state_and_prunes_removed_endpoints():
+    router = EndpointRouter()
+    a, b = router.resolve([_spec("a"), _spec("b")])
+    router.on_dispatch(a)
+    router.on_complete(a, True, 0.5)
+
+    # 同一端点的状态跨请求保留
+    assert router.resolve([_spec("a"), _spec("b", 2.0)])[0] is a
+    assert b.weight == 2.0
+
+    # 仍有在途请求的旧端点暂时保留，请求结束后的下一次解析时移除
+    router.on_dispatch(b)
+    router.resolve([_spec("a")])
+    assert {stats["name"] for stats in router.get_stats()} == {"a", "b"}
+    router.on_complete(b, True, 0.5)
+    router.resolve([_spec("a")])
+    assert [stats["name"] for stats in router.get_stats()] == ["a"]
+
+
+def test_select_distributes_by_weight(monkeypatch):
+    monkeypatch.setattr(random, "choices", random.Random(0).choices)
+    router = EndpointRouter()
+    endpoints = router.resolve([_spec("a", 3.0), _spec("b", 1.0)])
+    counts = Counter(router.select(endpoints).name for _ in range(4000))
+    assert 2.6 < counts["a"] / counts["b"] < 3.4
+
+
+def test_select_prefers_faster_and_healthier_endpoints(monkeypatch):
+    monkeypatch.setattr(random, "choices", random.Random(0).choices)
+    router = EndpointRouter()
+    fast, slow = router.resolve([_spec("fast"), _spec("slow")])
+    fast.ewma_ttft, slow.ewma_ttft = 0.2, 1.0
+    counts = Counter(router.select([fast, slow]).name for _ in range(4000))
+    assert counts["fast"] > 3 * counts["slow"] > 0
+
+
+def test_select_skips_open_breakers_and_excluded_endpoints():
+    router = EndpointRouter()
+    a, b = router.resolve([_spec("a"), _spec("b")])
+    for _ in range(a.breaker.failure_threshold):
+        router.on_dispatch(a)
+        router.on_complete(a, False)
+    assert all(router.select([a, b]) is b for _ in range(50))
+    # 全部不可用时仍尝试最早熔断的端点
+    assert router.select([a, b], exclude=[b]) is a
+    assert router.select([a], exclude=[a]) is None
@@ -0,0 +1,86 @@
+"""LLM 调度器：优先级老化与 TPM 用量修正"""
+import asyncio
+from types import SimpleNamespace
+
+from app.config import settings
+from app.services.llm_scheduler import LLMScheduler, Priority, usage_tokens
+
+
+async def _grant_order(scheduler: LLMScheduler, holder, requests, pause: float):
+    """holder 占住唯一的并发名额，依次排入 requests（每个之后停顿 pause 秒），释放后记录放行顺序"""
+    order = []
+
+    async def wait(name, priority):
+        ticket = await scheduler.acquire(priority)
+        order.append(name)
+        scheduler.release(ticket)
+
+    tasks = []
+    for name, priority in requests:
+        tasks.append(asyncio.ensure_future(wait(name, priority)))
+        await asyncio.sleep(pause)
+    scheduler.release(holder)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_strict_priority_without_aging(monkeypatch):
+    monkeypatch.setattr(settings, "llm_priority_aging_seconds", 0.0)
+
+    async def scenario():
+        scheduler = LLMScheduler("test", max_concurrency=1)
+        holder = await scheduler.acquire(Priority.NORMAL)
+        requests = [("bulk", Priority.BULK), ("interactive", Priority.INTERACTIVE)]
+        return await _grant_order(scheduler, holder, requests, 0.06)
+
+    assert asyncio.run(scenario()) == ["interactive", "bulk"]
+
+
+def test_waiting_bulk_request_ages_ahead_of_new_interactive(monkeypatch):
+    monkeypatch.setattr(settings, "llm_priority_aging_seconds", 0.02)
+
+    async def scenario():
+        scheduler = LLMScheduler("test", max_concurrency=1)
+        holder = await scheduler.acquire(Priority.NORMAL)
+        requests = [("bulk", Priority.BULK), ("interactive", Priority.INTERACTIVE)]
+        order = await _grant_order(scheduler, holder, requests, 0.06)
+        return order, scheduler.get_stats()["aged_grants"]
+
+    order, aged = asyncio.run(scenario())
+    assert order == ["bulk", "interactive"]
+    assert aged == 1
+
+
+def test_cancelled_waiter_is_skipped():
+    async def scenario():
+        scheduler = LLMScheduler("test", max_concurrency=1)
+        holder = await scheduler.acquire(Priority.NORMAL)
+        cancelled = asyncio.ensure_future(scheduler.acquire(Priority.INTERACTIVE))
+        waiting = asyncio.ensure_future(scheduler.acquire(Priority.BULK))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        scheduler.release(holder)
+        ticket = await waiting
+        return ticket.priority, scheduler.in_flight
+
+    assert asyncio.run(scenario()) == (Priority.BULK, 1)
+
+
+def test_usage_tokens_prefers_provider_total():
+    assert usage_tokens(None) is None
+    assert usage_tokens(SimpleNamespace(total_tokens=120, prompt_tokens=100, completion_tokens=10)) == 120
+    assert usage_tokens(SimpleNamespace(prompt_tokens=100, completion_tokens=30)) == 130
+    assert usage_tokens(SimpleNamespace(prompt_tokens=100, completion_tokens=None)) is None
+
+
+def test_release_adjusts_tpm_by_actual_tokens():
+    async def scenario():
+        scheduler = LLMScheduler("test", tpm=10000)
+        ticket = await scheduler.acquire(Priority.NORMAL, estimated_tokens=3000)
+        before = scheduler.tpm_bucket.tokens
+        scheduler.release(ticket, actual_tokens=1000)
+        return before, scheduler.tpm_bucket.tokens
+
+    before, after = asyncio.run(scenario())
+    # 多预占的 2000 个 token 被归还（另有极少量按时间补充的令牌）
+    assert 1999 <= after - before < 2010
@@ -0,0 +1,112 @@
+"""SSE 编码与事件合并"""
+import asyncio
+
+import pytest
+
+from app.utils.sse import coalesce_chunks, coalesce_frames, format_sse, loads_json, sse_chunk, sse_status
+
+
+async def _source(*steps):
+    """按顺序产出分片；数字表示停顿的秒数。每个分片后让出事件循环，与真实的网络流一致"""
+    for step in steps:
+        if isinstance(step, str):
+            yield step
+            await asyncio.sleep(0)
+        else:
+            await asyncio.sleep(step)
+
+
+async def _frames(source, window: float, max_bytes: int):
+    return [frame async for frame in coalesce_chunks(source, window, max_bytes)]
+
+
+def test_coalesce_chunks_merges_within_window():
+    frames = asyncio.run(_frames(_source("a", "b", "c", 0.2, "d", "e"), 0.05, 1024))
+    assert frames == ["abc", "de"]
+
+
+def test_coalesce_chunks_flushes_on_size():
+    # 每个汉字 3 字节，累计达到 6 字节立即输出，不等定时器
+    frames = asyncio.run(_frames(_source("中", "文", "内", "容", "x"), 10.0, 6))
+    assert frames == ["中文", "内容", "x"]
+
+
+def test_coalesce_chunks_disabled_when_window_is_zero():
+    frames = asyncio.run(_frames(_source("a", "b", "c"), 0, 1024))
+    assert "".join(frames) == "abc"
+    assert len(frames) == 3
+
+
+def test_coalesce_chunks_reraises_upstream_error_after_pending_text():
+    async def failing():
+        yield "partial"
+        raise RuntimeError("upstream broke")
+
+    async def scenario():
+        frames = []
+        with pytest.raises(RuntimeError):
+            async for frame in coalesce_chunks(failing(), 0.01, 1024):
+                frames.append(frame)
+        return frames
+
+    assert asyncio.run(scenario()) == ["partial"]
+
+
+def test_coalesce_chunks_closes_upstream_when_consumer_stops():
+    closed = []
+
+    async def endless():
+        try:
+            while True:
+                yield "x"
+                await asyncio.sleep(0.001)
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        frames = coalesce_chunks(endless(), 0.005, 1024)
+        await frames.__anext__()
+        await frames.aclose()
+
+    asyncio.run(scenario())
+    assert closed == [True]
+
+
+def _payloads(batch):
+    return [(seq, loads_json(event[6:])) for seq, event in batch]
+
+
+def test_coalesce_frames_merges_consecutive_text_events():
+    batch = [
+        (1, format_sse({"v": 2, "delta": "你"})),
+        (2, format_sse({"v": 2, "delta": "好"})),
+        (3, format_sse({"v": 2, "delta": "！"})),
+    ]
+    assert _payloads(coalesce_frames(batch)) == [(3, {"v": 2, "delta": "你好！"})]
+
+
+def test_coalesce_frames_keeps_other_events_and_order():
+    batch = [
+        (1, sse_chunk("a")),
+        (2, sse_chunk("b")),
+        (3, sse_status("node_completed", id="1")),
+        (4, sse_chunk("c")),
+        (5, b"data: [DONE]\n\n"),
+    ]
+    merged = coalesce_frames(batch)
+    assert _payloads(merged[:1]) == [(2, {"chunk": "ab"})]
+    assert merged[1:] == batch[2:]
+
+
+def test_coalesce_frames_does_not_merge_events_with_different_fields():
+    batch = [
+        (1, format_sse({"delta": "a", "chapter_id": "1"})),
+        (2, format_sse({"delta": "b", "chapter_id": "2"})),
+        (3, format_sse({"chunk": "c"})),
+    ]
+    assert coalesce_frames(batch) == batch
+
+
+def test_coalesce_frames_single_event_is_unchanged():
+    batch = [(7, sse_chunk("only"))]
+    assert coalesce_frames(batch) == batch
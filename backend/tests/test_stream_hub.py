@@ -0,0 +1,154 @@
+"""可续传流：断线续传、订阅者计数、过期与内存上限"""
+import asyncio
+
+from starlette.requests import ClientDisconnect
+
+from app.config import settings
+from app.services.stream_hub import StreamHub
+from app.utils.sse import sse_response
+
+
+async def _events(*texts: str):
+    for text in texts:
+        yield f"data: {text}\n\n"
+
+
+async def _forever():
+    yield "data: first\n\n"
+    await asyncio.Event().wait()
+
+
+async def _collect(hub: StreamHub, session, after: int = 0) -> bytes:
+    return b"".join([frame async for frame in hub.subscribe(session, after)])
+
+
+def test_resume_replays_events_after_last_event_id():
+    async def scenario():
+        hub = StreamHub()
+        session = hub.start(_events("a", "b", "c"), route="/r", fingerprint="f")
+        await session._task
+
+        resumed, after = hub.resume(f"{session.stream_id}:1", "/r", "f")
+        assert resumed is session and after == 1
+        body = await _collect(hub, resumed, after)
+        assert b"data: a" not in body
+        assert b"id: %s:2\ndata: b" % session.stream_id.encode() in body
+        assert b"data: c" in body
+
+        # 接口或请求内容不一致时不能读到别的请求的结果
+        assert hub.resume(f"{session.stream_id}:1", "/other", "f") == (None, 0)
+        assert hub.resume(f"{session.stream_id}:1", "/r", "g") == (None, 0)
+        assert hub.stats["resume_mismatches"] == 2
+        assert hub.resume("unknown:1", "/r", "f") == (None, 0)
+
+    asyncio.run(scenario())
+
+
+def test_resume_after_dropped_events_reports_gap(monkeypatch):
+    monkeypatch.setattr(settings, "stream_buffer_events", 2)
+
+    async def scenario():
+        hub = StreamHub()
+        session = hub.start(_events("a", "b", "c", "d"))
+        await session._task
+        assert session.dropped == 2
+        body = await _collect(hub, session, 0)
+        assert b'"status":"gap","missed_events":2' in body
+        assert b"data: c" in body and b"data: d" in body
+        # 丢弃过事件的流无法完整补发，不再共享
+        assert hub.join("k") is None
+
+    asyncio.run(scenario())
+
+
+def test_finished_streams_expire_after_ttl(monkeypatch):
+    async def scenario():
+        hub = StreamHub()
+        session = hub.start(_events("a"), key="k")
+        await session._task
+        assert hub.join("k", reuse_completed=True) is session
+
+        monkeypatch.setattr(settings, "stream_buffer_ttl", 0.0)
+        assert hub.resume(f"{session.stream_id}:0") == (None, 0)
+        assert hub.stats["expired"] == 1
+        assert hub.join("k", reuse_completed=True) is None
+
+    asyncio.run(scenario())
+
+
+def test_completed_results_replayed_only_on_request():
+    async def scenario():
+        hub = StreamHub()
+        session = hub.start(_events("a"), key="k")
+        await session._task
+        assert hub.join("k", reuse_completed=False) is None
+
+    asyncio.run(scenario())
+
+
+def test_memory_cap_evicts_finished_streams_first(monkeypatch):
+    async def scenario():
+        hub = StreamHub()
+        done = hub.start(_events("x" * 100))
+        await done._task
+        live = hub.start(_forever())
+        live.attach()
+        await asyncio.sleep(0)
+
+        monkeypatch.setattr(settings, "stream_buffer_max_bytes", live.bytes + 10)
+        hub.enforce_memory_cap()
+        assert hub.stats["evicted"] == 1
+        assert done.stream_id not in hub._sessions
+        assert live.stream_id in hub._sessions
+
+        live.detach()
+        await asyncio.sleep(0)
+
+    monkeypatch.setattr(settings, "stream_detach_grace", 0.0)
+    asyncio.run(scenario())
+
+
+def test_last_detach_cancels_after_grace(monkeypatch):
+    monkeypatch.setattr(settings, "stream_detach_grace", 0.01)
+
+    async def scenario():
+        hub = StreamHub()
+        session = hub.start(_forever())
+        session.attach()
+        session.detach()
+        # 宽限期内重连不取消
+        session.attach()
+        await asyncio.sleep(0.03)
+        assert not session.finished
+        session.detach()
+        await asyncio.sleep(0.03)
+        assert session.finished and session.failed
+
+    asyncio.run(scenario())
+
+
+def test_response_closed_before_streaming_still_detaches(monkeypatch):
+    monkeypatch.setattr(settings, "stream_detach_grace", 0.0)
+
+    async def scenario():
+        hub = StreamHub()
+        session = hub.start(_forever())
+        session.attach()
+        response = sse_response(hub.subscribe(session), on_close=session.detach)
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("client gone")
+
+        scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+        try:
+            await response(scope, receive, send)
+        except ClientDisconnect:
+            pass
+        assert session.subscribers == 0
+        await asyncio.sleep(0.01)
+        assert session.finished
+
+    asyncio.run(scenario())
@@ -1,11 +1,11 @@
 /**
  * 内容编辑页面 - 完整标书预览和生成
  */
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import ReactMarkdown from 'react-markdown';
 import { OutlineData, OutlineItem } from '../types';
 import { DocumentTextIcon, PlayIcon, DocumentArrowDownIcon, CheckCircleIcon, ExclamationCircleIcon, ArrowUpIcon } from '@heroicons/react/24/outline';
-import { contentApi, ChapterContentRequest, documentApi } from '../services/api';
+import { contentApi, ChapterBatchRequest, ChapterContentRequest, documentApi } from '../services/api';
 import { saveAs } from 'file-saver';
 import { Paragraph, TextRun } from 'docx';
 import { draftStorage } from '../utils/draftStorage';
@@ -40,6 +40,11 @@ const ContentEdit: React.FC<ContentEditProps> = ({
   });
   const [leafItems, setLeafItems] = useState<OutlineItem[]>([]);
   const [showScrollToTop, setShowScrollToTop] = useState(false);
+  // 进行中的批次：可取消排队/生成中的章节，失败或已取消的章节可追加回同一批次重新生成
+  const [batchId, setBatchId] = useState<string | null>(null);
+  const [activeChapters, setActiveChapters] = useState<Set<string>>(new Set());
+  const [retryableChapters, setRetryableChapters] = useState<Set<string>>(new Set());
+  const finishedRef = useRef<Set<string>>(new Set());
 
   // 收集所有叶子节点
   const collectLeafItems = useCallback((items: OutlineItem[]): OutlineItem[] => {
@@ -90,6 +95,15 @@ const ContentEdit: React.FC<ContentEditProps> = ({
     return [];
   }, []);
 
+  // 构造单个章节的生成请求
+  const buildChapterRequest = (item: OutlineItem): ChapterContentRequest => ({
+    chapter: item,
+    parent_chapters: getParentChapters(item.id, outlineData?.outline || []),
+    sibling_chapters: getSiblingChapters(item.id, outlineData?.outline || []),
+    project_overview: outlineData?.project_overview || '',
+    stream_protocol: 2
+  });
+
   useEffect(() => {
     if (outlineData) {
       const leaves = collectLeafItems(outlineData.outline);
@@ -150,6 +164,22 @@ const ContentEdit: React.FC<ContentEditProps> = ({
           {/* 标题 */}
           <div className={`text-${level === 1 ? 'xl' : level === 2 ? 'lg' : 'base'} font-${level === 1 ? 'bold' : 'semibold'} text-gray-900 mb-2`}>
             {item.id} {item.title}
+            {isLeaf && batchId && activeChapters.has(item.id) && (
+              <button
+                onClick={() => handleCancelChapter(item.id)}
+                className="ml-3 text-xs font-normal text-gray-500 hover:text-red-600"
+              >
+                取消
+              </button>
+            )}
+            {isLeaf && batchId && retryableChapters.has(item.id) && (
+              <button
+                onClick={() => handleRetryChapter(item)}
+                className="ml-3 text-xs font-normal text-blue-600 hover:text-blue-800"
+              >
+                重新生成
+              </button>
+            )}
           </div>
           
           {/* 描述 */}
@@ -188,106 +218,43 @@ const ContentEdit: React.FC<ContentEditProps> = ({
     });
   };
 
-  // 生成单个章节内容
-  const generateItemContent = async (item: OutlineItem, projectOverview: string): Promise<OutlineItem> => {
-    if (!outlineData) throw new Error('缺少目录数据');
-    
-    // 将当前项目添加到正在生成的集合中
-    setProgress(prev => ({ 
-      ...prev, 
-      current: item.title,
-      generating: new Set([...Array.from(prev.generating), item.id])
-    }));
-    
+  // 取消批次中排队或生成中的章节，结果通过批量连接上的 cancelled 事件返回
+  const handleCancelChapter = async (chapterId: string) => {
+    if (!batchId) return;
     try {
-      // 获取上级章节和同级章节信息
-      const parentChapters = getParentChapters(item.id, outlineData.outline);
-      const siblingChapters = getSiblingChapters(item.id, outlineData.outline);
-
-      const request: ChapterContentRequest = {
-        chapter: item,
-        parent_chapters: parentChapters,
-        sibling_chapters: siblingChapters,
-        project_overview: projectOverview
-      };
-
-      const response = await contentApi.generateChapterContentStream(request);
-
-      if (!response.ok) throw new Error('生成失败');
-
-      const reader = response.body?.getReader();
-      if (!reader) throw new Error('无法读取响应');
-
-      let content = '';
-      const updatedItem = { ...item };
-      
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-
-        const chunk = new TextDecoder().decode(value);
-        const lines = chunk.split('\n');
-        
-        for (const line of lines) {
-          if (line.startsWith('data: ')) {
-            const data = line.slice(6);
-            if (data === '[DONE]') continue;
-            
-            try {
-              const parsed = JSON.parse(data);
-              
-              if (parsed.status === 'streaming' && parsed.full_content) {
-                // 实时更新内容
-                content = parsed.full_content;
-                updatedItem.content = content;
-                // 本地持久化（刷新后可恢复）
-                draftStorage.upsertChapterContent(item.id, content);
-                
-                // 实时更新叶子节点数据以触发重新渲染
-                setLeafItems(prevItems => {
-                  const newItems = [...prevItems];
-                  const index = newItems.findIndex(i => i.id === item.id);
-                  if (index !== -1) {
-                    newItems[index] = { ...updatedItem };
-                  }
-                  return newItems;
-                });
-              } else if (parsed.status === 'completed' && parsed.content) {
-                content = parsed.content;
-                updatedItem.content = content;
-                // 本地持久化（最终结果）
-                draftStorage.upsertChapterContent(item.id, content);
-              } else if (parsed.status === 'error') {
-                throw new Error(parsed.message);
-              }
-            } catch (e) {
-              // 忽略JSON解析错误
-            }
-          }
-        }
-      }
-
-      return updatedItem;
+      await contentApi.cancelBatchChapter(batchId, chapterId);
     } catch (error) {
-      setProgress(prev => ({
-        ...prev,
-        failed: [...prev.failed, item.title]
-      }));
-      throw error;
-    } finally {
-      // 从正在生成的集合中移除当前项目
+      console.error(`取消章节失败 ${chapterId}:`, error);
+    }
+  };
+
+  // 把失败或已取消的章节追加回进行中的批次重新生成
+  const handleRetryChapter = async (item: OutlineItem) => {
+    if (!batchId) return;
+    try {
+      const response = await contentApi.addBatchChapters(batchId, [buildChapterRequest(item)]);
+      const accepted: string[] = response.data.chapter_ids || [];
+      if (!accepted.includes(item.id)) return;
+      finishedRef.current.delete(item.id);
+      setRetryableChapters(prev => {
+        const next = new Set(Array.from(prev));
+        next.delete(item.id);
+        return next;
+      });
+      setActiveChapters(prev => new Set([...Array.from(prev), item.id]));
       setProgress(prev => {
-        const newGenerating = new Set(Array.from(prev.generating));
-        newGenerating.delete(item.id);
-        return {
-          ...prev,
-          generating: newGenerating
-        };
+        const failed = [...prev.failed];
+        const index = failed.indexOf(item.title);
+        if (index !== -1) failed.splice(index, 1);
+        return { ...prev, completed: Math.max(0, prev.completed - 1), failed };
       });
+    } catch (error) {
+      console.error(`重新生成章节失败 ${item.id}:`, error);
     }
   };
 
-  // 开始生成所有内容
+  // 开始生成所有内容：所有章节通过同一个流式连接返回，由服务端控制并发，
+  // 避免多个并发请求占满浏览器对同一域名的连接数
   const handleGenerateContent = async () => {
     if (!outlineData || leafItems.length === 0) return;
 
@@ -300,33 +267,128 @@ const ContentEdit: React.FC<ContentEditProps> = ({
       generating: new Set<string>()
     });
 
+    const updatedItems = [...leafItems];
+    const contents: Record<string, string> = {};
+    const finished = new Set<string>();
+    finishedRef.current = finished;
+    const titleOf = (id: string) => updatedItems.find(item => item.id === id)?.title || id;
+
+    // 更新章节内容并本地持久化（刷新后可恢复）
+    const updateItemContent = (id: string, content: string) => {
+      const index = updatedItems.findIndex(item => item.id === id);
+      if (index === -1) return;
+      updatedItems[index] = { ...updatedItems[index], content };
+      draftStorage.upsertChapterContent(id, content);
+      // 实时更新叶子节点数据以触发重新渲染
+      setLeafItems(prevItems => {
+        const newItems = [...prevItems];
+        const prevIndex = newItems.findIndex(item => item.id === id);
+        if (prevIndex !== -1) {
+          newItems[prevIndex] = { ...newItems[prevIndex], content };
+        }
+        return newItems;
+      });
+    };
+
+    // 章节结束（完成、失败或取消）
+    const finishItem = (id: string, failed: boolean) => {
+      if (finished.has(id)) return;
+      finished.add(id);
+      setActiveChapters(prev => {
+        const next = new Set(Array.from(prev));
+        next.delete(id);
+        return next;
+      });
+      if (failed) {
+        setRetryableChapters(prev => new Set([...Array.from(prev), id]));
+      }
+      setProgress(prev => {
+        const newGenerating = new Set(Array.from(prev.generating));
+        newGenerating.delete(id);
+        return {
+          ...prev,
+          completed: prev.completed + 1,
+          failed: failed ? [...prev.failed, titleOf(id)] : prev.failed,
+          generating: newGenerating
+        };
+      });
+    };
+
     try {
-      // 使用5个并发线程生成内容
-      const concurrency = 5;
-      const updatedItems = [...leafItems];
-      
-      for (let i = 0; i < leafItems.length; i += concurrency) {
-        const batch = leafItems.slice(i, i + concurrency);
-        const promises = batch.map(item => 
-          generateItemContent(item, outlineData.project_overview || '')
-            .then(updatedItem => {
-              const index = updatedItems.findIndex(ui => ui.id === updatedItem.id);
-              if (index !== -1) {
-                updatedItems[index] = updatedItem;
-              }
-              setProgress(prev => ({ ...prev, completed: prev.completed + 1 }));
-              return updatedItem;
-            })
-            .catch(error => {
-              console.error(`生成内容失败 ${item.title}:`, error);
-              setProgress(prev => ({ ...prev, completed: prev.completed + 1 }));
-              return item; // 返回原始项目
-            })
-        );
-
-        await Promise.all(promises);
+      const request: ChapterBatchRequest = {
+        chapters: leafItems.map(buildChapterRequest)
+      };
+
+      const response = await contentApi.generateChaptersStream(request);
+
+      if (!response.ok) throw new Error('生成失败');
+
+      const reader = response.body?.getReader();
+      if (!reader) throw new Error('无法读取响应');
+
+      const decoder = new TextDecoder();
+      // 一个事件可能被拆到两次读取中，未读完整的行留到下一次
+      let pending = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        pending += decoder.decode(value, { stream: true });
+        const lines = pending.split('\n');
+        pending = lines.pop() || '';
+
+        for (const line of lines) {
+          if (!line.startsWith('data: ')) continue;
+          const data = line.slice(6);
+          if (data === '[DONE]') continue;
+
+          let parsed: any;
+          try {
+            parsed = JSON.parse(data);
+          } catch (e) {
+            // 忽略JSON解析错误
+            continue;
+          }
+
+          if (parsed.status === 'batch_started') {
+            setBatchId(parsed.batch_id);
+            setActiveChapters(new Set<string>(parsed.chapter_ids || []));
+            continue;
+          }
+
+          const id: string | undefined = parsed.chapter_id;
+          if (!id) continue;
+
+          if (parsed.status === 'started') {
+            // 重新生成的章节从头开始
+            contents[id] = '';
+            // 将当前章节添加到正在生成的集合中
+            setProgress(prev => ({
+              ...prev,
+              current: titleOf(id),
+              generating: new Set([...Array.from(prev.generating), id])
+            }));
+          } else if (parsed.status === 'delta' && parsed.delta) {
+            // 实时追加增量内容
+            contents[id] = (contents[id] || '') + parsed.delta;
+            updateItemContent(id, contents[id]);
+          } else if (parsed.status === 'completed') {
+            if (parsed.content) {
+              contents[id] = parsed.content;
+              updateItemContent(id, parsed.content);
+            }
+            finishItem(id, false);
+          } else if (parsed.status === 'error' || parsed.status === 'cancelled') {
+            console.error(`生成内容失败 ${titleOf(id)}:`, parsed.message || parsed.status);
+            finishItem(id, true);
+          }
+        }
       }
 
+      // 连接提前结束时，未收到结果的章节记为失败
+      leafItems.forEach(item => finishItem(item.id, true));
+
       // 更新状态
       setLeafItems(updatedItems);
       
@@ -337,6 +399,9 @@ const ContentEdit: React.FC<ContentEditProps> = ({
       console.error('生成内容时出错:', error);
     } finally {
       setIsGenerating(false);
+      setBatchId(null);
+      setActiveChapters(new Set());
+      setRetryableChapters(new Set());
       setProgress(prev => ({ ...prev, current: '', generating: new Set<string>() }));
     }
   };
@@ -157,13 +157,19 @@ const DocumentAnalysis: React.FC<DocumentAnalysisProps> = ({
               if (data === '[DONE]') {
                 break;
               }
+              let parsed: any;
               try {
-                const parsed = JSON.parse(data);
-                if (parsed.chunk) {
-                  onChunk(parsed.chunk);
-                }
+                parsed = JSON.parse(data);
               } catch (e) {
                 // 忽略JSON解析错误
+                continue;
+              }
+              // 生成失败时服务端发送错误事件，抛出后由外层显示错误信息
+              if (parsed.error || parsed.status === 'error') {
+                throw new Error(parsed.message || '标书解析失败');
+              }
+              if (parsed.chunk) {
+                onChunk(parsed.chunk);
               }
             }
           }
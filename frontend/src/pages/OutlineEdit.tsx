@@ -23,6 +23,8 @@ const OutlineEdit: React.FC<OutlineEditProps> = ({
   const [expandedItems, setExpandedItems] = useState<Set<string>>(new Set());
   const [message, setMessage] = useState<{ type: 'success' | 'error'; text: string } | null>(null);
   const [streamingContent, setStreamingContent] = useState('');
+  // 流式生成过程中已完整生成的目录节点（服务端 node_completed 事件）
+  const [completedNodes, setCompletedNodes] = useState<{ id: string; title: string; path: number[] }[]>([]);
   const [editingItem, setEditingItem] = useState<string | null>(null);
   const [editTitle, setEditTitle] = useState('');
   const [editDescription, setEditDescription] = useState('');
@@ -67,6 +69,7 @@ const OutlineEdit: React.FC<OutlineEditProps> = ({
       setGenerating(true);
       setMessage(null);
       setStreamingContent('');
+      setCompletedNodes([]);
 
       const response = await outlineApi.generateOutlineStream({
         overview: projectOverview,
@@ -82,14 +85,18 @@ const OutlineEdit: React.FC<OutlineEditProps> = ({
       }
 
       let result = '';
+      let streamError = '';
       const decoder = new TextDecoder();
+      // 一个事件可能被拆到两次读取中，未读完整的行留到下一次
+      let pending = '';
 
       while (true) {
         const { done, value } = await reader.read();
         if (done) break;
 
-        const chunk = decoder.decode(value, { stream: true });
-        const lines = chunk.split('\n');
+        pending += decoder.decode(value, { stream: true });
+        const lines = pending.split('\n');
+        pending = lines.pop() || '';
 
         for (const line of lines) {
           if (line.startsWith('data: ')) {
@@ -99,7 +106,21 @@ const OutlineEdit: React.FC<OutlineEditProps> = ({
             }
             try {
               const parsed = JSON.parse(data);
-              if (parsed.chunk) {
+              if (parsed.status === 'node_completed') {
+                // 按目录顺序插入已完成的节点（子节点先于父节点完成）
+                const node = { id: parsed.id, title: parsed.title, path: parsed.path as number[] };
+                setCompletedNodes(prev => {
+                  const comparePath = (a: number[], b: number[]) => {
+                    for (let i = 0; i < Math.min(a.length, b.length); i++) {
+                      if (a[i] !== b[i]) return a[i] - b[i];
+                    }
+                    return a.length - b.length;
+                  };
+                  return [...prev, node].sort((a, b) => comparePath(a.path, b.path));
+                });
+              } else if (parsed.error || parsed.status === 'error') {
+                streamError = parsed.message || '目录生成失败';
+              } else if (parsed.chunk) {
                 result += parsed.chunk;
                 // 实时显示生成的内容
                 setStreamingContent(result);
@@ -111,6 +132,11 @@ const OutlineEdit: React.FC<OutlineEditProps> = ({
         }
       }
 
+      // 生成失败时显示服务端返回的错误信息
+      if (streamError) {
+        throw new Error(streamError);
+      }
+
       // 解析最终结果
       try {
         const outlineJson = JSON.parse(result);
@@ -569,6 +595,19 @@ const OutlineEdit: React.FC<OutlineEditProps> = ({
         {generating && streamingContent && (
           <div className="mt-4 p-4 bg-blue-50 border border-blue-200 rounded-md">
             <h4 className="text-sm font-medium text-blue-800 mb-2">正在生成目录结构...</h4>
+            {completedNodes.length > 0 && (
+              <div className="bg-white p-3 rounded border mb-2 max-h-48 overflow-y-auto">
+                {completedNodes.map(node => (
+                  <div
+                    key={node.path.join('-')}
+                    className="text-sm text-gray-800"
+                    style={{ paddingLeft: `${(node.path.length - 1) * 16}px` }}
+                  >
+                    {node.id} {node.title}
+                  </div>
+                ))}
+              </div>
+            )}
             <div className="bg-white p-3 rounded border max-h-48 overflow-y-auto">
               <pre className="text-xs text-gray-700 whitespace-pre-wrap font-mono">
                 {streamingContent}
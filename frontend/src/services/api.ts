@@ -55,6 +55,12 @@ export interface ChapterContentRequest {
   parent_chapters?: any[];
   sibling_chapters?: any[];
   project_overview: string;
+  stream_protocol?: number; // 2：只推送增量，完整内容在 completed 事件中；1：旧协议，每个事件附带完整内容
+}
+
+export interface ChapterBatchRequest {
+  chapters: ChapterContentRequest[];
+  concurrency?: number; // 同时生成的章节数，留空按服务端配置
 }
 
 // 配置相关API
@@ -140,6 +146,24 @@ export const contentApi = {
       },
       body: JSON.stringify(data),
     }),
+
+  // 在一个连接中流式生成多个章节（事件带 chapter_id）
+  generateChaptersStream: (data: ChapterBatchRequest) =>
+    fetch(`${API_BASE_URL}/api/content/generate-chapters-stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(data),
+    }),
+
+  // 向进行中的批次追加章节（事件通过原有的批量连接返回）
+  addBatchChapters: (batchId: string, chapters: ChapterContentRequest[]) =>
+    api.post(`/api/content/batches/${batchId}/chapters`, { chapters }),
+
+  // 取消批次中排队或生成中的章节
+  cancelBatchChapter: (batchId: string, chapterId: string) =>
+    api.delete(`/api/content/batches/${batchId}/chapters/${encodeURIComponent(chapterId)}`),
 };
 
 // 方案扩写相关API